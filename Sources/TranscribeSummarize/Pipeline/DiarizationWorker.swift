@@ -0,0 +1,90 @@
+// ABOUTME: Client for a long-lived `diarize.py --serve` worker on a Unix socket.
+// ABOUTME: Lets Diarizer reuse warm models instead of spawning a new Python process per file.
+
+import Foundation
+
+struct DiarizationWorker {
+    /// Socket path `diarize.py --serve` listens on by default.
+    static let defaultSocketPath: String = FileManager.default.homeDirectoryForCurrentUser
+        .appendingPathComponent(".cache/transcribe-summarize/diarize.sock").path
+
+    /// Seconds a send or a wait for the response may block before giving up on the worker.
+    /// The worker answers once per file, so this bounds a whole diarization.
+    static let defaultTimeout: TimeInterval = 600
+
+    let socketPath: String
+    let timeout: TimeInterval
+
+    init(socketPath: String = DiarizationWorker.defaultSocketPath,
+         timeout: TimeInterval = DiarizationWorker.defaultTimeout) {
+        self.socketPath = socketPath
+        self.timeout = timeout
+    }
+
+    /// Whether a worker socket exists. A stale socket is detected on connect.
+    var isAvailable: Bool {
+        FileManager.default.fileExists(atPath: socketPath)
+    }
+
+    /// Send one JSON request and return the worker's JSON response line.
+    /// Returns nil if no worker is listening, the connection drops or the worker
+    /// does not answer within `timeout`, so callers can fall back to spawning diarize.py.
+    func send(_ request: [String: Any]) -> Data? {
+        guard isAvailable,
+              var payload = try? JSONSerialization.data(withJSONObject: request) else {
+            return nil
+        }
+        payload.append(UInt8(ascii: "\n"))
+
+        let fd = socket(AF_UNIX, SOCK_STREAM, 0)
+        guard fd >= 0 else { return nil }
+        defer { close(fd) }
+
+        // Report a vanished worker as a write error instead of killing the process
+        var noSigPipe: Int32 = 1
+        setsockopt(fd, SOL_SOCKET, SO_NOSIGPIPE, &noSigPipe, socklen_t(MemoryLayout<Int32>.size))
+
+        // A wedged worker fails the blocked write or read instead of hanging the caller
+        let seconds = timeout.rounded(.down)
+        var limit = timeval(tv_sec: Int(seconds), tv_usec: suseconds_t((timeout - seconds) * 1_000_000))
+        setsockopt(fd, SOL_SOCKET, SO_SNDTIMEO, &limit, socklen_t(MemoryLayout<timeval>.size))
+        setsockopt(fd, SOL_SOCKET, SO_RCVTIMEO, &limit, socklen_t(MemoryLayout<timeval>.size))
+
+        var address = sockaddr_un()
+        address.sun_family = sa_family_t(AF_UNIX)
+        let pathBytes = Array(socketPath.utf8CString)
+        guard pathBytes.count <= MemoryLayout.size(ofValue: address.sun_path) else { return nil }
+        withUnsafeMutableBytes(of: &address.sun_path) { buffer in
+            pathBytes.withUnsafeBytes { buffer.copyMemory(from: $0) }
+        }
+
+        let connected = withUnsafePointer(to: &address) {
+            $0.withMemoryRebound(to: sockaddr.self, capacity: 1) {
+                connect(fd, $0, socklen_t(MemoryLayout<sockaddr_un>.size))
+            }
+        }
+        guard connected == 0 else { return nil }
+
+        let sent = payload.withUnsafeBytes { buffer -> Bool in
+            var offset = 0
+            while offset < buffer.count {
+                let count = write(fd, buffer.baseAddress! + offset, buffer.count - offset)
+                if count <= 0 { return false }
+                offset += count
+            }
+            return true
+        }
+        guard sent else { return nil }
+
+        // One request, one newline-terminated response; a timeout leaves it unterminated
+        var response = Data()
+        var chunk = [UInt8](repeating: 0, count: 65536)
+        while response.last != UInt8(ascii: "\n") {
+            let count = read(fd, &chunk, chunk.count)
+            if count <= 0 { break }
+            response.append(contentsOf: chunk[0..<count])
+        }
+
+        return response.last == UInt8(ascii: "\n") ? response : nil
+    }
+}
@@ -28,12 +28,127 @@ struct Diarizer {
         }
     }
 
-    struct DiarizeSegment: Codable {
+    struct DiarizeSegment: Codable, Equatable {
         let start: Double
         let end: Double
         let speaker: String
     }
 
+    /// Wall time, CPU time and peak RSS of one diarize.py pipeline stage.
+    struct StageTiming: Codable, Equatable {
+        let wallSec: Double
+        let cpuSec: Double
+        let peakRssMb: Double
+
+        enum CodingKeys: String, CodingKey {
+            case wallSec = "wall_sec"
+            case cpuSec = "cpu_sec"
+            case peakRssMb = "peak_rss_mb"
+        }
+    }
+
+    /// Worker response to a request with `"timings": true`.
+    struct TimedOutput: Codable {
+        let segments: [DiarizeSegment]
+        let timings: [String: StageTiming]
+    }
+
+    /// Contents of the `--timings-json` sidecar and of the jsonl stats record.
+    struct TimingsReport: Codable, Equatable {
+        let wallSec: Double?
+        let timings: [String: StageTiming]
+
+        enum CodingKeys: String, CodingKey {
+            case wallSec = "wall_sec"
+            case timings
+        }
+    }
+
+    /// Throttled progress of one diarize.py stage (a jsonl progress record).
+    struct ProgressUpdate: Codable, Equatable {
+        let stage: String
+        let done: Int
+        let total: Int
+        let percent: Double?
+        let etaSec: Double?
+        let audioSecPerSec: Double?
+
+        enum CodingKeys: String, CodingKey {
+            case stage, done, total, percent
+            case etaSec = "eta_sec"
+            case audioSecPerSec = "audio_sec_per_sec"
+        }
+    }
+
+    /// One line of `diarize.py --format jsonl` output.
+    enum OutputRecord: Equatable {
+        case segment(DiarizeSegment)
+        case stage(String)
+        case progress(ProgressUpdate)
+        case stats(TimingsReport)
+        case done(segments: Int)
+        case failure(String)
+        case unknown
+    }
+
+    /// Every field any jsonl record may carry; which are set depends on the record.
+    private struct RawRecord: Decodable {
+        let event: String?
+        let error: String?
+        let start: Double?
+        let end: Double?
+        let speaker: String?
+        let stage: String?
+        let segments: Int?
+    }
+
+    /// Applies diarize.py results to transcript segments as they stream in.
+    ///
+    /// With --segments, diarize.py returns one result per transcript segment in
+    /// transcript order, so each result labels its segment on arrival. If any
+    /// result does not line up, `alignedSegments` is nil and the caller falls
+    /// back to matching by time.
+    struct SpeakerAssigner {
+        private(set) var results: [DiarizeSegment] = []
+        private var labelled: [Segment]
+        private var aligned: Bool
+        private var speakerMap: [String: String] = [:]
+        private let speakerNames: [String]
+
+        init(segments: [Segment], speakerNames: [String]) {
+            self.labelled = segments
+            self.aligned = !segments.isEmpty
+            self.speakerNames = speakerNames
+        }
+
+        mutating func add(_ result: DiarizeSegment) {
+            let index = results.count
+            results.append(result)
+            if speakerMap[result.speaker] == nil {
+                speakerMap[result.speaker] = Diarizer.speakerLabel(at: speakerMap.count, names: speakerNames)
+            }
+
+            guard aligned, index < labelled.count,
+                  abs(labelled[index].start - result.start) < 0.001,
+                  abs(labelled[index].end - result.end) < 0.001 else {
+                aligned = false
+                return
+            }
+            labelled[index].speaker = speakerMap[result.speaker]
+        }
+
+        /// Labelled transcript segments if every result lined up with one.
+        var alignedSegments: [Segment]? {
+            aligned && results.count == labelled.count ? labelled : nil
+        }
+    }
+
+    /// diarize.py stages in pipeline order; nested stages follow their parent.
+    static let stageOrder = [
+        "open", "resample", "cache", "vad", "load_model", "extract", "features", "embedding",
+        "cluster", "estimate_speakers", "merge", "diarize"
+    ]
+
     private let verbose: Int
     private let speakerNames: [String]
     private let device: String
@@ -48,18 +163,24 @@ struct Diarizer {
     /// Returns segments with speaker field populated.
     /// Uses pyannote backend if HF_TOKEN is set, otherwise falls back to speechbrain.
     func diarize(wavPath: String, segments: [Segment]) async throws -> [Segment] {
-        let diarizeSegments: [DiarizeSegment]
+        var assigner = SpeakerAssigner(segments: segments, speakerNames: speakerNames)
 
         do {
-            diarizeSegments = try await runDiarization(wavPath: wavPath)
+            try await runDiarization(wavPath: wavPath, segments: segments) { assigner.add($0) }
         } catch {
             fputs("Warning: Diarization failed: \(error.localizedDescription)\n", stderr)
             fputs("Proceeding without speaker labels.\n", stderr)
             return segments
         }
 
-        let speakerMap = buildSpeakerMap(from: diarizeSegments)
+        // diarize.py labels each transcript segment directly when given --segments,
+        // and those labels were applied as the results arrived
+        if let aligned = assigner.alignedSegments {
+            return aligned
+        }
 
+        let diarizeSegments = assigner.results
+        let speakerMap = buildSpeakerMap(from: diarizeSegments)
         return segments.map { segment in
             var updated = segment
             updated.speaker = findSpeaker(
@@ -71,7 +192,97 @@ struct Diarizer {
         }
     }
 
-    private func runDiarization(wavPath: String) async throws -> [DiarizeSegment] {
+    /// Decode one line of `--format jsonl` output.
+    static func parseRecord(_ line: String) throws -> OutputRecord {
+        let data = Data(line.utf8)
+        let raw: RawRecord
+        do {
+            raw = try JSONDecoder().decode(RawRecord.self, from: data)
+        } catch {
+            throw DiarizeError.parseError("\(error.localizedDescription): \(line.prefix(200))")
+        }
+
+        if let error = raw.error {
+            return .failure(error)
+        }
+        switch raw.event {
+        case nil:
+            guard let start = raw.start, let end = raw.end, let speaker = raw.speaker else {
+                return .unknown
+            }
+            return .segment(DiarizeSegment(start: start, end: end, speaker: speaker))
+        case "stage":
+            return .stage(raw.stage ?? "")
+        case "progress":
+            guard let update = try? JSONDecoder().decode(ProgressUpdate.self, from: data) else {
+                return .unknown
+            }
+            return .progress(update)
+        case "stats":
+            guard let report = try? JSONDecoder().decode(TimingsReport.self, from: data) else {
+                return .unknown
+            }
+            return .stats(report)
+        case "done":
+            return .done(segments: raw.segments ?? 0)
+        default:
+            return .unknown
+        }
+    }
+
+    /// Progress line such as "Extracting embeddings: 42% (12.3x realtime, ETA 0:35)".
+    static func formatProgress(_ update: ProgressUpdate) -> String {
+        let label = update.stage == "extract" ? "Extracting embeddings" : update.stage
+        let percent = Int(update.percent ?? Double(100 * update.done / max(1, update.total)))
+        var details: [String] = []
+        if let speed = update.audioSecPerSec, speed > 0 {
+            details.append(String(format: "%.1fx realtime", speed))
+        }
+        if let eta = update.etaSec, update.done < update.total {
+            let seconds = Int(eta.rounded())
+            details.append(String(format: "ETA %d:%02d", seconds / 60, seconds % 60))
+        }
+        return "\(label): \(percent)%" + (details.isEmpty ? "" : " (\(details.joined(separator: ", ")))")
+    }
+
+    /// Transcript segment bounds as sent to diarize.py.
+    static func segmentBounds(_ segments: [Segment]) -> [[String: Double]] {
+        segments.map { ["start": $0.start, "end": $0.end] }
+    }
+
+    /// Run diarize.py (via a running worker if there is one), passing each
+    /// result to onSegment as soon as it is read.
+    private func runDiarization(
+        wavPath: String,
+        segments: [Segment],
+        onSegment: (DiarizeSegment) -> Void
+    ) async throws {
+        let token = ConfigStore.resolveSecret(configKey: "hf_token", envKeys: ["HF_TOKEN", "HUGGINGFACE_TOKEN"])
+        let backend = token != nil ? "pyannote" : "speechbrain"
+
+        print("  Using \(backend) backend on \(device)")
+
+        // Reuse a running `diarize.py --serve` worker so models are already loaded
+        var request: [String: Any] = ["audio_file": wavPath, "backend": backend, "device": device]
+        // Embed only transcribed speech and get one label per transcript segment back
+        let bounds = Self.segmentBounds(segments)
+        if !bounds.isEmpty {
+            request["segments"] = bounds
+        }
+        if let token {
+            request["token"] = token
+        }
+        if verbose > 1 {
+            request["timings"] = true
+        }
+        if let outputData = DiarizationWorker().send(request) {
+            if verbose > 0 {
+                print("  Using running diarization worker at \(DiarizationWorker.defaultSocketPath)")
+            }
+            try parseOutput(outputData, terminationStatus: 0).forEach(onSegment)
+            return
+        }
+
         // Ensure venv exists (creates on first use)
         try ensureVenvExists()
 
@@ -85,14 +296,16 @@ struct Diarizer {
             throw DiarizeError.scriptNotFound
         }
 
-        let token = ConfigStore.resolveSecret(configKey: "hf_token", envKeys: ["HF_TOKEN", "HUGGINGFACE_TOKEN"])
-        let backend = token != nil ? "pyannote" : "speechbrain"
-
-        print("  Using \(backend) backend on \(device)")
-
         let process = Process()
         process.executableURL = URL(fileURLWithPath: pythonExec)
-        process.arguments = [scriptPath, wavPath, "--device", device]
+        process.arguments = [scriptPath, wavPath, "--device", device, "--format", "jsonl"]
+        let segmentsURL = FileManager.default.temporaryDirectory
+            .appendingPathComponent("diarize-segments-\(UUID().uuidString).json")
+        defer { try? FileManager.default.removeItem(at: segmentsURL) }
+        if !bounds.isEmpty {
+            try JSONSerialization.data(withJSONObject: bounds).write(to: segmentsURL)
+            process.arguments?.append(contentsOf: ["--segments", segmentsURL.path])
+        }
 
         // Set environment for PyTorch 2.6+ compatibility
         var env = ProcessInfo.processInfo.environment
@@ -105,17 +318,85 @@ struct Diarizer {
         process.standardError = FileHandle.standardError
 
         try process.run()
+        defer {
+            if process.isRunning {
+                process.terminate()
+            }
+        }
+
+        // Read records as they are written, so results are applied while
+        // diarize.py is still running and its stdout pipe never fills up
+        var finished = false
+        var failure: String?
+        for try await line in stdoutPipe.fileHandleForReading.bytes.lines {
+            switch try Self.parseRecord(line) {
+            case .segment(let segment):
+                onSegment(segment)
+            case .stage(let name):
+                if verbose > 0 {
+                    print("  Diarization stage: \(name)")
+                }
+            case .progress(let update):
+                let lastUpdate = update.done >= update.total
+                print("\r  \(Self.formatProgress(update))\u{1B}[K", terminator: lastUpdate ? "\n" : "")
+                fflush(stdout)
+            case .stats(let report):
+                reportTimings(report.timings)
+            case .done:
+                finished = true
+            case .failure(let message):
+                failure = message
+            case .unknown:
+                continue
+            }
+        }
         process.waitUntilExit()
 
-        let outputData = stdoutPipe.fileHandleForReading.readDataToEndOfFile()
+        if let failure {
+            throw DiarizeError.diarizationFailed(failure)
+        }
+        guard process.terminationStatus == 0 else {
+            throw DiarizeError.diarizationFailed("Process exited with status \(process.terminationStatus)")
+        }
+        guard finished else {
+            throw DiarizeError.parseError("Output ended before the done record")
+        }
+    }
+
+    /// Table of stage timings, one line per stage in pipeline order.
+    static func formatTimings(_ timings: [String: StageTiming]) -> [String] {
+        let known = stageOrder.filter { timings[$0] != nil }
+        let others = timings.keys.filter { !stageOrder.contains($0) }.sorted()
+        return (known + others).map { name in
+            let timing = timings[name]!
+            return "    " + name.padding(toLength: 18, withPad: " ", startingAt: 0)
+                + String(format: "%8.2fs wall %8.2fs CPU %8.1f MB peak",
+                         timing.wallSec, timing.cpuSec, timing.peakRssMb)
+        }
+    }
+
+    private func reportTimings(_ timings: [String: StageTiming]) {
+        guard verbose > 1, !timings.isEmpty else { return }
+        print("  Diarization stage timings:")
+        for line in Self.formatTimings(timings) {
+            print(line)
+        }
+    }
 
+    /// Decode diarize.py output (a segment array, a timed envelope or an error object).
+    private func parseOutput(_ outputData: Data, terminationStatus: Int32) throws -> [DiarizeSegment] {
         if let errorResponse = try? JSONDecoder().decode([String: String].self, from: outputData),
            let error = errorResponse["error"] {
             throw DiarizeError.diarizationFailed(error)
         }
 
-        guard process.terminationStatus == 0 else {
-            throw DiarizeError.diarizationFailed("Process exited with status \(process.terminationStatus)")
+        guard terminationStatus == 0 else {
+            throw DiarizeError.diarizationFailed("Process exited with status \(terminationStatus)")
+        }
+
+        if let timed = try? JSONDecoder().decode(TimedOutput.self, from: outputData) {
+            reportTimings(timed.timings)
+            return timed.segments
         }
 
         return try JSONDecoder().decode([DiarizeSegment].self, from: outputData)
@@ -244,16 +525,17 @@ struct Diarizer {
 
         var map: [String: String] = [:]
         for (index, speaker) in orderedSpeakers.enumerated() {
-            if index < speakerNames.count {
-                map[speaker] = speakerNames[index]
-            } else {
-                map[speaker] = "Speaker \(index + 1)"
-            }
+            map[speaker] = Self.speakerLabel(at: index, names: speakerNames)
         }
 
         return map
     }
 
+    /// Display name of the index-th speaker in order of first appearance.
+    static func speakerLabel(at index: Int, names: [String]) -> String {
+        index < names.count ? names[index] : "Speaker \(index + 1)"
+    }
+
     private func findSpeaker(for segment: Segment, in diarizeSegments: [DiarizeSegment], speakerMap: [String: String]) -> String {
         let midpoint = (segment.start + segment.end) / 2
 
@@ -0,0 +1,89 @@
+// ABOUTME: Tests for the diarize.py --serve worker client.
+// ABOUTME: Verifies the default socket path and fallback when no worker is running or answering.
+
+import XCTest
+@testable import TranscribeSummarize
+
+final class DiarizationWorkerTests: XCTestCase {
+
+    // MARK: - RT-037: Default socket path matches diarize.py
+
+    /// RT-037: Client looks for the worker where `diarize.py --serve` listens by default
+    func testDefaultSocketPathMatchesScript_RT037() {
+        // Arrange
+        let home = FileManager.default.homeDirectoryForCurrentUser.path
+        let expected = "\(home)/.cache/transcribe-summarize/diarize.sock"
+
+        // Assert
+        XCTAssertEqual(DiarizationWorker.defaultSocketPath, expected)
+        XCTAssertEqual(DiarizationWorker().socketPath, expected)
+    }
+
+    // MARK: - RT-038: No worker means fall back to spawning diarize.py
+
+    /// RT-038: send returns nil when no socket exists so Diarizer spawns a process
+    func testSendReturnsNilWithoutWorker_RT038() {
+        // Arrange
+        let missing = NSTemporaryDirectory() + "no-such-worker-\(UUID().uuidString).sock"
+        let worker = DiarizationWorker(socketPath: missing)
+
+        // Act
+        let response = worker.send(["command": "ping"])
+
+        // Assert
+        XCTAssertFalse(worker.isAvailable)
+        XCTAssertNil(response)
+    }
+
+    /// RT-038 supplement: a stale socket file with no listener also falls back
+    func testSendReturnsNilForStaleSocket_RT038() throws {
+        // Arrange
+        let stale = NSTemporaryDirectory() + "stale-worker-\(UUID().uuidString).sock"
+        FileManager.default.createFile(atPath: stale, contents: Data())
+        defer { try? FileManager.default.removeItem(atPath: stale) }
+        let worker = DiarizationWorker(socketPath: stale)
+
+        // Act
+        let response = worker.send(["command": "ping"])
+
+        // Assert
+        XCTAssertTrue(worker.isAvailable)
+        XCTAssertNil(response)
+    }
+
+    // MARK: - RT-043: An unresponsive worker times out
+
+    /// RT-043: send returns nil when the worker accepts but never answers
+    func testSendReturnsNilWhenWorkerTimesOut_RT043() throws {
+        // Arrange: a listening socket nobody reads from
+        let path = NSTemporaryDirectory() + "silent-worker-\(UUID().uuidString).sock"
+        let listener = socket(AF_UNIX, SOCK_STREAM, 0)
+        XCTAssertGreaterThanOrEqual(listener, 0)
+        defer {
+            close(listener)
+            try? FileManager.default.removeItem(atPath: path)
+        }
+        var address = sockaddr_un()
+        address.sun_family = sa_family_t(AF_UNIX)
+        let pathBytes = Array(path.utf8CString)
+        withUnsafeMutableBytes(of: &address.sun_path) { buffer in
+            pathBytes.withUnsafeBytes { buffer.copyMemory(from: $0) }
+        }
+        let bound = withUnsafePointer(to: &address) {
+            $0.withMemoryRebound(to: sockaddr.self, capacity: 1) {
+                bind(listener, $0, socklen_t(MemoryLayout<sockaddr_un>.size))
+            }
+        }
+        XCTAssertEqual(bound, 0)
+        XCTAssertEqual(listen(listener, 1), 0)
+        let worker = DiarizationWorker(socketPath: path, timeout: 0.5)
+
+        // Act
+        let start = Date()
+        let response = worker.send(["command": "ping"])
+
+        // Assert
+        XCTAssertNil(response)
+        XCTAssertLessThan(Date().timeIntervalSince(start), 5)
+    }
+}
@@ -0,0 +1,61 @@
+// ABOUTME: Tests for mapping diarize.py --segments output onto transcript segments.
+// ABOUTME: Verifies one-label-per-segment results are used and anything else falls back.
+
+import XCTest
+@testable import TranscribeSummarize
+
+final class DiarizerAlignmentTests: XCTestCase {
+
+    private func segment(_ start: Double, _ end: Double) -> Segment {
+        Segment(start: start, end: end, text: "Hello", speaker: nil, confidence: 0.9)
+    }
+
+    private func assign(_ output: [Diarizer.DiarizeSegment], to segments: [Segment]) -> [Segment]? {
+        var assigner = Diarizer.SpeakerAssigner(segments: segments, speakerNames: [])
+        output.forEach { assigner.add($0) }
+        return assigner.alignedSegments
+    }
+
+    // MARK: - RT-039: Transcript-aligned diarization output
+
+    /// RT-039: One result per transcript segment maps speakers by index
+    func testAlignedOutputMapsByIndex_RT039() {
+        // Arrange
+        let segments = [segment(0.0, 2.5), segment(2.5, 3.12), segment(3.5, 9.0)]
+        let output = [
+            Diarizer.DiarizeSegment(start: 0.0, end: 2.5, speaker: "SPEAKER_01"),
+            Diarizer.DiarizeSegment(start: 2.5, end: 3.12, speaker: "SPEAKER_00"),
+            Diarizer.DiarizeSegment(start: 3.5, end: 9.0, speaker: "SPEAKER_01")
+        ]
+
+        // Act
+        let labelled = assign(output, to: segments)
+
+        // Assert
+        XCTAssertEqual(labelled?.map(\.speaker), ["Speaker 1", "Speaker 2", "Speaker 1"])
+        XCTAssertEqual(labelled?.map(\.start), [0.0, 2.5, 3.5])
+    }
+
+    /// RT-039 supplement: speaker turns from an older script fall back to midpoint lookup
+    func testTurnOutputIsNotAligned_RT039() {
+        // Arrange
+        let segments = [segment(0.0, 2.5), segment(2.5, 4.0)]
+        let turns = [
+            Diarizer.DiarizeSegment(start: 0.0, end: 3.0, speaker: "SPEAKER_00"),
+            Diarizer.DiarizeSegment(start: 2.25, end: 4.5, speaker: "SPEAKER_01")
+        ]
+
+        // Act / Assert
+        XCTAssertNil(assign(turns, to: segments))
+        XCTAssertNil(assign(Array(turns.prefix(1)), to: segments))
+    }
+
+    /// RT-039 supplement: segment bounds are sent as start/end objects
+    func testSegmentBoundsPayload_RT039() {
+        // Act
+        let bounds = Diarizer.segmentBounds([segment(1.0, 2.5)])
+
+        // Assert
+        XCTAssertEqual(bounds, [["start": 1.0, "end": 2.5]])
+    }
+}
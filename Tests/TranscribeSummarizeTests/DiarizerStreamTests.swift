@@ -0,0 +1,113 @@
+// ABOUTME: Tests for parsing diarize.py --format jsonl output as it streams in.
+// ABOUTME: Verifies record decoding, progress formatting and per-result speaker assignment.
+
+import XCTest
+@testable import TranscribeSummarize
+
+final class DiarizerStreamTests: XCTestCase {
+
+    private func segment(_ start: Double, _ end: Double) -> Segment {
+        Segment(start: start, end: end, text: "Hello", speaker: nil, confidence: 0.9)
+    }
+
+    // MARK: - RT-041: JSON-lines diarization output
+
+    /// RT-041: Each jsonl record type decodes to its OutputRecord case
+    func testParsesEachRecordType_RT041() throws {
+        // Arrange
+        let lines = [
+            #"{"event": "progress", "stage": "extract", "done": 32, "total": 96, "percent": 33.3, "elapsed_sec": 4.0, "eta_sec": 8.0, "audio_sec": 49.5, "audio_sec_per_sec": 12.4}"#,
+            #"{"start": 0.0, "end": 1.5, "speaker": "SPEAKER_00"}"#,
+            #"{"event": "stats", "wall_sec": 2.5, "timings": {"merge": {"wall_sec": 0.01, "cpu_sec": 0.01, "peak_rss_mb": 90.0}}}"#,
+            #"{"event": "done", "segments": 1}"#,
+            #"{"error": "File not found: a.wav"}"#,
+            #"{"event": "merge", "speaker": "SPEAKER_02", "into": "SPEAKER_00"}"#,
+            #"{"event": "stage", "stage": "cluster", "elapsed_sec": 12.1}"#
+        ]
+
+        // Act
+        let records = try lines.map { try Diarizer.parseRecord($0) }
+
+        // Assert
+        XCTAssertEqual(records[0], .progress(Diarizer.ProgressUpdate(
+            stage: "extract", done: 32, total: 96, percent: 33.3, etaSec: 8.0, audioSecPerSec: 12.4
+        )))
+        XCTAssertEqual(records[1], .segment(Diarizer.DiarizeSegment(start: 0.0, end: 1.5, speaker: "SPEAKER_00")))
+        guard case .stats(let report) = records[2] else {
+            return XCTFail("Expected a stats record, got \(records[2])")
+        }
+        XCTAssertEqual(report.wallSec, 2.5)
+        XCTAssertEqual(report.timings["merge"]?.peakRssMb, 90.0)
+        XCTAssertEqual(records[3], .done(segments: 1))
+        XCTAssertEqual(records[4], .failure("File not found: a.wav"))
+        XCTAssertEqual(records[5], .unknown)
+        XCTAssertEqual(records[6], .stage("cluster"))
+    }
+
+    /// RT-041 supplement: A line that is not JSON is a parse error
+    func testRejectsMalformedLine_RT041() {
+        XCTAssertThrowsError(try Diarizer.parseRecord("Loading speechbrain model..."))
+    }
+
+    /// RT-041 supplement: Aligned results label segments as they arrive
+    func testAssignerLabelsSegmentsOnArrival_RT041() {
+        // Arrange
+        var assigner = Diarizer.SpeakerAssigner(
+            segments: [segment(0.0, 2.5), segment(2.5, 4.0)],
+            speakerNames: ["Alice"]
+        )
+
+        // Act
+        assigner.add(Diarizer.DiarizeSegment(start: 0.0, end: 2.5, speaker: "SPEAKER_01"))
+        let partial = assigner.alignedSegments
+        assigner.add(Diarizer.DiarizeSegment(start: 2.5, end: 4.0, speaker: "SPEAKER_00"))
+
+        // Assert
+        XCTAssertNil(partial)
+        XCTAssertEqual(assigner.alignedSegments?.map(\.speaker), ["Alice", "Speaker 2"])
+    }
+
+    /// RT-041 supplement: Misaligned results leave matching to the time-based fallback
+    func testAssignerDetectsMisalignedResults_RT041() {
+        // Arrange
+        var assigner = Diarizer.SpeakerAssigner(segments: [segment(0.0, 2.5)], speakerNames: [])
+
+        // Act
+        assigner.add(Diarizer.DiarizeSegment(start: 0.0, end: 3.0, speaker: "SPEAKER_00"))
+
+        // Assert
+        XCTAssertNil(assigner.alignedSegments)
+        XCTAssertEqual(assigner.results.count, 1)
+    }
+
+    // MARK: - RT-042: Progress speed and ETA
+
+    /// RT-042: A progress line shows percentage, realtime factor and ETA
+    func testFormatsProgressWithSpeedAndEta_RT042() {
+        // Arrange
+        let update = Diarizer.ProgressUpdate(
+            stage: "extract", done: 42, total: 100, percent: 42.0, etaSec: 95.4, audioSecPerSec: 12.34
+        )
+
+        // Act
+        let line = Diarizer.formatProgress(update)
+
+        // Assert
+        XCTAssertEqual(line, "Extracting embeddings: 42% (12.3x realtime, ETA 1:35)")
+    }
+
+    /// RT-042 supplement: The final update drops the ETA, and missing fields are left out
+    func testFormatsFinishedAndBareProgress_RT042() {
+        // Arrange
+        let finished = Diarizer.ProgressUpdate(
+            stage: "extract", done: 100, total: 100, percent: 100.0, etaSec: 0.0, audioSecPerSec: 20.0
+        )
+        let bare = Diarizer.ProgressUpdate(
+            stage: "extract", done: 1, total: 4, percent: nil, etaSec: nil, audioSecPerSec: nil
+        )
+
+        // Act / Assert
+        XCTAssertEqual(Diarizer.formatProgress(finished), "Extracting embeddings: 100% (20.0x realtime)")
+        XCTAssertEqual(Diarizer.formatProgress(bare), "Extracting embeddings: 25%")
+    }
+}
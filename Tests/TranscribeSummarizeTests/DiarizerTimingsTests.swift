@@ -0,0 +1,57 @@
+// ABOUTME: Tests for decoding and formatting diarize.py per-stage timings.
+// ABOUTME: Verifies the sidecar/envelope JSON shape and the -vv table order.
+
+import XCTest
+@testable import TranscribeSummarize
+
+final class DiarizerTimingsTests: XCTestCase {
+
+    // MARK: - RT-040: Stage timings from diarize.py
+
+    /// RT-040: The --timings-json sidecar decodes with snake_case keys
+    func testDecodesTimingsSidecar_RT040() throws {
+        // Arrange
+        let json = """
+        {"audio_file": "/tmp/a.wav", "wall_sec": 3.5,
+         "timings": {"open": {"wall_sec": 0.01, "cpu_sec": 0.005, "peak_rss_mb": 210.5}}}
+        """
+
+        // Act
+        let report = try JSONDecoder().decode(Diarizer.TimingsReport.self, from: Data(json.utf8))
+
+        // Assert
+        XCTAssertEqual(report.wallSec, 3.5)
+        XCTAssertEqual(report.timings["open"], Diarizer.StageTiming(wallSec: 0.01, cpuSec: 0.005, peakRssMb: 210.5))
+    }
+
+    /// RT-040 supplement: A worker envelope carries segments and timings together
+    func testDecodesTimedWorkerResponse_RT040() throws {
+        // Arrange
+        let json = """
+        {"segments": [{"start": 0.0, "end": 1.5, "speaker": "SPEAKER_00"}],
+         "timings": {"cluster": {"wall_sec": 0.2, "cpu_sec": 0.2, "peak_rss_mb": 300.0}}}
+        """
+
+        // Act
+        let output = try JSONDecoder().decode(Diarizer.TimedOutput.self, from: Data(json.utf8))
+
+        // Assert
+        XCTAssertEqual(output.segments.count, 1)
+        XCTAssertEqual(output.timings["cluster"]?.wallSec, 0.2)
+    }
+
+    /// RT-040 supplement: Stages are listed in pipeline order, unknown stages last
+    func testFormatsStagesInPipelineOrder_RT040() {
+        // Arrange
+        let timing = Diarizer.StageTiming(wallSec: 1.0, cpuSec: 0.5, peakRssMb: 100.0)
+        let timings = ["merge": timing, "custom": timing, "open": timing, "embedding": timing]
+
+        // Act
+        let lines = Diarizer.formatTimings(timings)
+
+        // Assert
+        let names = lines.map { $0.trimmingCharacters(in: .whitespaces).components(separatedBy: " ")[0] }
+        XCTAssertEqual(names, ["open", "embedding", "merge", "custom"])
+        XCTAssertTrue(lines[0].contains("1.00s wall"))
+    }
+}
@@ -0,0 +1,1252 @@
+#!/usr/bin/env python3
+# ABOUTME: Micro-benchmarks for the diarize.py speechbrain pipeline.
+# ABOUTME: Measures embedding throughput on CPU with synthetic audio and random weights.
+
+"""
+Benchmarks for speaker diarization internals.
+
+Usage: python3 bench_diarize.py embed [--duration SECONDS] [--batch-sizes 1,8,32]
+       python3 bench_diarize.py windows [--duration SECONDS]
+       python3 bench_diarize.py features [--duration SECONDS] [--batch-size N]
+       python3 bench_diarize.py startup [--repeat N]
+       python3 bench_diarize.py cluster [--sizes 1000,4000,14400] [--speakers N]
+       python3 bench_diarize.py speakers [--sizes 1000,5000,20000,50000]
+       python3 bench_diarize.py affinity [--sizes 2000,4000]
+       python3 bench_diarize.py merge [--windows 100000] [--repeat 5]
+       python3 bench_diarize.py workers [--duration SECONDS] [--workers 1,2,4,8,16]
+       python3 bench_diarize.py precision [--duration SECONDS] [--precisions fp32,bf16,int8]
+       python3 bench_diarize.py compile [--batch-size N] [--batches N]
+       python3 bench_diarize.py load [--repeat N] [--pretrained] [--pyannote]
+       python3 bench_diarize.py suite [--durations 300,3600,14400] [--speakers N]
+                                      [--configs speechbrain:auto,...] [--voices DIR]
+                                      [--output PATH] [--compare BASELINE.json]
+
+Benchmarks:
+  embed       - Windows/sec of ECAPA embedding extraction for each batch size.
+                Batch size 1 reproduces the original one-window-per-pass loop.
+  windows     - Peak RSS of the strided windowing stage over a long waveform
+                (default 3 hours), compared with the size of the waveform.
+  features    - Feature-extraction time alone for per-window Fbank versus the
+                cached per-batch-span path, plus embedding agreement between them.
+  startup     - Cold-start latency of the diarize.py CLI for --help, a missing
+                file and a bare import, from `python -X importtime`.
+  cluster     - Wall time, peak RSS and accuracy (adjusted Rand index) of the
+                dense and two-stage clustering engines on synthetic embeddings.
+                Each run is isolated in a child process so peak RSS is per run.
+  speakers    - Speaker-count estimation time with the top-k eigenvalue path
+                versus the original full n x n eigen-decomposition, and
+                whether the estimated count changes.
+  affinity    - Dense clustering with sklearn's internal cosine affinity versus
+                one shared precomputed affinity in float64 and float32.
+  merge       - Time to merge and serialise window labels into segments with
+                the vectorised merge_segments versus the original loop, and
+                whether the JSON output is byte-identical; also the time with
+                --resegment frame-level voting in front of the merge.
+  workers     - Embedding throughput of --workers process sharding for each
+                worker count, with CPU count / workers torch threads each,
+                over a memory-mapped 16kHz WAV.
+  precision   - Embedding throughput of each --precision on a synthetic
+                conversation, with the accuracy check against fp32: cosine
+                similarity of the embeddings, adjusted Rand index of the
+                cluster labels, speaker count and DER against ground truth.
+  compile     - Steady-state embedding throughput of the --compile AOTInductor
+                package versus eager ECAPA for one batch shape, the one-off
+                compile time, the load time once the package is cached, and
+                how many windows (and minutes of audio) each takes to repay.
+  load        - ECAPA model load time from the pickled checkpoint (torch.load
+                plus load_state_dict) versus the ModelRegistry mmap layout,
+                each with a cold page cache (pages dropped with posix_fadvise,
+                Linux only) and a warm one, plus the first embedding batch,
+                which pays for the pages a lazy load skipped. --pyannote also
+                times Pipeline.from_pretrained cold and warm (needs HF_TOKEN).
+  suite       - End-to-end diarize_file runs on synthetic conversations with a
+                known speaker turn list, for each duration and backend:clustering
+                configuration. Records throughput (audio seconds per wall
+                second), peak RSS and diarization error rate (DER) against the
+                ground truth, and writes the results with machine metadata to
+                --output so runs can be compared; --compare adds the change
+                against an earlier results file.
+
+Conversations are built from one voice per speaker: a harmonic source with a
+speaker-specific pitch and formants, or a 16kHz mono WAV per speaker from
+--voices. Turn lengths, speaker order and pauses come from --seed, so the same
+arguments always produce the same audio and ground truth.
+
+Model weights are randomly initialised: throughput does not depend on the
+checkpoint, so no download or HuggingFace access is needed. DER is only
+meaningful with real weights (suite --pretrained) or the pyannote backend.
+"""
+
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+DIARIZE_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "diarize.py")
+
+SAMPLE_RATE = 16000
+WINDOW_SAMPLES = int(1.5 * SAMPLE_RATE)
+HOP_SAMPLES = int(0.75 * SAMPLE_RATE)
+
+
+def peak_rss_mb():
+    """Peak resident set size of this process in MB."""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS reports bytes
+    divisor = 1024 * 1024 if sys.platform == "darwin" else 1024
+    return peak / divisor
+
+
+def build_model():
+    """Build the production ECAPA-TDNN and Fbank front end with random weights."""
+    from speechbrain.lobes.models.ECAPA_TDNN import ECAPA_TDNN
+    from speechbrain.lobes.features import Fbank
+
+    model = ECAPA_TDNN(
+        input_size=80,
+        channels=[1024, 1024, 1024, 1024, 3072],
+        kernel_sizes=[5, 3, 3, 3, 1],
+        dilations=[1, 2, 3, 4, 1],
+        attention_channels=128,
+        lin_neurons=192
+    )
+    model.eval()
+    return model, Fbank(n_mels=80)
+
+
+def extract_embeddings(model, compute_features, waveform, device, batch_size=32, feature_cache=True):
+    """Embed every sliding window of an in-memory 16kHz waveform, as diarize.py does."""
+    from diarize import count_windows, embed_window_spans, iter_window_spans
+
+    spans = iter_window_spans([waveform], WINDOW_SAMPLES, HOP_SAMPLES, batch_size)
+    total_windows = count_windows(waveform.shape[0], WINDOW_SAMPLES, HOP_SAMPLES)
+    return embed_window_spans(
+        model, compute_features, spans, device, WINDOW_SAMPLES, HOP_SAMPLES,
+        SAMPLE_RATE, total_windows, feature_cache=feature_cache
+    )
+
+
+def synthetic_waveform(duration):
+    """Return a deterministic 1-D noise waveform of the given length in seconds."""
+    import torch
+
+    generator = torch.Generator().manual_seed(0)
+    return torch.randn(int(duration * SAMPLE_RATE), generator=generator).mul_(0.1)
+
+
+def run_isolated(func, *args):
+    """Run func(*args) in a forked child; return (result, peak_rss_mb, seconds)."""
+    import multiprocessing
+
+    def child(queue):
+        start = time.perf_counter()
+        result = func(*args)
+        queue.put((result, peak_rss_mb(), time.perf_counter() - start))
+
+    context = multiprocessing.get_context("fork")
+    queue = context.Queue()
+    process = context.Process(target=child, args=(queue,))
+    process.start()
+    outcome = queue.get()
+    process.join()
+    return outcome
+
+
+def synthetic_embeddings(n, speakers, dim=192, spread=0.6, seed=0):
+    """Gaussian clusters around random unit directions, with uneven speaker shares.
+
+    Returns:
+        (embeddings, labels): [n, dim] float32 array and ground-truth speaker ids
+    """
+    import numpy as np
+
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((speakers, dim))
+    centers /= np.linalg.norm(centers, axis=1, keepdims=True)
+    shares = rng.dirichlet(np.full(speakers, 2.0))
+    labels = rng.choice(speakers, size=n, p=shares)
+    noise = rng.standard_normal((n, dim)) * spread / np.sqrt(dim)
+    return (centers[labels] + noise).astype(np.float32), labels
+
+
+def bench_embed(args):
+    """Compare embedding throughput across batch sizes."""
+    import torch
+
+    device = torch.device("cpu")
+    model, compute_features = build_model()
+    waveform = synthetic_waveform(args.duration)
+
+    # Warm up allocator and kernels so the first configuration is not penalised
+    extract_embeddings(model, compute_features, waveform[:WINDOW_SAMPLES * 4], device, batch_size=4)
+
+    results = []
+    for batch_size in args.batch_sizes:
+        start = time.perf_counter()
+        embeddings, _ = extract_embeddings(model, compute_features, waveform, device, batch_size=batch_size)
+        elapsed = time.perf_counter() - start
+        results.append({
+            "batch_size": batch_size,
+            "windows": len(embeddings),
+            "seconds": round(elapsed, 3),
+            "windows_per_sec": round(len(embeddings) / elapsed, 1),
+        })
+
+    baseline = results[0]["windows_per_sec"]
+    for result in results:
+        result["speedup"] = round(result["windows_per_sec"] / baseline, 2)
+    return results
+
+
+def bench_windows(args):
+    """Measure peak RSS while walking every window batch of a long waveform."""
+    import torch
+    from diarize import frame_windows
+
+    baseline_mb = peak_rss_mb()
+    waveform = synthetic_waveform(args.duration)
+    waveform_mb = waveform.numel() * waveform.element_size() / (1024 * 1024)
+
+    start = time.perf_counter()
+    windows = frame_windows(waveform, WINDOW_SAMPLES, HOP_SAMPLES)
+    energy = torch.zeros(())
+    for batch_start in range(0, windows.shape[0], args.batch_size):
+        # Touch every sample of the batch the way the feature extractor would
+        energy += windows[batch_start:batch_start + args.batch_size].square().sum()
+    elapsed = time.perf_counter() - start
+
+    return {
+        "duration_sec": args.duration,
+        "windows": windows.shape[0],
+        "shares_storage": windows.data_ptr() == waveform.data_ptr(),
+        "waveform_mb": round(waveform_mb, 1),
+        "baseline_rss_mb": round(baseline_mb, 1),
+        "peak_rss_mb": round(peak_rss_mb(), 1),
+        "peak_over_baseline_mb": round(peak_rss_mb() - baseline_mb, 1),
+        "seconds": round(elapsed, 3),
+    }
+
+
+def bench_features(args):
+    """Time Fbank extraction per window versus cached, and compare embeddings."""
+    import numpy as np
+    import torch
+    from diarize import cached_window_features, frame_windows
+
+    device = torch.device("cpu")
+    model, compute_features = build_model()
+    waveform = synthetic_waveform(args.duration)
+    windows = frame_windows(waveform, WINDOW_SAMPLES, HOP_SAMPLES)
+    total = windows.shape[0]
+
+    def time_features(cached):
+        start = time.perf_counter()
+        with torch.no_grad():
+            for batch_start in range(0, total, args.batch_size):
+                count = min(args.batch_size, total - batch_start)
+                if cached:
+                    cached_window_features(compute_features, waveform, batch_start, count,
+                                           WINDOW_SAMPLES, HOP_SAMPLES, device)
+                else:
+                    compute_features(windows[batch_start:batch_start + count])
+        return time.perf_counter() - start
+
+    per_window_sec = time_features(cached=False)
+    cached_sec = time_features(cached=True)
+
+    # Embedding agreement on a shorter prefix keeps the benchmark quick
+    prefix = waveform[:int(min(args.duration, 120.0) * SAMPLE_RATE)]
+    reference, _ = extract_embeddings(model, compute_features, prefix, device, args.batch_size,
+                                      feature_cache=False)
+    cached, _ = extract_embeddings(model, compute_features, prefix, device, args.batch_size,
+                                   feature_cache=True)
+    cosine = (reference * cached).sum(axis=1) / (
+        np.linalg.norm(reference, axis=1) * np.linalg.norm(cached, axis=1)
+    )
+
+    return {
+        "duration_sec": args.duration,
+        "windows": total,
+        "per_window_feature_sec": round(per_window_sec, 3),
+        "cached_feature_sec": round(cached_sec, 3),
+        "feature_speedup": round(per_window_sec / cached_sec, 2),
+        "min_embedding_cosine": round(float(cosine.min()), 6),
+    }
+
+
+def parse_importtime(stderr):
+    """Parse `python -X importtime` output into (module, cumulative_us) for top-level imports."""
+    modules = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "imported package" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|", 2)
+        # Nested imports are indented below the module that triggered them
+        if not name.startswith("  "):
+            modules.append((name.strip(), int(cumulative)))
+    return modules
+
+
+def bench_startup(args):
+    """Measure CLI cold-start wall time and import cost for cheap code paths."""
+    cases = {
+        "help": [DIARIZE_SCRIPT, "--help"],
+        "missing_file": [DIARIZE_SCRIPT, "/nonexistent/audio.wav"],
+        "import": ["-c", "import diarize"],
+    }
+    env = dict(os.environ, PYTHONPATH=os.path.dirname(DIARIZE_SCRIPT))
+
+    results = {}
+    for case, argv in cases.items():
+        best = None
+        for _ in range(args.repeat):
+            start = time.perf_counter()
+            proc = subprocess.run([sys.executable, "-X", "importtime", *argv],
+                                  capture_output=True, text=True, env=env)
+            wall = time.perf_counter() - start
+            if best is None or wall < best[0]:
+                best = (wall, parse_importtime(proc.stderr))
+
+        wall, modules = best
+        heaviest = sorted(modules, key=lambda m: m[1], reverse=True)[:args.top]
+        names = {name.split(".")[0] for name, _ in modules}
+        results[case] = {
+            "wall_ms": round(wall * 1000, 1),
+            "import_ms": round(sum(us for _, us in modules) / 1000, 1),
+            "imports_torch": "torch" in names,
+            "heaviest": [{"module": name, "ms": round(us / 1000, 1)} for name, us in heaviest],
+        }
+    return results
+
+
+def bench_cluster(args):
+    """Compare dense and two-stage clustering across window counts."""
+    from sklearn.metrics import adjusted_rand_score
+    from diarize import cluster_embeddings
+
+    def run(method, n):
+        embeddings, truth = synthetic_embeddings(n, args.speakers)
+        labels = cluster_embeddings(embeddings, method=method)
+        return len(set(labels)), adjusted_rand_score(truth, labels)
+
+    results = []
+    for n in args.sizes:
+        for method in ("dense", "two-stage"):
+            if method == "dense" and n > args.dense_max:
+                continue
+            (speakers, ari), rss_mb, seconds = run_isolated(run, method, n)
+            results.append({
+                "method": method,
+                "windows": n,
+                "seconds": round(seconds, 3),
+                "peak_rss_mb": round(rss_mb, 1),
+                "speakers_found": speakers,
+                "adjusted_rand": round(ari, 4),
+            })
+    return results
+
+
+def estimate_full_spectrum(embeddings, max_speakers=8):
+    """The original estimate_num_speakers: full eigvalsh on the n x n similarity."""
+    import numpy as np
+    from sklearn.metrics.pairwise import cosine_similarity
+
+    similarity = cosine_similarity(embeddings)
+    eigenvalues = np.sort(np.linalg.eigvalsh(similarity))[::-1]
+    max_speakers = min(max_speakers, len(eigenvalues) - 1)
+    gaps = []
+    for i in range(1, max_speakers):
+        if eigenvalues[i] > 0:
+            gaps.append(eigenvalues[i - 1] / eigenvalues[i])
+        else:
+            gaps.append(float('inf'))
+    if not gaps:
+        return 2
+    return max(2, min(int(np.argmax(gaps)) + 1, max_speakers))
+
+
+def bench_speakers(args):
+    """Compare top-k and full-spectrum speaker-count estimation."""
+    from diarize import estimate_num_speakers
+
+    results = []
+    for n in args.sizes:
+        for speakers in args.speakers:
+            embeddings, _ = synthetic_embeddings(n, speakers, seed=n + speakers)
+
+            start = time.perf_counter()
+            estimate = estimate_num_speakers(embeddings)
+            fast_sec = time.perf_counter() - start
+
+            result = {
+                "windows": n,
+                "true_speakers": speakers,
+                "top_k_sec": round(fast_sec, 4),
+                "top_k_estimate": estimate,
+            }
+            if n <= args.full_max:
+                start = time.perf_counter()
+                reference = estimate_full_spectrum(embeddings)
+                full_sec = time.perf_counter() - start
+                result.update({
+                    "full_sec": round(full_sec, 3),
+                    "full_estimate": reference,
+                    "speedup": round(full_sec / fast_sec, 1),
+                    "estimate_unchanged": reference == estimate,
+                })
+            results.append(result)
+    return results
+
+
+def bench_affinity(args):
+    """Compare internal-affinity spectral clustering with the shared affinity path."""
+    from sklearn.cluster import SpectralClustering
+    from sklearn.metrics import adjusted_rand_score
+    from diarize import cluster_dense
+
+    def run(variant, n):
+        embeddings, truth = synthetic_embeddings(n, args.speakers)
+        if variant == "sklearn-cosine":
+            labels = SpectralClustering(
+                n_clusters=args.speakers, affinity='cosine', random_state=42
+            ).fit_predict(embeddings)
+        else:
+            labels = cluster_dense(embeddings, args.speakers, affinity_dtype=variant)
+        return adjusted_rand_score(truth, labels)
+
+    results = []
+    for n in args.sizes:
+        for variant in ("sklearn-cosine", "float64", "float32"):
+            ari, rss_mb, seconds = run_isolated(run, variant, n)
+            results.append({
+                "variant": variant,
+                "windows": n,
+                "seconds": round(seconds, 3),
+                "peak_rss_mb": round(rss_mb, 1),
+                "adjusted_rand": round(ari, 4),
+            })
+    return results
+
+
+def merge_segments_loop(timestamps, labels):
+    """The original merge_segments: a Python loop over every window."""
+    if not timestamps:
+        return []
+
+    segments = []
+    current_speaker = labels[0]
+    current_start = timestamps[0][0]
+    current_end = timestamps[0][1]
+
+    for i in range(1, len(timestamps)):
+        if labels[i] == current_speaker:
+            current_end = timestamps[i][1]
+        else:
+            segments.append({
+                "start": round(current_start, 3),
+                "end": round(current_end, 3),
+                "speaker": f"SPEAKER_{current_speaker:02d}"
+            })
+            current_speaker = labels[i]
+            current_start = timestamps[i][0]
+            current_end = timestamps[i][1]
+
+    segments.append({
+        "start": round(current_start, 3),
+        "end": round(current_end, 3),
+        "speaker": f"SPEAKER_{current_speaker:02d}"
+    })
+    return segments
+
+
+def bench_merge(args):
+    """Compare the vectorised merge_segments with the original loop."""
+    import numpy as np
+    from diarize import merge_segments, resegment_frames
+
+    rng = np.random.default_rng(0)
+    # Speaker turns of 1-20 windows, like real conversation at a 0.75s hop
+    turns = rng.integers(1, 21, size=args.windows)
+    labels = np.repeat(rng.integers(0, 4, size=len(turns)), turns)[:args.windows]
+    starts = np.arange(args.windows, dtype=np.int64) * 12000
+    timestamps = np.column_stack((starts, starts + 24000)) / 16000
+    # The loop was fed a list of (start, end) tuples and the clustering labels array
+    timestamp_list = [tuple(row) for row in timestamps.tolist()]
+
+    def best_of(func, *inputs):
+        best = float("inf")
+        for _ in range(args.repeat):
+            start = time.perf_counter()
+            output = json.dumps(func(*inputs))
+            best = min(best, time.perf_counter() - start)
+        return best, output
+
+    loop_sec, loop_json = best_of(merge_segments_loop, timestamp_list, labels)
+    fast_sec, fast_json = best_of(merge_segments, timestamps, labels)
+    reseg_sec, reseg_json = best_of(
+        lambda t, l: merge_segments(*resegment_frames(t, l)), timestamps, labels
+    )
+    return {
+        "windows": args.windows,
+        "segments": len(json.loads(fast_json)),
+        "loop_sec": round(loop_sec, 4),
+        "vectorised_sec": round(fast_sec, 4),
+        "speedup": round(loop_sec / fast_sec, 1),
+        "json_identical": loop_json == fast_json,
+        "resegmented_sec": round(reseg_sec, 4),
+        "resegmented_segments": len(json.loads(reseg_json)),
+    }
+
+
+def bench_workers(args):
+    """Measure embedding throughput as --workers scales."""
+    import tempfile
+    import soundfile
+    import torch
+    from diarize import count_windows, embed_parallel, embed_window_spans, iter_window_spans, open_audio
+
+    device = torch.device("cpu")
+    model, compute_features = build_model()
+    cpus = os.cpu_count() or 1
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path = os.path.join(tmp_dir, "bench.wav")
+        soundfile.write(path, synthetic_waveform(args.duration).numpy(), SAMPLE_RATE, subtype="PCM_16")
+        read_blocks, total_samples = open_audio(path)
+        total = count_windows(total_samples, WINDOW_SAMPLES, HOP_SAMPLES)
+
+        results = []
+        for workers in args.workers:
+            start = time.perf_counter()
+            if workers == 1:
+                torch.set_num_threads(cpus)
+                spans = iter_window_spans(read_blocks(), WINDOW_SAMPLES, HOP_SAMPLES, args.batch_size)
+                embeddings, _ = embed_window_spans(
+                    model, compute_features, spans, device, WINDOW_SAMPLES, HOP_SAMPLES,
+                    SAMPLE_RATE, total
+                )
+            else:
+                embeddings, _ = embed_parallel(
+                    path, read_blocks, model, compute_features, device, WINDOW_SAMPLES,
+                    HOP_SAMPLES, SAMPLE_RATE, total, workers, batch_size=args.batch_size
+                )
+            elapsed = time.perf_counter() - start
+            results.append({
+                "workers": workers,
+                "threads_per_worker": cpus if workers == 1 else max(1, cpus // workers),
+                "windows": len(embeddings),
+                "seconds": round(elapsed, 3),
+                "windows_per_sec": round(len(embeddings) / elapsed, 1),
+            })
+
+    baseline = results[0]["windows_per_sec"]
+    for result in results:
+        result["speedup"] = round(result["windows_per_sec"] / baseline, 2)
+    return {"cpus": cpus, "results": results}
+
+
+SUITE_TURN_SEC = 4.0
+SUITE_MIN_TURN_SEC = 0.8
+SUITE_VOICE_SEC = 30.0
+DER_FRAME_SEC = 0.01
+
+
+def synthetic_voice(speaker, seconds, seed=0):
+    """Deterministic voiced signal with a pitch and formants unique to speaker."""
+    import numpy as np
+
+    rng = np.random.default_rng([seed, speaker])
+    f0 = rng.uniform(90, 240)
+    formants = np.sort(rng.uniform([300, 900, 2000], [900, 2000, 3200]))
+    t = np.arange(int(seconds * SAMPLE_RATE)) / SAMPLE_RATE
+    vibrato = 1 + 0.08 * np.sin(2 * np.pi * rng.uniform(0.3, 1.0) * t)
+    phase = 2 * np.pi * np.cumsum(f0 * vibrato) / SAMPLE_RATE
+
+    voice = np.zeros(len(t))
+    for k in range(1, int(4000 / f0) + 1):
+        gain = np.exp(-((k * f0 - formants[:, None]) / 150.0) ** 2).sum() + 0.05
+        voice += gain / np.sqrt(k) * np.sin(k * phase)
+    voice += 0.05 * rng.standard_normal(len(t))
+    return (voice / np.abs(voice).max()).astype(np.float32)
+
+
+def load_voices(voices_dir, speakers):
+    """Read the first `speakers` 16kHz mono WAVs from voices_dir, sorted by name."""
+    import soundfile
+
+    names = sorted(n for n in os.listdir(voices_dir) if n.lower().endswith(".wav"))
+    if len(names) < speakers:
+        raise SystemExit(f"--voices needs {speakers} WAV files, found {len(names)} in {voices_dir}")
+    voices = []
+    for name in names[:speakers]:
+        data, rate = soundfile.read(os.path.join(voices_dir, name), dtype="float32")
+        if rate != SAMPLE_RATE or data.ndim != 1:
+            raise SystemExit(f"{name}: voices must be {SAMPLE_RATE}Hz mono")
+        voices.append(data)
+    return voices
+
+
+def conversation_turns(duration, speakers, seed=0):
+    """Ground-truth speaker turns for a synthetic conversation.
+
+    Turn lengths are gamma distributed around SUITE_TURN_SEC, speakers have
+    uneven shares and never follow themselves, and turns are separated by
+    short pauses.
+
+    Returns:
+        List of (start, end, speaker) with start/end in seconds
+    """
+    import numpy as np
+
+    rng = np.random.default_rng(seed)
+    shares = rng.dirichlet(np.full(speakers, 3.0))
+    turns = []
+    position = 0.0
+    previous = -1
+    while True:
+        position += rng.uniform(0.1, 0.8)
+        length = max(SUITE_MIN_TURN_SEC, rng.gamma(2.0, SUITE_TURN_SEC / 2))
+        if position + length > duration:
+            break
+        weights = shares.copy()
+        if speakers > 1 and previous >= 0:
+            weights[previous] = 0
+        speaker = int(rng.choice(speakers, p=weights / weights.sum()))
+        turns.append((position, position + length, speaker))
+        position += length
+        previous = speaker
+    return turns
+
+
+def write_conversation(path, duration, turns, voices, seed=0):
+    """Write turns to a 16-bit WAV at path, one turn at a time.
+
+    Each turn is a random excerpt of its speaker's voice with a syllable-rate
+    amplitude envelope; pauses hold a low noise floor. Memory stays bounded by
+    the longest turn however long the conversation is.
+    """
+    import numpy as np
+    import soundfile
+
+    rng = np.random.default_rng(seed + 1)
+    total = int(duration * SAMPLE_RATE)
+    with soundfile.SoundFile(path, "w", SAMPLE_RATE, 1, subtype="PCM_16") as out:
+        written = 0
+        for start, end, speaker in turns + [(duration, duration, None)]:
+            first = int(start * SAMPLE_RATE)
+            out.write((0.001 * rng.standard_normal(first - written)).astype(np.float32))
+            if speaker is None:
+                break
+            length = int(end * SAMPLE_RATE) - first
+            voice = voices[speaker]
+            offset = rng.integers(0, max(1, len(voice) - length))
+            excerpt = np.resize(voice[offset:], length)
+            t = np.arange(length) / SAMPLE_RATE
+            syllables = 0.55 + 0.45 * np.sin(2 * np.pi * rng.uniform(3, 5) * t + rng.uniform(0, np.pi))
+            out.write((0.3 * excerpt * syllables).astype(np.float32))
+            written = first + length
+        out.write(np.zeros(total - out.frames, dtype=np.float32))
+
+
+def frame_labels(turns, total_frames, speaker_index):
+    """Per-frame speaker index (-1 for silence) for turns on a DER_FRAME_SEC grid."""
+    import numpy as np
+
+    frames = np.full(total_frames, -1, dtype=np.int64)
+    for start, end, speaker in turns:
+        frames[int(round(start / DER_FRAME_SEC)):int(round(end / DER_FRAME_SEC))] = speaker_index[speaker]
+    return frames
+
+
+def diarization_error(reference, hypothesis, duration, collar=0.25):
+    """Frame-based diarization error rate with an optimal speaker mapping.
+
+    Frames within `collar` seconds of a reference turn boundary are not
+    scored, as in the usual NIST scoring. Speakers are mapped one-to-one with
+    the Hungarian algorithm to maximise matched speech.
+
+    Args:
+        reference: List of (start, end, speaker) ground-truth turns
+        hypothesis: List of (start, end, speaker) system turns
+        duration: Audio length in seconds
+        collar: Seconds excluded around each reference boundary
+
+    Returns:
+        Dict with "der" and its "missed", "false_alarm" and "confusion"
+        fractions of scored reference speech
+    """
+    import numpy as np
+    from scipy.optimize import linear_sum_assignment
+
+    total = int(round(duration / DER_FRAME_SEC))
+    ref_ids = {s: i for i, s in enumerate(sorted({t[2] for t in reference}))}
+    hyp_ids = {s: i for i, s in enumerate(sorted({t[2] for t in hypothesis}))}
+    ref = frame_labels(reference, total, ref_ids)
+    hyp = frame_labels(hypothesis, total, hyp_ids)
+
+    scored = np.ones(total, dtype=bool)
+    pad = int(round(collar / DER_FRAME_SEC))
+    for start, end, _ in reference:
+        for edge in (int(round(start / DER_FRAME_SEC)), int(round(end / DER_FRAME_SEC))):
+            scored[max(0, edge - pad):edge + pad] = False
+    ref, hyp = ref[scored], hyp[scored]
+
+    speech = int((ref >= 0).sum())
+    missed = int(((ref >= 0) & (hyp < 0)).sum())
+    false_alarm = int(((ref < 0) & (hyp >= 0)).sum())
+    both = (ref >= 0) & (hyp >= 0)
+    overlap = np.zeros((max(1, len(ref_ids)), max(1, len(hyp_ids))), dtype=np.int64)
+    np.add.at(overlap, (ref[both], hyp[both]), 1)
+    rows, cols = linear_sum_assignment(overlap, maximize=True)
+    confusion = int(both.sum() - overlap[rows, cols].sum())
+
+    if speech == 0:
+        return {"der": 0.0, "missed": 0.0, "false_alarm": 0.0, "confusion": 0.0}
+    return {
+        "der": round((missed + false_alarm + confusion) / speech, 4),
+        "missed": round(missed / speech, 4),
+        "false_alarm": round(false_alarm / speech, 4),
+        "confusion": round(confusion / speech, 4),
+    }
+
+
+def git_commit():
+    """Short hash of the checked-out commit, or None outside a git tree."""
+    try:
+        result = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+            cwd=os.path.dirname(os.path.abspath(__file__)), timeout=10
+        )
+    except (OSError, subprocess.TimeoutExpired):
+        return None
+    return result.stdout.strip() or None
+
+
+def suite_key(run):
+    """Fields that identify the same run across results files."""
+    return (run["duration_sec"], run["speakers"], run["backend"], run["clustering"])
+
+
+def compare_runs(runs, baseline_path):
+    """Annotate runs with their change against matching runs in baseline_path."""
+    with open(baseline_path) as f:
+        baseline = {suite_key(run): run for run in json.load(f)["runs"] if "error" not in run}
+    for run in runs:
+        before = baseline.get(suite_key(run))
+        if before is None or "error" in run:
+            continue
+        run["vs_baseline"] = {
+            "throughput_ratio": round(run["throughput"] / before["throughput"], 3),
+            "peak_rss_mb_delta": round(run["peak_rss_mb"] - before["peak_rss_mb"], 1),
+            "der_delta": round(run["der"]["der"] - before["der"]["der"], 4),
+        }
+
+
+def bench_suite(args):
+    """Diarize synthetic conversations end to end and score them against ground truth."""
+    import platform
+    import tempfile
+    import torch
+    from diarize import count_windows, diarize_file, round_timings
+
+    configs = [config.partition(":") for config in args.configs]
+    models = {}
+    if not args.pretrained:
+        torch.manual_seed(args.seed)
+        models[("speechbrain", "cpu")] = build_model()
+    if args.voices:
+        voices = load_voices(args.voices, args.speakers)
+    else:
+        voices = [synthetic_voice(speaker, SUITE_VOICE_SEC, args.seed) for speaker in range(args.speakers)]
+
+    def run(path, backend, clustering):
+        timings = {}
+        result = diarize_file(
+            path, backend=backend, device_name="cpu", num_speakers=args.num_speakers,
+            models=models, clustering=clustering or "auto", workers=args.workers, timings=timings
+        )
+        return result, round_timings(timings)
+
+    runs = []
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for duration in args.durations:
+            turns = conversation_turns(duration, args.speakers, args.seed)
+            path = os.path.join(tmp_dir, f"conversation-{int(duration)}s.wav")
+            write_conversation(path, duration, turns, voices, args.seed)
+            windows = count_windows(int(duration * SAMPLE_RATE), WINDOW_SAMPLES, HOP_SAMPLES)
+
+            for backend, _, clustering in configs:
+                entry = {
+                    "duration_sec": duration,
+                    "speakers": args.speakers,
+                    "backend": backend,
+                    "clustering": clustering or None,
+                    "turns": len(turns),
+                }
+                if clustering == "dense" and windows > args.dense_max:
+                    entry["error"] = f"skipped: {windows} windows > --dense-max {args.dense_max}"
+                    runs.append(entry)
+                    continue
+                (result, timings), rss_mb, seconds = run_isolated(run, path, backend, clustering)
+                if isinstance(result, dict):
+                    entry["error"] = result["error"]
+                else:
+                    hypothesis = [(s["start"], s["end"], s["speaker"]) for s in result]
+                    entry.update({
+                        "seconds": round(seconds, 3),
+                        "throughput": round(duration / seconds, 2),
+                        "peak_rss_mb": round(rss_mb, 1),
+                        "speakers_found": len({s["speaker"] for s in result}),
+                        "der": diarization_error(turns, hypothesis, duration, args.collar),
+                        "timings": timings,
+                    })
+                runs.append(entry)
+                status = entry.get("error") or f"{entry['throughput']}x realtime, DER {entry['der']['der']}"
+                print(f"  {duration:g}s {backend}:{clustering or 'default'}: {status}",
+                      file=sys.stderr, flush=True)
+
+    if args.compare:
+        compare_runs(runs, args.compare)
+    results = {
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "commit": git_commit(),
+        "machine": {
+            "platform": platform.platform(),
+            "processor": platform.processor() or platform.machine(),
+            "cpus": os.cpu_count(),
+            "python": platform.python_version(),
+            "torch": torch.__version__,
+            "torch_threads": torch.get_num_threads(),
+        },
+        "settings": {
+            "seed": args.seed,
+            "weights": "pretrained" if args.pretrained else "random",
+            "voices": args.voices or "synthetic",
+            "collar_sec": args.collar,
+            "num_speakers": args.num_speakers,
+            "workers": args.workers,
+        },
+        "runs": runs,
+    }
+    output = args.output or time.strftime("diarize-suite-%Y%m%d-%H%M%S.json")
+    with open(output, "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"  Results written to {output}", file=sys.stderr, flush=True)
+    return results
+
+
+# A reduced precision passes the accuracy check when every embedding stays this
+# close to fp32 and clustering assigns (almost) the same labels
+PRECISION_MIN_COSINE = 0.99
+PRECISION_MIN_RAND = 0.95
+
+
+def bench_precision(args):
+    """Compare reduced-precision ECAPA inference with fp32 for speed and accuracy."""
+    import tempfile
+    import numpy as np
+    import torch
+    from sklearn.metrics import adjusted_rand_score
+    from diarize import (apply_precision, cluster_embeddings, count_windows, embed_window_spans,
+                         iter_window_spans, load_speechbrain_model, merge_segments, open_audio)
+
+    device = torch.device("cpu")
+    if args.pretrained:
+        model, compute_features = load_speechbrain_model(device)
+    else:
+        torch.manual_seed(args.seed)
+        model, compute_features = build_model()
+    voices = [synthetic_voice(speaker, SUITE_VOICE_SEC, args.seed) for speaker in range(args.speakers)]
+    turns = conversation_turns(args.duration, args.speakers, args.seed)
+
+    results = []
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path = os.path.join(tmp_dir, "conversation.wav")
+        write_conversation(path, args.duration, turns, voices, args.seed)
+        read_blocks, total_samples = open_audio(path)
+        total = count_windows(total_samples, WINDOW_SAMPLES, HOP_SAMPLES)
+
+        reference = None
+        for precision in args.precisions:
+            variant = apply_precision(model, precision, device)
+            start = time.perf_counter()
+            spans = iter_window_spans(read_blocks(), WINDOW_SAMPLES, HOP_SAMPLES, args.batch_size)
+            embeddings, timestamps = embed_window_spans(
+                variant, compute_features, spans, device, WINDOW_SAMPLES, HOP_SAMPLES,
+                SAMPLE_RATE, total
+            )
+            elapsed = time.perf_counter() - start
+            labels = cluster_embeddings(embeddings)
+            hypothesis = [(s["start"], s["end"], s["speaker"]) for s in merge_segments(timestamps, labels)]
+            result = {
+                "precision": precision,
+                "windows": len(embeddings),
+                "seconds": round(elapsed, 3),
+                "windows_per_sec": round(len(embeddings) / elapsed, 1),
+                "speakers_found": len(set(labels)),
+                "der": diarization_error(turns, hypothesis, args.duration)["der"],
+            }
+            if reference is None:
+                reference = (embeddings, labels, result["windows_per_sec"])
+            unit = embeddings / np.linalg.norm(embeddings, axis=1, keepdims=True)
+            ref_unit = reference[0] / np.linalg.norm(reference[0], axis=1, keepdims=True)
+            cosine = (unit * ref_unit).sum(axis=1)
+            rand = adjusted_rand_score(reference[1], labels)
+            result.update({
+                "speedup": round(result["windows_per_sec"] / reference[2], 2),
+                "cosine_mean": round(float(cosine.mean()), 5),
+                "cosine_min": round(float(cosine.min()), 5),
+                "adjusted_rand_vs_first": round(rand, 4),
+                "accuracy_ok": bool(cosine.min() >= PRECISION_MIN_COSINE and rand >= PRECISION_MIN_RAND),
+            })
+            results.append(result)
+
+    return {
+        "cpu_flags": cpu_flags(),
+        "weights": "pretrained" if args.pretrained else "random",
+        "duration_sec": args.duration,
+        "speakers": args.speakers,
+        "results": results,
+    }
+
+
+def bench_compile(args):
+    """Compare --compile against eager ECAPA: compile cost, load cost and steady-state speed."""
+    import tempfile
+    import torch
+    from diarize import CompiledModel
+
+    torch.manual_seed(0)
+    model, compute_features = build_model()
+    windows = synthetic_waveform(WINDOW_SAMPLES * args.batch_size / SAMPLE_RATE).reshape(args.batch_size, -1)
+    feats = compute_features(windows)
+
+    def windows_per_sec(run):
+        with torch.no_grad():
+            run(feats)
+            start = time.perf_counter()
+            for _ in range(args.batches):
+                run(feats)
+        return args.batches * args.batch_size / (time.perf_counter() - start)
+
+    with tempfile.TemporaryDirectory() as compile_dir:
+        compiled = CompiledModel(model, args.batch_size, compile_dir)
+        start = time.perf_counter()
+        compiled.prepare(feats)
+        compile_sec = time.perf_counter() - start
+        if compiled.compiled is None:
+            return {"error": "compilation failed, see stderr"}
+
+        reloaded = CompiledModel(model, args.batch_size, compile_dir)
+        start = time.perf_counter()
+        reloaded.prepare(feats)
+        load_sec = time.perf_counter() - start
+
+        eager_wps = windows_per_sec(model)
+        compiled_wps = windows_per_sec(compiled)
+        with torch.no_grad():
+            difference = (compiled(feats) - model(feats)).abs().max().item()
+
+    saved_per_window = 1 / eager_wps - 1 / compiled_wps
+    hop_sec = HOP_SAMPLES / SAMPLE_RATE
+
+    def payback(seconds):
+        if saved_per_window <= 0:
+            return {"windows": None, "audio_min": None}
+        windows_needed = seconds / saved_per_window
+        return {"windows": round(windows_needed), "audio_min": round(windows_needed * hop_sec / 60, 1)}
+
+    return {
+        "torch": torch.__version__,
+        "cpu_flags": cpu_flags(),
+        "batch_shape": list(feats.shape),
+        "compile_sec": round(compile_sec, 2),
+        "cached_load_sec": round(load_sec, 3),
+        "eager_windows_per_sec": round(eager_wps, 1),
+        "compiled_windows_per_sec": round(compiled_wps, 1),
+        "speedup": round(compiled_wps / eager_wps, 2),
+        "max_abs_difference": difference,
+        "payback_first_run": payback(compile_sec),
+        "payback_cached": payback(load_sec),
+    }
+
+
+def evict_page_cache(paths):
+    """Drop the cached pages of each file; False where posix_fadvise is unavailable.
+
+    Only clean pages are dropped, which is all a read-only checkpoint has.
+    """
+    if not hasattr(os, "posix_fadvise"):
+        return False
+    for path in paths:
+        fd = os.open(path, os.O_RDONLY)
+        try:
+            os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_DONTNEED)
+        finally:
+            os.close(fd)
+    return True
+
+
+def time_model_load(method, checkpoint, registry, cold):
+    """Load ECAPA one way in this process; return load and first-batch seconds."""
+    import torch
+    from diarize import load_speechbrain_model
+
+    if cold:
+        evict_page_cache([checkpoint, registry.converted_path(checkpoint)])
+    start = time.perf_counter()
+    if method == "pickle":
+        model, _ = build_model()
+        model.load_state_dict(torch.load(checkpoint, map_location="cpu", weights_only=False))
+    else:
+        model, _ = load_speechbrain_model(torch.device("cpu"), registry)
+    loaded = time.perf_counter()
+    with torch.no_grad():
+        model(torch.randn(32, 150, 80))
+    return {"load_sec": loaded - start, "first_batch_sec": time.perf_counter() - loaded}
+
+
+def time_pyannote_load(token, cold):
+    """Load the pyannote pipeline in this process; return seconds or an error."""
+    import torch
+    from huggingface_hub import constants
+    from diarize import load_pyannote_pipeline
+
+    if cold and os.path.isdir(constants.HF_HUB_CACHE):
+        cache = constants.HF_HUB_CACHE
+        evict_page_cache([
+            os.path.join(root, name)
+            for entry in os.listdir(cache) if entry.startswith("models--pyannote--")
+            for root, _, names in os.walk(os.path.join(cache, entry, "blobs")) for name in names
+        ])
+    start = time.perf_counter()
+    try:
+        pipeline = load_pyannote_pipeline(token, torch.device("cpu"))
+    except Exception as e:
+        # Report rather than raise: run_isolated waits for a result
+        return {"error": str(e)}
+    if isinstance(pipeline, dict):
+        return pipeline
+    return {"load_sec": round(time.perf_counter() - start, 4)}
+
+
+def bench_load(args):
+    """Time cold and warm model loads from the pickled checkpoint and the mmap layout."""
+    import statistics
+    import tempfile
+    import torch
+    from diarize import SPEECHBRAIN_MODEL_ID, ModelRegistry
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        registry = ModelRegistry(os.path.join(tmp_dir, "models"))
+        if args.pretrained:
+            checkpoint = registry.checkpoint(SPEECHBRAIN_MODEL_ID, "embedding_model.ckpt")
+        else:
+            checkpoint = os.path.join(tmp_dir, "embedding_model.ckpt")
+            torch.manual_seed(0)
+            torch.save(build_model()[0].state_dict(), checkpoint)
+        registry.checkpoint = lambda *_, **__: checkpoint
+
+        start = time.perf_counter()
+        registry.state_dict(checkpoint)
+        convert_sec = time.perf_counter() - start
+
+        cold_supported = evict_page_cache([checkpoint])
+        results = []
+        for method in ("pickle", "mmap"):
+            for cold in ([True, False] if cold_supported else [False]):
+                trials = [run_isolated(time_model_load, method, checkpoint, registry, cold)
+                          for _ in range(args.repeat)]
+                results.append({
+                    "method": method,
+                    "page_cache": "cold" if cold else "warm",
+                    "load_sec": round(statistics.median(t[0]["load_sec"] for t in trials), 4),
+                    "first_batch_sec": round(statistics.median(t[0]["first_batch_sec"] for t in trials), 4),
+                    "peak_rss_mb": round(statistics.median(t[1] for t in trials), 1),
+                })
+
+        report = {
+            "weights": "pretrained" if args.pretrained else "random",
+            "checkpoint_mb": round(os.path.getsize(checkpoint) / 1e6, 1),
+            "convert_once_sec": round(convert_sec, 3),
+            "results": results,
+        }
+
+    if args.pyannote:
+        token = os.environ.get("HF_TOKEN") or os.environ.get("HUGGINGFACE_TOKEN")
+        report["pyannote"] = []
+        for cold in ([True, False] if cold_supported else [False]):
+            outcome = run_isolated(time_pyannote_load, token, cold)[0]
+            report["pyannote"].append(dict(outcome, page_cache="cold" if cold else "warm"))
+    return report
+
+
+def cpu_flags():
+    """The CPU features that decide bf16 and int8 speed, where /proc/cpuinfo exists."""
+    try:
+        with open("/proc/cpuinfo") as f:
+            flags = next((line.split(":", 1)[1].split() for line in f if line.startswith("flags")), [])
+    except OSError:
+        return None
+    return sorted(flag for flag in flags if flag in ("avx2", "avx512f", "avx512_vnni", "avx512_bf16",
+                                                     "amx_bf16", "amx_int8"))
+
+
+def parse_float_list(value):
+    return [float(v) for v in value.split(",") if v]
+
+
+def parse_str_list(value):
+    return [v for v in value.split(",") if v]
+
+
+def parse_int_list(value):
+    return [int(v) for v in value.split(",") if v]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmarks for diarize.py")
+    subparsers = parser.add_subparsers(dest="benchmark", required=True)
+
+    embed = subparsers.add_parser("embed", help="Embedding throughput per batch size")
+    embed.add_argument("--duration", type=float, default=120.0,
+                       help="Synthetic audio length in seconds (default: 120)")
+    embed.add_argument("--batch-sizes", type=parse_int_list, default=[1, 8, 32],
+                       help="Comma-separated batch sizes, first is the baseline (default: 1,8,32)")
+    embed.set_defaults(func=bench_embed)
+
+    windows = subparsers.add_parser("windows", help="Peak RSS of strided windowing")
+    windows.add_argument("--duration", type=float, default=3 * 3600.0,
+                         help="Synthetic audio length in seconds (default: 10800)")
+    windows.add_argument("--batch-size", type=int, default=32,
+                         help="Windows per batch (default: 32)")
+    windows.set_defaults(func=bench_windows)
+
+    features = subparsers.add_parser("features", help="Per-window vs cached Fbank time")
+    features.add_argument("--duration", type=float, default=600.0,
+                          help="Synthetic audio length in seconds (default: 600)")
+    features.add_argument("--batch-size", type=int, default=32,
+                          help="Windows per batch (default: 32)")
+    features.set_defaults(func=bench_features)
+
+    startup = subparsers.add_parser("startup", help="CLI cold-start latency via -X importtime")
+    startup.add_argument("--repeat", type=int, default=5,
+                         help="Runs per case, fastest is reported (default: 5)")
+    startup.add_argument("--top", type=int, default=5,
+                         help="Heaviest top-level imports to list (default: 5)")
+    startup.set_defaults(func=bench_startup)
+
+    cluster = subparsers.add_parser("cluster", help="Dense vs two-stage clustering")
+    cluster.add_argument("--sizes", type=parse_int_list, default=[1000, 4000, 14400],
+                         help="Comma-separated window counts (default: 1000,4000,14400)")
+    cluster.add_argument("--speakers", type=int, default=4,
+                         help="Synthetic speakers (default: 4)")
+    cluster.add_argument("--dense-max", type=int, default=8000,
+                         help="Skip the dense engine above this many windows (default: 8000)")
+    cluster.set_defaults(func=bench_cluster)
+
+    speakers = subparsers.add_parser("speakers", help="Top-k vs full-spectrum speaker estimation")
+    speakers.add_argument("--sizes", type=parse_int_list, default=[1000, 2000, 4000, 10000, 50000],
+                          help="Comma-separated window counts (default: 1000,2000,4000,10000,50000)")
+    speakers.add_argument("--speakers", type=parse_int_list, default=[2, 3, 5],
+                          help="Comma-separated synthetic speaker counts (default: 2,3,5)")
+    speakers.add_argument("--full-max", type=int, default=4000,
+                          help="Skip the full eigen-decomposition above this many windows (default: 4000)")
+    speakers.set_defaults(func=bench_speakers)
+
+    affinity = subparsers.add_parser("affinity", help="Shared precomputed affinity memory/time")
+    affinity.add_argument("--sizes", type=parse_int_list, default=[2000, 4000],
+                          help="Comma-separated window counts (default: 2000,4000)")
+    affinity.add_argument("--speakers", type=int, default=4,
+                          help="Synthetic speakers (default: 4)")
+    affinity.set_defaults(func=bench_affinity)
+
+    merge = subparsers.add_parser("merge", help="Vectorised vs loop merge_segments")
+    merge.add_argument("--windows", type=int, default=100000,
+                       help="Windows to merge (default: 100000)")
+    merge.add_argument("--repeat", type=int, default=5,
+                       help="Runs per variant, fastest is reported (default: 5)")
+    merge.set_defaults(func=bench_merge)
+
+    workers = subparsers.add_parser("workers", help="Embedding throughput per --workers count")
+    workers.add_argument("--duration", type=float, default=300.0,
+                         help="Synthetic audio length in seconds (default: 300)")
+    workers.add_argument("--workers", type=parse_int_list, default=[1, 2, 4, 8, 16],
+                         help="Comma-separated worker counts, first is the baseline (default: 1,2,4,8,16)")
+    workers.add_argument("--batch-size", type=int, default=32,
+                         help="Windows per batch (default: 32)")
+    workers.set_defaults(func=bench_workers)
+
+    precision = subparsers.add_parser("precision", help="Reduced-precision embedding speed and accuracy")
+    precision.add_argument("--duration", type=float, default=600.0,
+                           help="Synthetic conversation length in seconds (default: 600)")
+    precision.add_argument("--speakers", type=int, default=3,
+                           help="Speakers in the conversation (default: 3)")
+    precision.add_argument("--precisions", type=parse_str_list, default=["fp32", "bf16", "int8"],
+                           help="Comma-separated precisions, first is the reference (default: fp32,bf16,int8)")
+    precision.add_argument("--batch-size", type=int, default=32,
+                           help="Windows per batch (default: 32)")
+    precision.add_argument("--pretrained", action="store_true",
+                           help="Use the real speechbrain checkpoint instead of random weights")
+    precision.add_argument("--seed", type=int, default=0,
+                           help="Seed for weights, voices and turn structure (default: 0)")
+    precision.set_defaults(func=bench_precision)
+
+    compile_parser = subparsers.add_parser("compile", help="AOTInductor-compiled vs eager ECAPA")
+    compile_parser.add_argument("--batch-size", type=int, default=32,
+                                help="Windows per batch, the compiled shape (default: 32)")
+    compile_parser.add_argument("--batches", type=int, default=10,
+                                help="Batches timed per mode after one warm-up (default: 10)")
+    compile_parser.set_defaults(func=bench_compile)
+
+    load = subparsers.add_parser("load", help="Cold and warm model load, pickled vs mmap checkpoint")
+    load.add_argument("--repeat", type=int, default=3,
+                      help="Child-process loads per configuration, median reported (default: 3)")
+    load.add_argument("--pretrained", action="store_true",
+                      help="Use the real speechbrain checkpoint instead of random weights")
+    load.add_argument("--pyannote", action="store_true",
+                      help="Also time the pyannote pipeline load (needs pyannote.audio and HF_TOKEN)")
+    load.set_defaults(func=bench_load)
+
+    suite = subparsers.add_parser("suite", help="End-to-end throughput, memory and DER on synthetic conversations")
+    suite.add_argument("--durations", type=parse_float_list, default=[300.0, 3600.0],
+                       help="Comma-separated conversation lengths in seconds, e.g. 300,3600,14400 "
+                            "(default: 300,3600)")
+    suite.add_argument("--speakers", type=int, default=3,
+                       help="Speakers per conversation (default: 3)")
+    suite.add_argument("--configs", type=parse_str_list,
+                       default=["speechbrain:auto", "speechbrain:dense", "speechbrain:two-stage"],
+                       help="Comma-separated backend[:clustering] runs; pyannote needs HF_TOKEN "
+                            "(default: speechbrain:auto,speechbrain:dense,speechbrain:two-stage)")
+    suite.add_argument("--num-speakers", type=int, default=None,
+                       help="Pass the true speaker count instead of estimating it")
+    suite.add_argument("--dense-max", type=int, default=8000,
+                       help="Skip dense clustering above this many windows (default: 8000)")
+    suite.add_argument("--workers", type=int, default=1,
+                       help="diarize.py --workers for each run (default: 1)")
+    suite.add_argument("--voices", metavar="DIR",
+                       help="Directory of 16kHz mono WAVs, one voice per speaker, instead of "
+                            "synthetic voices")
+    suite.add_argument("--pretrained", action="store_true",
+                       help="Use the real speechbrain checkpoint instead of random weights")
+    suite.add_argument("--collar", type=float, default=0.25,
+                       help="Seconds around reference boundaries excluded from DER (default: 0.25)")
+    suite.add_argument("--seed", type=int, default=0,
+                       help="Seed for voices and turn structure (default: 0)")
+    suite.add_argument("--output", metavar="PATH",
+                       help="Results file (default: diarize-suite-<timestamp>.json)")
+    suite.add_argument("--compare", metavar="BASELINE",
+                       help="Earlier results file to compare throughput, memory and DER against")
+    suite.set_defaults(func=bench_suite)
+
+    args = parser.parse_args()
+    print(json.dumps(args.func(args), indent=2))
+
+
+if __name__ == "__main__":
+    main()
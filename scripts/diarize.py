@@ -6,6 +6,15 @@
 Speaker diarization with automatic backend selection and GPU acceleration.
 
 Usage: python3 diarize.py <audio_file> [--backend auto|pyannote|speechbrain] [--device auto|cpu|mps|cuda]
+                          [--batch-size N] [--no-feature-cache] [--threads N] [--workers N]
+                          [--no-embedding-cache] [--cache-dir DIR] [--cache-max-mb MB]
+                          [--clustering auto|dense|two-stage] [--affinity-dtype float64|float32]
+                          [--resegment] [--no-vad] [--segments FILE|-] [--precision fp32|bf16|int8]
+                          [--compile] [--profile] [--timings-json PATH] [--format json|jsonl]
+                          [--progress-fd N]
+       python3 diarize.py --stream - [--device ...] [--num-speakers N] [--no-vad] [--precision ...]
+       python3 diarize.py --serve [--socket PATH] [--idle-timeout SECONDS]
+       python3 diarize.py --batch manifest.jsonl [options as above]
 
 Backends:
   pyannote    - Best quality (~10-15% DER), requires HuggingFace token
@@ -25,6 +34,91 @@ Output: JSON to stdout with speaker segments:
   ...
 ]
 
+With --format jsonl, output is one JSON record per line, flushed as it is
+produced, so a reader can act on it before the process exits:
+  {"event": "stage", "stage": "extract", "elapsed_sec": 1.4}
+  {"event": "progress", "stage": "extract", "done": 640, "total": 4800,
+   "percent": 13.3, "elapsed_sec": 5.1, "eta_sec": 33.2,
+   "audio_sec": 961.5, "audio_sec_per_sec": 188.5}
+  {"start": 0.0, "end": 5.2, "speaker": "SPEAKER_00"}
+  {"event": "stats", "wall_sec": 41.2, "timings": {...}}
+  {"event": "done", "segments": 212}
+Progress records arrive while windows are embedded, at most every 0.5s plus
+the one that completes the stage; segments follow clustering, which needs
+every embedding. Errors are a single {"error"} line.
+
+Progress (--progress-fd N): the same stage and progress records go to file
+descriptor N instead, leaving stdout to the results in either format; with
+--batch they carry audio_file, file and files, and a {"event": "file"} record
+with the batch ETA follows each entry. Without a progress fd or jsonl, stderr
+shows the percentage, speed (x realtime) and ETA while on a terminal, or one
+summary line per stage when redirected.
+
+Transcript segments (--segments): instead of a blind 1.5s grid, embed only
+the given speech segments (a JSON list of {"start": s, "end": s} objects, from
+a file or "-" for stdin) and return exactly one labelled segment per input
+segment, in input order.
+
+Embedding cache: speechbrain embeddings are saved under
+~/.cache/transcribe-summarize/embeddings/, keyed by the 16kHz audio content,
+the model checkpoint and the window/precision/--compile parameters, so re-running on the same recording (e.g. to change
+the output format) skips straight to clustering. Least recently used entries
+are evicted beyond --cache-max-mb.
+
+Model loading: checkpoints are looked up in the local HuggingFace cache with
+the hub offline, and downloaded only if missing. The speechbrain checkpoint is
+unpickled once and re-saved as weights-only tensors under
+~/.cache/transcribe-summarize/models/; later loads memory-map that file, so
+startup does not copy the weights into RAM. `bench_diarize.py load` times cold
+and warm loads.
+
+Reduced precision (--precision, speechbrain only): bf16 runs ECAPA-TDNN under
+bfloat16 autocast (fast on CPUs with AVX512-BF16/AMX); int8 replaces its 1x1
+convolutions, which hold over 90% of the weights, with dynamically quantized
+int8 matmuls on CPU. Filterbank features and clustering stay in fp32.
+`bench_diarize.py precision` compares embeddings, labels and throughput with fp32.
+
+Compilation (--compile, speechbrain only): the first full embedding batch
+exports ECAPA-TDNN at its exact shape and compiles it with AOTInductor into
+~/.cache/transcribe-summarize/compiled/, keyed by torch version, device, batch
+shape and a hash of the weights; later runs load the package. If export or
+compilation fails, embedding stays eager. With --precision bf16 the autocast
+model is compiled; int8 always runs eagerly, as its quantized layers cannot be
+exported. `bench_diarize.py compile` reports the compile time, steady-state
+speedup and when compiling pays for itself.
+
+Streaming (--stream -): reads raw 16kHz mono s16le PCM from stdin (or a file
+or FIFO) and writes one JSON line per speaker turn as the audio arrives, e.g.
+  ffmpeg -i input -f s16le -ac 1 -ar 16000 - | diarize.py --stream -
+Windows are labelled by online clustering (running centroids that merge and
+split), so turns trail the audio by under 2 seconds and memory stays constant
+however long the session runs. A turn in progress is written in pieces, so
+consecutive lines may continue the same speaker; {"event": "merge", "speaker",
+"into"} lines mean the first speaker's earlier turns belong to the second.
+
+Worker mode (--serve): listens on a Unix socket and keeps models loaded, so
+batch jobs pay the import and model-load cost once. Send one JSON request per
+line and read one JSON line back:
+  {"audio_file": "/path/a.wav", "backend": "speechbrain", "device": "cpu"}
+  {"command": "ping"}
+  {"command": "shutdown"}
+Diarizer.swift uses a running worker automatically when the socket exists.
+
+Batch mode (--batch): diarizes every file listed in a JSONL manifest in one
+process, loading models once and reading/decoding the next file while the
+current one is embedded. Each manifest line is a request like those above
+(or just a path string); command-line options are the defaults. One JSON
+line is written per file ({"audio_file", "segments" or "error", "seconds",
+"timings"}), then {"summary": {...}} with files/hour and per-stage seconds.
+
+Profiling (--profile, --timings-json PATH): records wall time, CPU time and
+peak RSS for each stage (open, resample, cache, vad, load_model, extract with
+features and embedding inside it, cluster with estimate_speakers inside it,
+merge). --profile prints a table to stderr; --timings-json writes
+{"audio_file", "wall_sec", "timings": {stage: {"wall_sec", "cpu_sec",
+"peak_rss_mb"}}} to PATH. A --serve request with "timings": true gets
+{"segments": [...], "timings": {...}} back instead of the bare segment list.
+
 For pyannote, you must accept ALL THREE model licenses:
   https://huggingface.co/pyannote/speaker-diarization-3.1
   https://huggingface.co/pyannote/segmentation-3.0
@@ -32,10 +126,13 @@ For pyannote, you must accept ALL THREE model licenses:
 """
 
 import argparse
+import contextlib
 import json
+import functools
 import logging
 import os
 import sys
+import time
 import warnings
 
 warnings.filterwarnings("ignore")
@@ -47,44 +144,374 @@ warnings.filterwarnings("ignore")
 # See: https://github.com/speechbrain/speechbrain/issues/2579
 logging.getLogger('speechbrain.utils.torch_audio_backend').setLevel(logging.ERROR)
 
-# Patch for torchaudio 2.9+ which removed list_audio_backends
-# Must be done early before any audio library imports
-import torchaudio
-if not hasattr(torchaudio, 'list_audio_backends'):
-    torchaudio.list_audio_backends = lambda: []
-
 # Set environment for PyTorch 2.6+ compatibility with older models
 # This allows loading models pickled with older PyTorch versions
 os.environ.setdefault("TORCH_FORCE_NO_WEIGHTS_ONLY_LOAD", "1")
 
-# Patch huggingface_hub for speechbrain compatibility
-# speechbrain 1.0.3 uses deprecated use_auth_token parameter
-from functools import wraps
-import huggingface_hub
+# Windows embedded per ECAPA forward pass. Larger batches amortise Python and
+# host-to-device overhead; 32 keeps peak activation memory well under 1GB.
+DEFAULT_BATCH_SIZE = 32
+
+# Where --serve listens and Diarizer.swift looks for a running worker
+DEFAULT_SOCKET_PATH = os.path.join(
+    os.path.expanduser("~"), ".cache", "transcribe-summarize", "diarize.sock"
+)
+
+# Seconds an idle --serve worker keeps models in memory before exiting
+DEFAULT_IDLE_TIMEOUT = 1800
+
+SPEECHBRAIN_MODEL_ID = 'speechbrain/spkrec-ecapa-voxceleb'
+
+# Model checkpoints converted once to a weights-only layout that loads via mmap
+DEFAULT_MODEL_DIR = os.path.join(
+    os.path.expanduser("~"), ".cache", "transcribe-summarize", "models"
+)
+
+# Bump when the converted checkpoint layout changes
+MODEL_FORMAT_VERSION = 1
+
+# ECAPA-TDNN inference precisions for --precision; fp32 is the reference
+PRECISIONS = ("fp32", "bf16", "int8")
+
+# Ahead-of-time compiled ECAPA-TDNN packages for --compile (see CompiledModel)
+DEFAULT_COMPILE_DIR = os.path.join(
+    os.path.expanduser("~"), ".cache", "transcribe-summarize", "compiled"
+)
+
+# Bump when the compiled package layout or its cache key changes
+COMPILE_FORMAT_VERSION = 1
+
+# Partial batches at least this full are zero-padded to the compiled shape;
+# emptier ones run eagerly, where padding would cost more than compiling saves
+COMPILE_MIN_FILL = 0.75
+
+# Progress updates closer together than this are dropped (except the last of a stage)
+PROGRESS_INTERVAL_SEC = 0.5
+PROGRESS_LABELS = {"extract": "Extracting embeddings"}
+
+# Per-window embeddings are cached here, keyed by audio content and parameters
+DEFAULT_CACHE_DIR = os.path.join(
+    os.path.expanduser("~"), ".cache", "transcribe-summarize", "embeddings"
+)
+DEFAULT_CACHE_MAX_MB = 256
+
+# Bump when the cached embedding layout or extraction semantics change
+EMBEDDING_CACHE_VERSION = 2
+
+# Samples read from disk per block when streaming 16kHz audio (~16s)
+AUDIO_BLOCK_SAMPLES = 1 << 18
+
+# Above this many windows (~25 minutes of audio) clustering switches from a
+# dense n x n affinity to k-means pre-clustering into TWO_STAGE_CENTROIDS
+TWO_STAGE_MIN_WINDOWS = 2000
+TWO_STAGE_CENTROIDS = 300
+
+# Frame grid (seconds) that --resegment distributes window labels onto
+RESEGMENT_FRAME_SEC = 0.01
+
+# Voice-activity detection: 30ms frames are speech when their energy clears the
+# recording's noise floor (10th percentile) by VAD_MARGIN_DB and their spectrum
+# is neither noise-like (flat) nor a pure or dual tone; a window is embedded
+# when at least VAD_MIN_SPEECH of its frames are speech
+VAD_FRAME_SAMPLES = 480
+VAD_MARGIN_DB = 9.0
+VAD_SILENCE_DB = -60.0
+VAD_MAX_FLATNESS = 0.5
+VAD_MAX_TONALITY = 0.8
+VAD_MIN_SPEECH = 0.1
+
+# --stream: PCM is read in 0.25s pieces, and an open speaker turn is written out
+# at least every STREAM_EMIT_SEC, so output trails the audio by under 2s
+STREAM_READ_SAMPLES = 4000
+STREAM_EMIT_SEC = 1.0
+# The streaming VAD noise floor comes from the last minute of frames
+STREAM_VAD_HISTORY_FRAMES = 2000
+
+# Online clustering for --stream: a window whose best centroid similarity is
+# below STREAM_NEW_SPEAKER_COSINE starts a new speaker; centroids closer than
+# STREAM_MERGE_COSINE merge; a speaker whose recent windows form two groups
+# further apart than STREAM_SPLIT_COSINE splits. Centroids are running means
+# over at most STREAM_CENTROID_MAX_COUNT windows, so they follow drift.
+STREAM_NEW_SPEAKER_COSINE = 0.45
+STREAM_MERGE_COSINE = 0.75
+STREAM_SPLIT_COSINE = 0.45
+STREAM_CENTROID_MAX_COUNT = 200
+STREAM_CLUSTER_MEMORY = 64
+
+
+def peak_rss_mb():
+    """Peak resident set size of this process so far, in MB."""
+    import resource
+
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is bytes on macOS and kilobytes on Linux
+    return peak / (1024 * 1024 if sys.platform == "darwin" else 1024)
+
+
+@contextlib.contextmanager
+def stage(timings, name):
+    """Record the enclosed block as stage name in timings, if timings is a dict.
+
+    timings[name] accumulates "wall_sec" and "cpu_sec" (this process, all
+    threads) over every entry into the stage, and holds the process's
+    "peak_rss_mb" high-water mark at its latest exit. Stages may nest.
+    """
+    if timings is None:
+        yield
+        return
+    wall = time.perf_counter()
+    cpu = time.process_time()
+    try:
+        yield
+    finally:
+        entry = timings.setdefault(name, {"wall_sec": 0.0, "cpu_sec": 0.0, "peak_rss_mb": 0.0})
+        entry["wall_sec"] += time.perf_counter() - wall
+        entry["cpu_sec"] += time.process_time() - cpu
+        entry["peak_rss_mb"] = max(entry["peak_rss_mb"], peak_rss_mb())
+
+
+def merge_timings(timings, other):
+    """Add the stages of other into timings (summing times, taking the larger peak RSS)."""
+    for name, entry in other.items():
+        total = timings.setdefault(name, {"wall_sec": 0.0, "cpu_sec": 0.0, "peak_rss_mb": 0.0})
+        total["wall_sec"] += entry["wall_sec"]
+        total["cpu_sec"] += entry["cpu_sec"]
+        total["peak_rss_mb"] = max(total["peak_rss_mb"], entry["peak_rss_mb"])
+    return timings
+
+
+def format_timings(timings):
+    """Human-readable table of stage timings, one line per stage."""
+    lines = [f"  {'Stage':<18} {'Wall (s)':>9} {'CPU (s)':>9} {'Peak RSS (MB)':>14}"]
+    for name, entry in timings.items():
+        lines.append(f"  {name:<18} {entry['wall_sec']:>9.3f} {entry['cpu_sec']:>9.3f} "
+                     f"{entry['peak_rss_mb']:>14.1f}")
+    return "\n".join(lines)
+
+
+def round_timings(timings):
+    """Timings rounded for JSON output, in stage order of first use."""
+    return {
+        name: {
+            "wall_sec": round(entry["wall_sec"], 4),
+            "cpu_sec": round(entry["cpu_sec"], 4),
+            "peak_rss_mb": round(entry["peak_rss_mb"], 1),
+        }
+        for name, entry in timings.items()
+    }
+
+
+class Progress:
+    """Time-throttled progress reporting for the diarization stages.
+
+    Called as progress(stage, done, total, audio_sec) by the embedding loops
+    after every batch (done and total in windows, audio_sec the seconds of
+    audio covered so far), and as progress(stage) when a stage without
+    countable work starts. Updates less than interval apart are dropped,
+    except the one that completes a stage, so per-batch calls cost almost
+    nothing.
+
+    Kept updates go to records, a text stream of JSON lines:
+      {"event": "stage", "stage", "elapsed_sec"} when a stage starts
+      {"event": "progress", "stage", "done", "total", "percent",
+       "elapsed_sec", "eta_sec", "audio_sec", "audio_sec_per_sec"}
+    plus any extra fields (e.g. the batch entry). With console, stderr also
+    shows a percentage line, redrawn in place on a terminal, or a single
+    summary line per stage when stderr is a pipe or file.
+    """
+
+    def __init__(self, records=None, console=True, interval=PROGRESS_INTERVAL_SEC, fields=None):
+        self.records = records
+        self.console = console
+        self.interval = interval
+        self.fields = fields or {}
+        self.stage = None
+        self.started = self.last = self.created = time.perf_counter()
+
+    def __call__(self, stage_name, done=0, total=0, audio_sec=None):
+        now = time.perf_counter()
+        if stage_name != self.stage:
+            self.stage, self.started, self.last = stage_name, now, float("-inf")
+            self._record({"event": "stage", "stage": stage_name,
+                          "elapsed_sec": round(now - self.created, 3)})
+        finished = done >= total
+        if total <= 0 or (not finished and now - self.last < self.interval):
+            return
+        self.last = now
+
+        elapsed = now - self.started
+        rate = done / elapsed if elapsed > 0 else 0.0
+        update = {
+            "event": "progress",
+            "stage": stage_name,
+            "done": done,
+            "total": total,
+            "percent": round(100 * done / total, 1),
+            "elapsed_sec": round(elapsed, 3),
+            "eta_sec": round((total - done) / rate, 1) if rate > 0 else None,
+            "audio_sec": None if audio_sec is None else round(audio_sec, 2),
+            "audio_sec_per_sec": round(audio_sec / elapsed, 2) if audio_sec is not None and elapsed > 0 else None,
+        }
+        self._record(update)
+        if self.console:
+            self._show(update, finished)
+
+    def _record(self, record):
+        if self.records is not None:
+            write_json_line(dict(record, **self.fields), self.records)
+
+    @staticmethod
+    def _show(update, finished):
+        label = PROGRESS_LABELS.get(update["stage"], update["stage"])
+        speed = ""
+        if update["audio_sec_per_sec"]:
+            speed = f", {update['audio_sec_per_sec']:.1f}x realtime"
+        if sys.stderr.isatty():
+            eta = ""
+            if not finished and update["eta_sec"] is not None:
+                eta = ", ETA {}:{:02d}".format(*divmod(int(update["eta_sec"]), 60))
+            print(f"\r  {label}: {int(update['percent'])}%{speed}{eta}\033[K",
+                  end="\n" if finished else "", file=sys.stderr, flush=True)
+        elif finished:
+            print(f"  {label}: {update['done']} windows in {update['elapsed_sec']:.1f}s{speed}",
+                  file=sys.stderr, flush=True)
+
+
+# torch, torchaudio, huggingface_hub and the backends are imported lazily so
+# that --help, argument errors and missing-file errors return without loading
+# them, and pyannote runs never pay for speechbrain-only patches.
+
+
+def patch_torchaudio():
+    """Restore list_audio_backends, removed in torchaudio 2.9+.
+
+    Must run before speechbrain or pyannote import torchaudio-dependent modules.
+    """
+    import torchaudio
+    if not hasattr(torchaudio, 'list_audio_backends'):
+        torchaudio.list_audio_backends = lambda: []
+    return torchaudio
+
+
+def patch_huggingface_hub():
+    """Translate speechbrain's deprecated use_auth_token into token.
+
+    speechbrain 1.0.3 still passes use_auth_token to hf_hub_download and
+    snapshot_download. Safe to call more than once.
+    """
+    from functools import wraps
+    import huggingface_hub
+
+    def accept_use_auth_token(download):
+        if getattr(download, "_accepts_use_auth_token", False):
+            return download
+
+        @wraps(download)
+        def patched(*args, **kwargs):
+            if 'use_auth_token' in kwargs:
+                kwargs['token'] = kwargs.pop('use_auth_token')
+            return download(*args, **kwargs)
+
+        patched._accepts_use_auth_token = True
+        return patched
+
+    huggingface_hub.hf_hub_download = accept_use_auth_token(huggingface_hub.hf_hub_download)
+    huggingface_hub.snapshot_download = accept_use_auth_token(huggingface_hub.snapshot_download)
+    return huggingface_hub
+
 
-_original_download = huggingface_hub.hf_hub_download
+@contextlib.contextmanager
+def hub_offline():
+    """Make huggingface_hub serve only locally cached files while active.
 
+    huggingface_hub checks constants.HF_HUB_OFFLINE on every request, so this
+    also covers downloads made inside speechbrain and pyannote.
+    """
+    from huggingface_hub import constants
+
+    previous = constants.HF_HUB_OFFLINE
+    constants.HF_HUB_OFFLINE = True
+    try:
+        yield
+    finally:
+        constants.HF_HUB_OFFLINE = previous
+
+
+def local_first(load, name):
+    """Call load() offline against the local HuggingFace cache, then online on a miss.
+
+    A cached snapshot loads without any network round trip; only a missing
+    (or incomplete) one is downloaded. Errors from the online attempt propagate.
+    """
+    try:
+        with hub_offline():
+            return load()
+    except Exception:
+        print(f"  {name} not cached locally, downloading...", file=sys.stderr, flush=True)
+        return load()
+
+
+class ModelRegistry:
+    """Local-first model checkpoints, converted once to a memory-mappable layout.
+
+    Checkpoints are resolved from the local HuggingFace cache before the
+    network (see local_first). The first load of a checkpoint unpickles it
+    and saves its tensors in torch's weights-only zip layout under model_dir,
+    named by a hash of the checkpoint's real path, size and mtime; later loads
+    memory-map that file, so weights are paged in as the model touches them
+    rather than copied into RAM up front.
+    """
+
+    def __init__(self, model_dir=DEFAULT_MODEL_DIR):
+        self.model_dir = model_dir
 
-@wraps(_original_download)
-def _patched_download(*args, **kwargs):
-    if 'use_auth_token' in kwargs:
-        kwargs['token'] = kwargs.pop('use_auth_token')
-    return _original_download(*args, **kwargs)
+    def checkpoint(self, repo_id, filename, token=None):
+        """Local path of filename in the repo_id snapshot, downloading only if absent."""
+        hf_hub_download = patch_huggingface_hub().hf_hub_download
+        return local_first(lambda: hf_hub_download(repo_id, filename, token=token), repo_id)
 
+    def checkpoint_id(self, checkpoint):
+        """Identity of a checkpoint file: a hash of its real path, size and mtime."""
+        import hashlib
 
-huggingface_hub.hf_hub_download = _patched_download
+        real_path = os.path.realpath(checkpoint)
+        stat = os.stat(real_path)
+        digest = hashlib.blake2b(digest_size=20)
+        digest.update(json.dumps(
+            [real_path, stat.st_size, stat.st_mtime_ns, MODEL_FORMAT_VERSION]
+        ).encode())
+        return digest.hexdigest()
 
-_original_snapshot = huggingface_hub.snapshot_download
+    def converted_path(self, checkpoint):
+        return os.path.join(self.model_dir, f"{self.checkpoint_id(checkpoint)}.pt")
 
+    def state_dict(self, checkpoint):
+        """Memory-mapped state dict of a checkpoint, converting it on first use.
 
-@wraps(_original_snapshot)
-def _patched_snapshot(*args, **kwargs):
-    if 'use_auth_token' in kwargs:
-        kwargs['token'] = kwargs.pop('use_auth_token')
-    return _original_snapshot(*args, **kwargs)
+        If the converted copy cannot be written the checkpoint is loaded
+        directly, as before.
+        """
+        import tempfile
+        import torch
 
+        path = self.converted_path(checkpoint)
+        try:
+            return torch.load(path, map_location="cpu", mmap=True, weights_only=True)
+        except (OSError, RuntimeError, EOFError):
+            pass
 
-huggingface_hub.snapshot_download = _patched_snapshot
+        state = torch.load(checkpoint, map_location="cpu", weights_only=False)
+        state = {name: tensor.contiguous() for name, tensor in state.items()}
+        try:
+            os.makedirs(self.model_dir, exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=self.model_dir, suffix=".tmp")
+            with os.fdopen(fd, "wb") as f:
+                torch.save(state, f)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            print(f"  Warning: could not write converted model: {e}", file=sys.stderr)
+            return state
+        return torch.load(path, map_location="cpu", mmap=True, weights_only=True)
 
 
 def get_device(requested_device="auto"):
@@ -117,27 +544,46 @@ def get_device(requested_device="auto"):
         return torch.device("cpu")
 
 
-def diarize_pyannote(audio_file, token, device):
-    """Diarize using pyannote-audio (requires HuggingFace token).
+def load_pyannote_pipeline(token, device):
+    """Load the pyannote diarization pipeline onto a device.
 
     Args:
-        audio_file: Path to the audio file
         token: HuggingFace token for model access
         device: torch.device to run inference on
+
+    Returns:
+        pyannote Pipeline, or an error dict if pyannote.audio is not installed
     """
+    patch_torchaudio()
     try:
         from pyannote.audio import Pipeline
     except ImportError:
         return {"error": "pyannote.audio not installed", "help": "Run: pip install pyannote.audio"}
 
     print("  Loading pyannote model...", file=sys.stderr, flush=True)
-    pipeline = Pipeline.from_pretrained(
-        "pyannote/speaker-diarization-3.1",
-        token=token
+    pipeline = local_first(
+        lambda: Pipeline.from_pretrained("pyannote/speaker-diarization-3.1", token=token),
+        "pyannote/speaker-diarization-3.1"
     )
 
     # Move pipeline to specified device for GPU acceleration
     pipeline.to(device)
+    return pipeline
+
+
+def diarize_pyannote(audio_file, token, device, pipeline=None):
+    """Diarize using pyannote-audio (requires HuggingFace token).
+
+    Args:
+        audio_file: Path to the audio file
+        token: HuggingFace token for model access
+        device: torch.device to run inference on
+        pipeline: Preloaded pipeline from load_pyannote_pipeline (loaded if None)
+    """
+    if pipeline is None:
+        pipeline = load_pyannote_pipeline(token, device)
+        if isinstance(pipeline, dict):
+            return pipeline
 
     print("  Running diarization...", file=sys.stderr, flush=True)
     result = pipeline(audio_file)
@@ -160,38 +606,51 @@ def diarize_pyannote(audio_file, token, device):
     return segments
 
 
-def diarize_speechbrain(audio_file, device, num_speakers=None):
-    """Diarize using speechbrain (no token required, Apache 2.0 license).
+def speechbrain_checkpoint(registry=None):
+    """Local path of the ECAPA-TDNN checkpoint load_speechbrain_model loads."""
+    registry = registry or ModelRegistry()
+    return registry.checkpoint(SPEECHBRAIN_MODEL_ID, 'embedding_model.ckpt')
 
-    Uses ECAPA-TDNN embeddings + spectral clustering for speaker identification.
+
+@functools.lru_cache(maxsize=None)
+def speechbrain_checkpoint_id():
+    """ModelRegistry.checkpoint_id of the default checkpoint, looked up once per process."""
+    registry = ModelRegistry()
+    return registry.checkpoint_id(speechbrain_checkpoint(registry))
+
+
+def load_speechbrain_model(device, registry=None):
+    """Load the ECAPA-TDNN speaker embedding model and its Fbank front end.
 
     Args:
-        audio_file: Path to the audio file
         device: torch.device to run inference on
-        num_speakers: Optional number of speakers (auto-detected if not specified)
+        registry: ModelRegistry to resolve and convert the checkpoint with
+            (default: one under DEFAULT_MODEL_DIR)
+
+    Returns:
+        (model, compute_features) ready for embed_window_spans
     """
     import torch
-    import numpy as np
-    from sklearn.cluster import SpectralClustering, AgglomerativeClustering
-    from huggingface_hub import hf_hub_download
+    patch_torchaudio()
     from speechbrain.lobes.models.ECAPA_TDNN import ECAPA_TDNN
     from speechbrain.lobes.features import Fbank
 
-    # Download and load the ECAPA-TDNN model directly (avoids custom.py issue)
+    # Load the ECAPA-TDNN checkpoint directly (avoids custom.py issue)
     print("  Loading speechbrain model...", file=sys.stderr, flush=True)
-    embedding_path = hf_hub_download('speechbrain/spkrec-ecapa-voxceleb', 'embedding_model.ckpt')
-
-    model = ECAPA_TDNN(
-        input_size=80,
-        channels=[1024, 1024, 1024, 1024, 3072],
-        kernel_sizes=[5, 3, 3, 3, 1],
-        dilations=[1, 2, 3, 4, 1],
-        attention_channels=128,
-        lin_neurons=192
-    )
-
-    checkpoint = torch.load(embedding_path, map_location='cpu', weights_only=False)
-    model.load_state_dict(checkpoint)
+    registry = registry or ModelRegistry()
+    state = registry.state_dict(speechbrain_checkpoint(registry))
+
+    # Build without allocating weights; assign=True adopts the mapped tensors
+    with torch.device("meta"):
+        model = ECAPA_TDNN(
+            input_size=80,
+            channels=[1024, 1024, 1024, 1024, 3072],
+            kernel_sizes=[5, 3, 3, 3, 1],
+            dilations=[1, 2, 3, 4, 1],
+            attention_channels=128,
+            lin_neurons=192
+        )
+    model.load_state_dict(state, assign=True)
     model.eval()
 
     # Move model to specified device for GPU acceleration
@@ -200,238 +659,2667 @@ def diarize_speechbrain(audio_file, device, num_speakers=None):
     # Feature extractor (mel filterbanks)
     compute_features = Fbank(n_mels=80)
 
-    # Load audio
-    waveform, sample_rate = torchaudio.load(audio_file)
+    return model, compute_features
 
-    # Resample to 16kHz if needed (model expects 16kHz)
-    if sample_rate != 16000:
-        resampler = torchaudio.transforms.Resample(sample_rate, 16000)
-        waveform = resampler(waveform)
-        sample_rate = 16000
 
-    # Convert to mono if stereo
-    if waveform.shape[0] > 1:
-        waveform = torch.mean(waveform, dim=0, keepdim=True)
+# nn.Module classes defined on first use, so importing diarize.py stays torch-free
+_modules = {}
+
+
+def precision_modules():
+    """Define the reduced-precision nn.Module wrappers, once, on first use.
+
+    They subclass torch.nn.Module, so defining them at import time would import
+    torch. Module-level __getattr__ exposes them as diarize.Bf16Autocast and
+    diarize.PointwiseInt8, which is also how pickle finds them.
+
+    Returns:
+        Dict of class name to class
+    """
+    if _modules:
+        return _modules
+    import warnings
+    import torch
+
+    class Bf16Autocast(torch.nn.Module):
+        """Run a model under bfloat16 autocast and return float32 embeddings."""
+
+        def __init__(self, model):
+            super().__init__()
+            self.model = model
+
+        def forward(self, feats):
+            with torch.autocast(feats.device.type, dtype=torch.bfloat16):
+                return self.model(feats).float()
+
+    class PointwiseInt8(torch.nn.Module):
+        """A kernel-size-1 Conv1d computed as a dynamically quantized int8 Linear.
+
+        Weights are quantized once; activations are quantized per call from their
+        observed range, so no calibration data is needed.
+        """
+
+        def __init__(self, conv):
+            super().__init__()
+            linear = torch.nn.Linear(conv.in_channels, conv.out_channels, bias=conv.bias is not None)
+            with torch.no_grad():
+                linear.weight.copy_(conv.weight[:, :, 0])
+                if conv.bias is not None:
+                    linear.bias.copy_(conv.bias)
+            with warnings.catch_warnings():
+                # Eager-mode quantization is deprecated in favour of torchao
+                warnings.simplefilter("ignore")
+                from torch.ao.quantization import quantize_dynamic
+
+                self.linear = quantize_dynamic(
+                    torch.nn.Sequential(linear), {torch.nn.Linear}, dtype=torch.qint8
+                )[0]
+
+        def forward(self, x):
+            # [B, C, T] -> [B, T, C] for the matmul and back
+            return self.linear(x.transpose(1, 2)).transpose(1, 2)
+
+    for cls in (Bf16Autocast, PointwiseInt8):
+        cls.__qualname__ = cls.__name__
+        _modules[cls.__name__] = cls
+    return _modules
+
+
+def __getattr__(name):
+    if name in ("Bf16Autocast", "PointwiseInt8"):
+        return precision_modules()[name]
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def apply_precision(model, precision, device):
+    """Return the embedding model to run at precision ("fp32", "bf16" or "int8").
+
+    fp32 returns model itself. The int8 variant is a copy, so the fp32 model
+    stays usable alongside it.
+
+    Raises:
+        ValueError: Unknown precision, or int8 on a non-CPU device
+    """
+    import copy
+    import torch
+
+    if precision == "fp32":
+        return model
+    if precision == "bf16":
+        return precision_modules()["Bf16Autocast"](model)
+    if precision != "int8":
+        raise ValueError(f"Unknown precision: {precision} (expected one of {', '.join(PRECISIONS)})")
+    if str(device) != "cpu":
+        raise ValueError("int8 precision is only supported on CPU")
+
+    pointwise_int8 = precision_modules()["PointwiseInt8"]
+    quantized = copy.deepcopy(model)
+    for module in list(quantized.modules()):
+        for name, child in list(module.named_children()):
+            if (isinstance(child, torch.nn.Conv1d) and child.kernel_size == (1,)
+                    and child.groups == 1 and child.stride == (1,)):
+                setattr(module, name, pointwise_int8(child))
+    return quantized
+
+
+def model_hash(model):
+    """Hash of a module's weights and buffers, for naming compiled artifacts.
+
+    Covers every state_dict entry, including the packed weights of quantized
+    layers (tuples of quantized tensors) and non-tensor entries such as dtypes.
+    """
+    import hashlib
+    import torch
+
+    digest = hashlib.blake2b(digest_size=20)
+
+    def update(value):
+        if isinstance(value, (tuple, list)):
+            for item in value:
+                update(item)
+        elif isinstance(value, torch.Tensor):
+            if value.is_quantized:
+                value = value.dequantize()
+            digest.update(f"{value.dtype}:{tuple(value.shape)}".encode())
+            digest.update(memoryview(value.detach().cpu().contiguous().reshape(-1).view(torch.uint8).numpy()))
+        else:
+            digest.update(repr(value).encode())
+
+    digest.update(type(model).__name__.encode())
+    for name, value in sorted(model.state_dict().items()):
+        digest.update(name.encode())
+        update(value)
+    return digest.hexdigest()
+
+
+class CompiledModel:
+    """ECAPA-TDNN compiled ahead of time with AOTInductor for one batch shape.
+
+    The first full batch exports the model at its exact [batch, frames, mels]
+    shape and compiles it into a package under compile_dir, named by torch
+    version, device, shape and a hash of the weights. Later runs, including
+    other processes, load that package instead of compiling again. Partial
+    batches at least COMPILE_MIN_FILL full are zero-padded to the compiled
+    shape; other shapes, and everything after a failed export or compile,
+    run on the eager model.
+    """
+
+    def __init__(self, model, batch_size, compile_dir=DEFAULT_COMPILE_DIR):
+        self.model = model
+        self.batch_size = batch_size
+        self.compile_dir = compile_dir
+        self.shape = None
+        self.compiled = None
+        self.failed = False
+
+    def package_path(self, feats):
+        import hashlib
+        import torch
+
+        digest = hashlib.blake2b(digest_size=20)
+        digest.update(json.dumps([
+            torch.__version__, str(feats.device), list(feats.shape), COMPILE_FORMAT_VERSION
+        ]).encode())
+        digest.update(model_hash(self.model).encode())
+        return os.path.join(self.compile_dir, f"{digest.hexdigest()}.pt2")
+
+    def prepare(self, feats):
+        """Load (compiling first if needed) the package for feats' shape; eager on failure."""
+        import tempfile
+        import torch
+
+        self.shape = tuple(feats.shape)
+        tmp_path = None
+        try:
+            path = self.package_path(feats)
+            if not os.path.exists(path):
+                print(f"  Compiling embedding model for batch shape {list(self.shape)} (one-off)...",
+                      file=sys.stderr, flush=True)
+                start = time.perf_counter()
+                with torch.no_grad():
+                    program = torch.export.export(self.model, (torch.zeros_like(feats),))
+                os.makedirs(self.compile_dir, exist_ok=True)
+                fd, tmp_path = tempfile.mkstemp(dir=self.compile_dir, suffix=".pt2")
+                os.close(fd)
+                torch._inductor.aoti_compile_and_package(program, package_path=tmp_path)
+                os.replace(tmp_path, path)
+                print(f"  Compiled in {time.perf_counter() - start:.1f}s", file=sys.stderr, flush=True)
+            self.compiled = torch._inductor.aoti_load_package(path)
+        except Exception as e:
+            self.failed = True
+            print(f"  Warning: could not compile embedding model, running eagerly: {e}",
+                  file=sys.stderr, flush=True)
+            if tmp_path is not None and os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+
+    def __call__(self, feats):
+        rows = feats.shape[0]
+        if self.compiled is None and not self.failed and rows == self.batch_size:
+            self.prepare(feats)
+        if (self.compiled is None or tuple(feats.shape[1:]) != self.shape[1:]
+                or not self.batch_size * COMPILE_MIN_FILL <= rows <= self.batch_size):
+            return self.model(feats)
+        if rows < self.batch_size:
+            padded = feats.new_zeros(self.shape)
+            padded[:rows] = feats
+            return self.compiled(padded)[:rows]
+        return self.compiled(feats)
+
+
+def diarize_speechbrain(audio_file, device, num_speakers=None, batch_size=DEFAULT_BATCH_SIZE,
+                        feature_cache=True, load_model=None, embedding_cache=None,
+                        clustering="auto", affinity_dtype="float64", resegment=False, vad=True,
+                        segments=None, workers=1, threads=None, precision="fp32", compile=False,
+                        model_id=None, audio=None, progress=None, timings=None):
+    """Diarize using speechbrain (no token required, Apache 2.0 license).
+
+    Uses ECAPA-TDNN embeddings + spectral clustering for speaker identification.
+
+    Args:
+        audio_file: Path to the audio file
+        device: torch.device to run inference on
+        num_speakers: Optional number of speakers (auto-detected if not specified)
+        batch_size: Number of windows embedded per forward pass
+        feature_cache: Compute filterbank frames once per batch span instead of per window
+        load_model: Callable returning (model, compute_features) already at
+            precision; defaults to load_speechbrain_model plus apply_precision.
+            Only called when embeddings are not cached.
+        embedding_cache: Optional EmbeddingCache; a hit skips straight to clustering
+        clustering: "auto", "dense" or "two-stage" (see cluster_embeddings)
+        affinity_dtype: "float64" or "float32" for the dense affinity matrix
+        resegment: Vote window labels onto a 10ms frame grid for sharper boundaries
+        vad: Skip windows without speech (silence, noise, tones) before embedding
+        segments: Optional list of (start, end) seconds of transcribed speech.
+            Only windows inside these segments are embedded, and the result
+            has one segment per input segment, in input order.
+        workers: Embedding processes on CPU; above 1 the windows are sharded
+            across a process pool (see embed_parallel)
+        threads: Torch threads per embedding process when workers is above 1
+            (default: CPU count / workers)
+        precision: ECAPA-TDNN inference precision, one of PRECISIONS
+        compile: Embed through a CompiledModel; the default loader wraps its
+            model in one, a custom load_model must return one itself
+        model_id: Identity of the weights load_model returns, part of the
+            embedding cache key. Defaults to the checkpoint's ModelRegistry id
+            with the default loader, otherwise to a hash of the loaded weights
+            (which loads the model even on a cache hit)
+        audio: Optional (read_blocks, total_samples) already opened with open_audio
+        progress: Progress to report stages and embedding progress to
+            (default: a Progress showing a line on stderr)
+        timings: Optional dict to record per-stage wall time, CPU time and peak
+            RSS in (see stage): open, resample, cache, vad, load_model, extract
+            (containing features and embedding), cluster (containing
+            estimate_speakers) and merge
+    """
+    import numpy as np
+
+    progress = progress or Progress()
+
+    # Open audio as a stream of 16kHz mono blocks
+    with stage(timings, "open"):
+        read_blocks, total_samples = audio or open_audio(audio_file, timings=timings)
+    sample_rate = 16000
 
     # Segment the audio into windows for embedding extraction
     window_size = 1.5  # seconds
     hop_size = 0.75    # seconds (50% overlap)
     window_samples = int(window_size * sample_rate)
     hop_samples = int(hop_size * sample_rate)
+    batch_size = max(1, int(batch_size))
+
+    def default_model():
+        model, compute_features = load_speechbrain_model(device)
+        model = apply_precision(model, precision, device)
+        return CompiledModel(model, batch_size) if compile else model, compute_features
+
+    loaded = []
+
+    def get_model():
+        if not loaded:
+            with stage(timings, "load_model"):
+                loaded.append((load_model or default_model)())
+        return loaded[0]
+
+    window_starts = owners = None
+    if segments is not None:
+        window_starts, owners = segment_windows(
+            segments, total_samples, window_samples, hop_samples, sample_rate
+        )
+        if len(window_starts) == 0:
+            return []
+
+    cache_key = None
+    cached = None
+    if embedding_cache is not None:
+        if model_id is None:
+            with stage(timings, "cache"):
+                if load_model is None:
+                    model_id = speechbrain_checkpoint_id()
+                else:
+                    model = get_model()[0]
+                    model_id = model_hash(model.model if isinstance(model, CompiledModel) else model)
+        params = {
+            "model": SPEECHBRAIN_MODEL_ID,
+            "model_id": model_id,
+            # Compiled kernels are not guaranteed bit-identical to eager ones
+            "compile": bool(compile),
+            "sample_rate": sample_rate,
+            "window_samples": window_samples,
+            "hop_samples": hop_samples,
+            "feature_cache": bool(feature_cache),
+            "vad": bool(vad),
+            "precision": precision,
+        }
+        if feature_cache:
+            # Shared frames at batch span edges see padding, so spans change embeddings
+            params["batch_size"] = batch_size
+        if window_starts is not None:
+            import hashlib
+            params["segment_windows"] = hashlib.blake2b(window_starts.tobytes(), digest_size=20).hexdigest()
+        with stage(timings, "cache"):
+            cache_key = embedding_cache.key_blocks(read_blocks(), params)
+            cached = embedding_cache.load(cache_key)
+
+    if cached is not None:
+        print("  Using cached embeddings", file=sys.stderr, flush=True)
+        embeddings, timestamps = cached
+    elif window_starts is not None:
+        # Transcript segments already mark the speech, so no VAD pass
+        model, compute_features = get_model()
+        progress("extract", 0, len(window_starts))
+        with stage(timings, "extract"):
+            embeddings = embed_windows_at(
+                model, compute_features, read_blocks(), window_starts, device, window_samples,
+                batch_size, progress=progress, timings=timings
+            )
+        timestamps = np.column_stack((window_starts, window_starts + window_samples)) / sample_rate
+        if cache_key is not None:
+            with stage(timings, "cache"):
+                embedding_cache.store(cache_key, embeddings, timestamps)
+    else:
+        total_windows = count_windows(total_samples, window_samples, hop_samples)
+        keep = None
+        if vad:
+            progress("vad")
+            with stage(timings, "vad"):
+                speech = detect_speech_frames(read_blocks())
+                keep = speech_windows(speech, total_windows, window_samples, hop_samples)
+            skipped = total_windows - int(keep.sum())
+            print(f"  Voice activity: skipping {skipped} of {total_windows} windows "
+                  f"({100 * skipped / max(1, total_windows):.0f}%)", file=sys.stderr, flush=True)
+            if not keep.any():
+                return []
+
+        model, compute_features = get_model()
+        progress("extract", 0, total_windows)
+        with stage(timings, "extract"):
+            if workers > 1 and str(device) == "cpu" and total_windows > batch_size:
+                print(f"  Embedding with {workers} worker processes", file=sys.stderr, flush=True)
+                embeddings, timestamps = embed_parallel(
+                    audio_file, read_blocks, model, compute_features, device, window_samples,
+                    hop_samples, sample_rate, total_windows, workers, threads=threads,
+                    batch_size=batch_size, feature_cache=feature_cache, keep=keep, progress=progress,
+                    timings=timings
+                )
+            else:
+                spans = iter_window_spans(read_blocks(), window_samples, hop_samples, batch_size)
+                embeddings, timestamps = embed_window_spans(
+                    model, compute_features, spans, device, window_samples, hop_samples, sample_rate,
+                    total_windows, feature_cache=feature_cache, keep=keep, progress=progress,
+                    timings=timings
+                )
+        if cache_key is not None and len(embeddings) > 0:
+            with stage(timings, "cache"):
+                embedding_cache.store(cache_key, embeddings, timestamps)
+
+    if len(embeddings) == 0:
+        return []
 
-    total_samples = waveform.shape[1]
+    progress("cluster")
+    with stage(timings, "cluster"):
+        labels = cluster_embeddings(
+            embeddings, num_speakers, method=clustering, affinity_dtype=affinity_dtype,
+            timings=timings
+        )
 
-    # Extract embeddings for each window
-    embeddings = []
-    timestamps = []
+    with stage(timings, "merge"):
+        if owners is not None:
+            return label_segments(segments, owners, labels)
 
-    # Calculate total windows for progress reporting
-    total_windows = max(1, (total_samples - window_samples) // hop_samples + 1)
-    window_count = 0
+        if resegment:
+            timestamps, labels = resegment_frames(timestamps, labels)
 
-    for start_sample in range(0, total_samples - window_samples + 1, hop_samples):
-        end_sample = start_sample + window_samples
-        segment = waveform[:, start_sample:end_sample]
+        # Merge adjacent segments with same speaker
+        return merge_segments(timestamps, labels)
 
-        # Get embedding: audio -> mel features -> ECAPA-TDNN -> embedding
-        with torch.no_grad():
-            # Move segment to device and compute mel filterbank features
-            segment_device = segment.to(device)
-            feats = compute_features(segment_device)
-            # Run through ECAPA-TDNN model
-            embedding = model(feats)
-            # Move back to CPU for numpy/sklearn operations
-            embeddings.append(embedding.squeeze().cpu().numpy())
-
-        start_time = start_sample / sample_rate
-        end_time = end_sample / sample_rate
-        timestamps.append((start_time, end_time))
-
-        # Progress output to stderr
-        window_count += 1
-        progress_pct = int(100 * window_count / total_windows)
-        print(f"\r  Extracting embeddings: {progress_pct}%", end="", file=sys.stderr, flush=True)
-
-    if not embeddings:
-        return []
 
-    # Clear progress line
-    print("", file=sys.stderr)
+class EmbeddingCache:
+    """Size-bounded LRU cache of per-window embeddings on disk.
+
+    Entries are .npz files named by a hash of the 16kHz mono samples plus the
+    model and windowing parameters. Reads refresh an entry's mtime; writes
+    evict least recently used entries until the directory fits max_bytes.
+    """
 
-    embeddings = np.array(embeddings)
+    def __init__(self, cache_dir=DEFAULT_CACHE_DIR, max_bytes=DEFAULT_CACHE_MAX_MB * 1024 * 1024):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
 
-    # Estimate number of speakers if not provided
-    if num_speakers is None:
-        # Use eigenvalue analysis to estimate number of speakers
-        # Default to 2 if estimation fails
-        num_speakers = estimate_num_speakers(embeddings, max_speakers=8)
+    def key(self, waveform, params):
+        """Hash a 1-D waveform tensor and extraction parameters into a cache key."""
+        return self.key_blocks([waveform], params)
 
-    print("  Clustering speakers...", file=sys.stderr, flush=True)
-    # Cluster embeddings
-    if num_speakers == 1:
-        labels = np.zeros(len(embeddings), dtype=int)
-    else:
+    def key_blocks(self, blocks, params):
+        """Hash a stream of 1-D sample blocks and extraction parameters.
+
+        The key depends only on the concatenated samples, not on how they
+        were split into blocks.
+        """
+        import hashlib
+
+        digest = hashlib.blake2b(digest_size=20)
+        digest.update(json.dumps(
+            dict(params, version=EMBEDDING_CACHE_VERSION), sort_keys=True
+        ).encode())
+        for block in blocks:
+            # Hash the sample buffer in place rather than copying it to bytes
+            samples = block.detach().cpu().float().contiguous().numpy()
+            digest.update(memoryview(samples).cast("B"))
+        return digest.hexdigest()
+
+    def path(self, key):
+        return os.path.join(self.cache_dir, f"{key}.npz")
+
+    def load(self, key):
+        """Return (embeddings, timestamps) for key, or None on a miss."""
+        import numpy as np
+
+        path = self.path(key)
         try:
-            clustering = SpectralClustering(
-                n_clusters=num_speakers,
-                affinity='cosine',
-                random_state=42
-            )
-            labels = clustering.fit_predict(embeddings)
-        except Exception:
-            # Fallback to agglomerative clustering
-            clustering = AgglomerativeClustering(
-                n_clusters=num_speakers,
-                metric='cosine',
-                linkage='average'
-            )
-            labels = clustering.fit_predict(embeddings)
+            with np.load(path) as entry:
+                embeddings = entry["embeddings"]
+                timestamps = entry["timestamps"]
+            os.utime(path)
+        except (OSError, KeyError, ValueError):
+            return None
+        return embeddings, timestamps
+
+    def store(self, key, embeddings, timestamps):
+        """Write an entry atomically, then evict to stay within max_bytes."""
+        import numpy as np
+        import tempfile
 
-    # Merge adjacent segments with same speaker
-    segments = merge_segments(timestamps, labels)
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, suffix=".tmp")
+            with os.fdopen(fd, "wb") as f:
+                np.savez(f, embeddings=embeddings,
+                         timestamps=timestamps)
+            os.replace(tmp_path, self.path(key))
+        except OSError as e:
+            print(f"  Warning: could not write embedding cache: {e}", file=sys.stderr)
+            return
+        self.evict()
+
+    def evict(self):
+        """Remove least recently used entries until the cache fits max_bytes."""
+        try:
+            entries = []
+            for name in os.listdir(self.cache_dir):
+                if name.endswith(".npz"):
+                    stat = os.stat(os.path.join(self.cache_dir, name))
+                    entries.append((stat.st_mtime, stat.st_size, name))
+        except OSError:
+            return
+
+        total = sum(size for _, size, _ in entries)
+        for _, size, name in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.unlink(os.path.join(self.cache_dir, name))
+                total -= size
+            except OSError:
+                pass
+
+
+def frame_windows(waveform, window_samples, hop_samples):
+    """Return every sliding window of a 1-D waveform as one strided view.
+
+    The result is a [N, window_samples] tensor sharing storage with the
+    waveform, so overlapping windows cost no extra memory.
 
-    return segments
+    Args:
+        waveform: 1-D tensor of samples
+        window_samples: Window length in samples
+        hop_samples: Hop between window starts in samples
+    """
+    if waveform.shape[0] < window_samples:
+        return waveform.new_empty((0, window_samples))
+    return waveform.unfold(0, window_samples, hop_samples)
 
 
-def estimate_num_speakers(embeddings, max_speakers=8):
-    """Estimate number of speakers using eigenvalue analysis."""
-    from sklearn.metrics.pairwise import cosine_similarity
-    import numpy as np
+def cached_window_features(compute_features, waveform, first_window, count,
+                           window_samples, hop_samples, device):
+    """Compute Fbank features for a run of consecutive windows in one pass.
 
-    if len(embeddings) < 2:
-        return 1
+    The linear mel filterbank is computed once over the audio span covered by
+    the windows, then each window's frame range is taken from that matrix and
+    converted to dB per window. Overlapping frames are therefore computed once
+    instead of once per window. Only frames touching a window edge differ from
+    per-window extraction (they see real neighbouring samples instead of
+    padding); resulting embeddings agree to a cosine similarity above 0.999.
+
+    Args:
+        compute_features: speechbrain Fbank instance
+        waveform: 1-D tensor of samples
+        first_window: Index of the first window in the run
+        count: Number of consecutive windows
+        window_samples: Window length in samples
+        hop_samples: Hop between window starts, a multiple of the STFT hop
+        device: torch.device to compute features on
+
+    Returns:
+        [count, frames, n_mels] tensor matching Fbank's per-window layout
+    """
+    stft_hop = compute_features.compute_STFT.hop_length
+    window_frames = window_samples // stft_hop + 1
+    hop_frames = hop_samples // stft_hop
 
-    # Compute affinity matrix
-    similarity = cosine_similarity(embeddings)
+    span_start = first_window * hop_samples
+    span_end = span_start + (count - 1) * hop_samples + window_samples
+    span = waveform[span_start:span_end].unsqueeze(0).to(device)
 
-    # Compute eigenvalues
+    fbanks = compute_features.compute_fbanks
+    log_mel = fbanks.log_mel
+    fbanks.log_mel = False
     try:
-        eigenvalues = np.linalg.eigvalsh(similarity)
-        eigenvalues = np.sort(eigenvalues)[::-1]
-
-        # Find elbow point (biggest gap in eigenvalues)
-        max_speakers = min(max_speakers, len(eigenvalues) - 1)
-        gaps = []
-        for i in range(1, max_speakers):
-            if eigenvalues[i] > 0:
-                gap = eigenvalues[i-1] / eigenvalues[i]
-                gaps.append(gap)
-            else:
-                gaps.append(float('inf'))
+        linear = compute_features(span)[0]
+    finally:
+        fbanks.log_mel = log_mel
 
-        if gaps:
-            num_speakers = np.argmax(gaps) + 1
-            num_speakers = max(2, min(num_speakers, max_speakers))
-        else:
-            num_speakers = 2
-    except Exception:
-        num_speakers = 2
+    # [count, n_mels, window_frames] view -> [count, window_frames, n_mels]
+    windows = linear.unfold(0, window_frames, hop_frames)[:count].transpose(1, 2)
+    if not log_mel:
+        return windows.contiguous()
+    # dB conversion clips to each window's own maximum, as per-window Fbank does
+    return fbanks._amplitude_to_DB(windows)
 
-    return num_speakers
 
+def supports_feature_cache(compute_features, window_samples, hop_samples):
+    """Whether window and hop align with the Fbank frame grid for caching."""
+    stft = getattr(compute_features, "compute_STFT", None)
+    if stft is None or not getattr(stft, "center", False):
+        return False
+    return window_samples % stft.hop_length == 0 and hop_samples % stft.hop_length == 0
 
-def merge_segments(timestamps, labels):
-    """Merge adjacent segments with the same speaker label."""
-    if not timestamps:
-        return []
 
-    segments = []
-    current_speaker = labels[0]
-    current_start = timestamps[0][0]
-    current_end = timestamps[0][1]
-
-    for i in range(1, len(timestamps)):
-        if labels[i] == current_speaker:
-            # Extend current segment
-            current_end = timestamps[i][1]
-        else:
-            # Save current segment and start new one
-            segments.append({
-                "start": round(current_start, 3),
-                "end": round(current_end, 3),
-                "speaker": f"SPEAKER_{current_speaker:02d}"
-            })
-            current_speaker = labels[i]
-            current_start = timestamps[i][0]
-            current_end = timestamps[i][1]
+def iter_window_spans(blocks, window_samples, hop_samples, batch_size, first_window=0):
+    """Group a stream of sample blocks into spans of consecutive windows.
 
-    # Don't forget the last segment
-    segments.append({
-        "start": round(current_start, 3),
-        "end": round(current_end, 3),
-        "speaker": f"SPEAKER_{current_speaker:02d}"
-    })
+    Each span holds up to batch_size windows: (count - 1) * hop + window
+    samples. Only the current span plus one block is held in memory, so the
+    stream can be arbitrarily long. A single in-memory block is sliced as
+    views without copying.
 
-    return segments
+    Args:
+        blocks: Iterable of 1-D sample tensors, in order
+        window_samples: Window length in samples
+        hop_samples: Hop between window starts in samples
+        batch_size: Maximum windows per span
+        first_window: Index of the window the stream starts at, when it
+            begins part-way into the audio
+
+    Yields:
+        (first_window, count, span) with span a 1-D tensor
+    """
+    import torch
 
+    span_samples = (batch_size - 1) * hop_samples + window_samples
+    advance = batch_size * hop_samples
+    buffer = None
 
-def main():
-    parser = argparse.ArgumentParser(
-        description="Speaker diarization with automatic backend selection"
-    )
-    parser.add_argument("audio_file", help="Path to audio file")
-    parser.add_argument(
-        "--backend",
-        choices=["auto", "pyannote", "speechbrain"],
-        default="auto",
-        help="Diarization backend (default: auto)"
-    )
-    parser.add_argument(
-        "--device",
-        choices=["auto", "cpu", "mps", "cuda"],
-        default="auto",
-        help="Compute device: auto, cpu, mps (Apple Silicon), cuda (default: auto)"
-    )
-    parser.add_argument(
-        "--token",
-        help="HuggingFace token for pyannote (or set HF_TOKEN env var)"
-    )
-    parser.add_argument(
-        "--num-speakers",
-        type=int,
-        help="Number of speakers (optional, auto-detected if not specified)"
+    for block in blocks:
+        buffer = block if buffer is None else torch.cat([buffer, block])
+        while buffer.shape[0] >= span_samples:
+            yield first_window, batch_size, buffer[:span_samples]
+            buffer = buffer[advance:]
+            first_window += batch_size
+
+    # Remaining windows that do not fill a whole span
+    if buffer is not None and buffer.shape[0] >= window_samples:
+        count = (buffer.shape[0] - window_samples) // hop_samples + 1
+        yield first_window, count, buffer[:(count - 1) * hop_samples + window_samples]
+
+
+def count_windows(total_samples, window_samples, hop_samples):
+    """Number of full sliding windows in total_samples."""
+    if total_samples < window_samples:
+        return 0
+    return (total_samples - window_samples) // hop_samples + 1
+
+
+def detect_speech_frames(blocks, frame_samples=VAD_FRAME_SAMPLES):
+    """Energy and spectral voice-activity detection over a stream of sample blocks.
+
+    Each frame of frame_samples is scored by its log energy, spectral flatness
+    (near 1 for broadband noise) and tonality (share of power in the four
+    strongest bins, near 1 for hold tones and beeps). Scores are computed per
+    block, so memory grows only with the number of frames.
+
+    Args:
+        blocks: Iterable of 1-D float sample tensors or arrays, in order
+        frame_samples: Frame length in samples
+
+    Returns:
+        Boolean numpy array, True for frames that look like speech
+    """
+    import numpy as np
+
+    taper = np.hanning(frame_samples).astype(np.float32)
+    energies, flatness, tonality = [], [], []
+    remainder = np.empty(0, dtype=np.float32)
+
+    for block in blocks:
+        samples = np.concatenate((remainder, np.asarray(block, dtype=np.float32)))
+        usable = len(samples) - len(samples) % frame_samples
+        remainder = samples[usable:]
+        if usable == 0:
+            continue
+        scores = vad_frame_scores(samples[:usable].reshape(-1, frame_samples), taper)
+        energies.append(scores[0])
+        flatness.append(scores[1])
+        tonality.append(scores[2])
+
+    if not energies:
+        return np.zeros(0, dtype=bool)
+
+    energy = np.concatenate(energies)
+    threshold = max(np.percentile(energy, 10) + VAD_MARGIN_DB, VAD_SILENCE_DB)
+    return (
+        (energy > threshold)
+        & (np.concatenate(flatness) < VAD_MAX_FLATNESS)
+        & (np.concatenate(tonality) < VAD_MAX_TONALITY)
     )
-    args = parser.parse_args()
 
-    if not os.path.exists(args.audio_file):
-        print(json.dumps({"error": f"File not found: {args.audio_file}"}))
-        sys.exit(1)
 
-    token = args.token or os.environ.get("HF_TOKEN") or os.environ.get("HUGGINGFACE_TOKEN")
+def vad_frame_scores(frames, taper):
+    """Log energy (dB), spectral flatness and tonality of each row of frames."""
+    import numpy as np
 
-    # Determine which backend to use
-    backend = args.backend
-    if backend == "auto":
-        backend = "pyannote" if token else "speechbrain"
+    energy = 10 * np.log10(np.mean(frames * frames, axis=1) + 1e-10)
+    power = np.abs(np.fft.rfft(frames * taper, axis=1)) ** 2 + 1e-12
+    flatness = np.exp(np.mean(np.log(power), axis=1)) / np.mean(power, axis=1)
+    top = np.partition(power, -4, axis=1)[:, -4:]
+    return energy, flatness, top.sum(axis=1) / power.sum(axis=1)
 
-    # Get the compute device
-    try:
-        device = get_device(args.device)
-    except RuntimeError as e:
-        print(json.dumps({"error": str(e)}))
-        sys.exit(1)
 
-    try:
-        if backend == "pyannote":
-            if not token:
-                print(json.dumps({
-                    "error": "HuggingFace token required for pyannote backend",
-                    "help": "Set HF_TOKEN env var or use --backend speechbrain"
-                }))
-                sys.exit(1)
-            segments = diarize_pyannote(args.audio_file, token, device)
-        else:
-            segments = diarize_speechbrain(args.audio_file, device, args.num_speakers)
+class StreamingVad:
+    """detect_speech_frames for audio that arrives piece by piece.
 
-        # Check for error dict
-        if isinstance(segments, dict) and "error" in segments:
-            print(json.dumps(segments))
-            sys.exit(1)
+    The noise floor is the 10th percentile of the last
+    STREAM_VAD_HISTORY_FRAMES frame energies rather than of the whole
+    recording, so memory stays constant over an unbounded stream.
+    """
 
-        print(json.dumps(segments))
+    def __init__(self, frame_samples=VAD_FRAME_SAMPLES, history=STREAM_VAD_HISTORY_FRAMES):
+        import collections
+        import numpy as np
 
-    except Exception as e:
-        print(json.dumps({"error": str(e)}))
+        self.frame_samples = frame_samples
+        self.taper = np.hanning(frame_samples).astype(np.float32)
+        self.remainder = np.empty(0, dtype=np.float32)
+        self.energies = collections.deque(maxlen=history)
+
+    def update(self, samples):
+        """Score the frames completed by samples; returns one bool per new frame."""
+        import numpy as np
+
+        samples = np.concatenate((self.remainder, samples))
+        usable = len(samples) - len(samples) % self.frame_samples
+        self.remainder = samples[usable:]
+        if usable == 0:
+            return np.zeros(0, dtype=bool)
+
+        energy, flatness, tonality = vad_frame_scores(
+            samples[:usable].reshape(-1, self.frame_samples), self.taper
+        )
+        self.energies.extend(energy.tolist())
+        threshold = max(np.percentile(np.fromiter(self.energies, dtype=np.float64), 10)
+                        + VAD_MARGIN_DB, VAD_SILENCE_DB)
+        return (energy > threshold) & (flatness < VAD_MAX_FLATNESS) & (tonality < VAD_MAX_TONALITY)
+
+
+def speech_windows(speech, total_windows, window_samples, hop_samples,
+                   frame_samples=VAD_FRAME_SAMPLES, min_speech=VAD_MIN_SPEECH):
+    """Mark the sliding windows that contain enough speech frames to embed.
+
+    Args:
+        speech: Boolean per-frame array from detect_speech_frames
+        total_windows: Number of sliding windows in the audio
+        window_samples: Window length in samples
+        hop_samples: Hop between window starts in samples
+        frame_samples: VAD frame length in samples
+        min_speech: Minimum fraction of a window's frames that must be speech
+
+    Returns:
+        Boolean numpy array of length total_windows
+    """
+    import numpy as np
+
+    # Speech frames before each frame boundary, so a window's count is one subtraction
+    cumulative = np.concatenate(([0], np.cumsum(speech, dtype=np.int64)))
+    starts = np.arange(total_windows, dtype=np.int64) * hop_samples
+    first = np.minimum(starts // frame_samples, len(speech))
+    last = np.minimum((starts + window_samples) // frame_samples, len(speech))
+    frames_per_window = max(1, window_samples // frame_samples)
+    return (cumulative[last] - cumulative[first]) >= min_speech * frames_per_window
+
+
+class MappedWav:
+    """Read-only memory map of the int16 samples in a PCM WAV data chunk."""
+
+    def __init__(self, audio_file, data_offset, data_size):
+        import mmap
+        import numpy as np
+
+        with open(audio_file, "rb") as f:
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if hasattr(mmap, "MADV_SEQUENTIAL"):
+            self._map.madvise(mmap.MADV_SEQUENTIAL)
+        self.data_offset = data_offset
+        self.samples = np.frombuffer(self._map, dtype="<i2", count=data_size // 2, offset=data_offset)
+
+    def __len__(self):
+        return self.samples.shape[0]
+
+    def release(self, start, stop):
+        """Let the kernel drop pages holding samples [start, stop), already consumed.
+
+        Without this, every page read stays resident and RSS grows to the
+        size of the file.
+        """
+        import mmap
+
+        if not hasattr(mmap, "MADV_DONTNEED"):
+            return
+        begin = (self.data_offset + 2 * start) // mmap.PAGESIZE * mmap.PAGESIZE
+        end = (self.data_offset + 2 * stop) // mmap.PAGESIZE * mmap.PAGESIZE
+        if end > begin:
+            self._map.madvise(mmap.MADV_DONTNEED, begin, end - begin)
+
+
+def map_pcm16_wav(audio_file, sample_rate=16000):
+    """Memory-map the samples of a canonical mono 16-bit PCM WAV file.
+
+    This is the format AudioExtractor writes (16kHz mono pcm_s16le), so the
+    common case needs no decoding or resampling at all.
+
+    Returns:
+        MappedWav over the data chunk, or None if the file is not a mono
+        16-bit PCM WAV at sample_rate
+    """
+    import struct
+
+    try:
+        file_size = os.path.getsize(audio_file)
+        with open(audio_file, "rb") as f:
+            riff, _, wave = struct.unpack("<4sI4s", f.read(12))
+            if riff != b"RIFF" or wave != b"WAVE":
+                return None
+
+            fmt = None
+            while True:
+                header = f.read(8)
+                if len(header) < 8:
+                    return None
+                chunk_id, chunk_size = struct.unpack("<4sI", header)
+                if chunk_id == b"fmt ":
+                    body = f.read(chunk_size)
+                    audio_format, channels, rate, _, _, bits = struct.unpack("<HHIIHH", body[:16])
+                    if audio_format == 0xFFFE and len(body) >= 26:
+                        # WAVE_FORMAT_EXTENSIBLE: the sub-format GUID starts with the real tag
+                        audio_format = struct.unpack("<H", body[24:26])[0]
+                    fmt = (audio_format, channels, rate, bits)
+                elif chunk_id == b"data":
+                    if fmt != (1, 1, sample_rate, 16):
+                        return None
+                    offset = f.tell()
+                    # Streamed WAVs may leave the size as a placeholder; trust the file length
+                    data_size = min(chunk_size, file_size - offset)
+                    break
+                else:
+                    f.seek(chunk_size + (chunk_size & 1), os.SEEK_CUR)
+    except (OSError, struct.error):
+        return None
+
+    if data_size < 2:
+        return None
+    return MappedWav(audio_file, offset, data_size)
+
+
+def open_audio(audio_file, block_samples=AUDIO_BLOCK_SAMPLES, timings=None):
+    """Open an audio file as a re-iterable stream of 16kHz mono blocks.
+
+    Canonical 16kHz mono s16 WAV (what AudioExtractor produces) is memory-mapped
+    and converted to float32 one block at a time, with no decoding. Other 16kHz
+    files readable by soundfile are read block by block. Either way memory
+    stays bounded however long the recording is. Anything else is decoded,
+    resampled and downmixed in memory with torchaudio and served as a single
+    block.
+
+    Args:
+        audio_file: Path to the audio file
+        block_samples: Samples per streamed block
+        timings: Optional stage timings dict; decoding records "resample"
+
+    Returns:
+        (read_blocks, total_samples): read_blocks(start=0, stop=None) returns a
+        new iterator of 1-D float32 tensors over samples [start, stop) each
+        time it is called
+    """
+    import numpy as np
+    import torch
+
+    mapped = map_pcm16_wav(audio_file)
+    if mapped is not None:
+        scale = np.float32(1.0 / 32768)
+
+        def read_mapped_blocks(start=0, stop=None):
+            stop = len(mapped) if stop is None else min(stop, len(mapped))
+            for begin in range(start, stop, block_samples):
+                end = min(begin + block_samples, stop)
+                # Same int16 -> float32 scaling as soundfile, done lazily per block
+                block = np.multiply(mapped.samples[begin:end], scale, dtype=np.float32)
+                mapped.release(begin, end)
+                yield torch.from_numpy(block)
+
+        return read_mapped_blocks, len(mapped)
+
+    try:
+        import soundfile
+        with soundfile.SoundFile(audio_file) as f:
+            streamable = f.samplerate == 16000
+            total_samples = f.frames
+    except Exception:
+        streamable = False
+
+    if streamable:
+        def read_blocks(start=0, stop=None):
+            with soundfile.SoundFile(audio_file) as f:
+                f.seek(start)
+                frames = -1 if stop is None else max(0, min(stop, f.frames) - start)
+                for block in f.blocks(blocksize=block_samples, frames=frames,
+                                      dtype='float32', always_2d=True):
+                    # Convert to mono if stereo
+                    mono = block.mean(axis=1, dtype='float32') if block.shape[1] > 1 else block[:, 0]
+                    yield torch.from_numpy(mono)
+
+        return read_blocks, total_samples
+
+    torchaudio = patch_torchaudio()
+
+    # Load audio
+    waveform, sample_rate = torchaudio.load(audio_file)
+
+    # Resample to 16kHz if needed (model expects 16kHz)
+    if sample_rate != 16000:
+        with stage(timings, "resample"):
+            resampler = torchaudio.transforms.Resample(sample_rate, 16000)
+            waveform = resampler(waveform)
+
+    # Convert to mono if stereo
+    if waveform.shape[0] > 1:
+        waveform = torch.mean(waveform, dim=0, keepdim=True)
+
+    return (lambda start=0, stop=None: iter([waveform[0][start:stop]])), waveform.shape[1]
+
+
+def embed_window_spans(model, compute_features, spans, device, window_samples, hop_samples,
+                       sample_rate, total_windows, feature_cache=True, keep=None,
+                       progress=None, timings=None):
+    """Embed the windows of each span from iter_window_spans.
+
+    Windows are taken as [B, T] strided views over the span (see
+    frame_windows) so that Fbank and ECAPA-TDNN run once per batch without
+    copying the overlapping samples, and results are copied back to the host
+    once per batch.
+
+    With feature_cache, filterbank features are computed once per span rather
+    than once per overlapping window (see cached_window_features).
+
+    Args:
+        model: Embedding model mapping [B, frames, n_mels] to [B, 1, D]
+        compute_features: Feature extractor mapping [B, T] audio to [B, frames, n_mels]
+        spans: Iterable of (first_window, count, span) tuples
+        device: torch.device to run inference on
+        window_samples: Window length in samples
+        hop_samples: Hop between window starts in samples
+        sample_rate: Sample rate of the audio
+        total_windows: Expected number of windows, for progress reporting
+        feature_cache: Share filterbank frames between overlapping windows
+        keep: Optional boolean array over all windows; windows marked False
+            (e.g. no speech) are not embedded and are left out of the result
+        progress: Optional Progress (or any callable with its signature),
+            called with "extract" after each batch
+        timings: Optional stage timings dict; records "features" and "embedding"
+
+    Returns:
+        (embeddings, timestamps): [N, D] numpy array and [N, 2] array of (start, end) seconds
+    """
+    import torch
+    import numpy as np
+
+    feature_cache = feature_cache and supports_feature_cache(
+        compute_features, window_samples, hop_samples
+    )
+    batches = []
+    indices = []
+    done = 0
+
+    for first_window, count, span in spans:
+        selected = None
+        if keep is not None:
+            selected = np.asarray(keep[first_window:first_window + count], dtype=bool)
+            if len(selected) < count:
+                selected = np.pad(selected, (0, count - len(selected)))
+
+        if selected is None or selected.any():
+            # Get embeddings: audio -> mel features -> ECAPA-TDNN -> embeddings
+            with torch.no_grad():
+                with stage(timings, "features"):
+                    if feature_cache:
+                        feats = cached_window_features(
+                            compute_features, span, 0, count, window_samples, hop_samples, device
+                        )
+                        if selected is not None:
+                            feats = feats[torch.from_numpy(selected).to(feats.device)]
+                    else:
+                        # Strided view over the span; no samples are copied here
+                        batch = frame_windows(span, window_samples, hop_samples)[:count]
+                        if selected is not None:
+                            batch = batch[torch.from_numpy(selected)]
+                        feats = compute_features(batch.to(device))
+                with stage(timings, "embedding"):
+                    embedding = model(feats)
+                    # Move back to CPU for numpy/sklearn operations, once per batch
+                    batches.append(embedding.reshape(feats.shape[0], -1).cpu().numpy())
+            window_ids = np.arange(first_window, first_window + count)
+            indices.append(window_ids if selected is None else window_ids[selected])
+
+        done += count
+        covered_sec = ((first_window + count - 1) * hop_samples + window_samples) / sample_rate
+        if progress:
+            progress("extract", done, max(total_windows, done), covered_sec)
+
+    # End with done == total even if fewer windows arrived than expected
+    if progress and 0 < done < total_windows:
+        progress("extract", done, done, covered_sec)
+
+    if not batches:
+        return np.empty((0, 0), dtype=np.float32), np.empty((0, 2), dtype=np.float64)
+
+    starts = np.concatenate(indices).astype(np.int64) * hop_samples
+    timestamps = np.column_stack((starts, starts + window_samples)) / sample_rate
+    return np.concatenate(batches), timestamps
+
+
+# Per-process state of --workers embedding processes: audio reader and model
+_shard_state = {}
+
+
+def _init_shard_worker(audio_file, model, threads):
+    """Process-pool initializer: limit threads and make audio and model available.
+
+    Forked workers inherit the parent's state (the memory-mapped or decoded
+    waveform is shared copy-on-write, and the model is not copied); spawned
+    workers reopen the audio file and receive the model pickled.
+    """
+    import torch
+
+    torch.set_num_threads(threads)
+    if "read_blocks" not in _shard_state:
+        _shard_state["read_blocks"] = open_audio(audio_file)[0]
+    if model is not None:
+        _shard_state["model"] = model
+
+
+def _embed_shard(first_window, end_window, device, window_samples, hop_samples, sample_rate,
+                 batch_size, feature_cache, keep):
+    """Embed windows [first_window, end_window) in a --workers process.
+
+    Returns:
+        (embeddings, timestamps, timings) for the shard
+    """
+    model, compute_features = _shard_state["model"]
+    blocks = _shard_state["read_blocks"](
+        first_window * hop_samples, (end_window - 1) * hop_samples + window_samples
+    )
+    spans = iter_window_spans(blocks, window_samples, hop_samples, batch_size, first_window)
+    timings = {}
+    embeddings, timestamps = embed_window_spans(
+        model, compute_features, spans, device, window_samples, hop_samples, sample_rate,
+        end_window - first_window, feature_cache=feature_cache, keep=keep, progress=None,
+        timings=timings
+    )
+    return embeddings, timestamps, timings
+
+
+def embed_parallel(audio_file, read_blocks, model, compute_features, device, window_samples,
+                   hop_samples, sample_rate, total_windows, workers, threads=None,
+                   batch_size=DEFAULT_BATCH_SIZE, feature_cache=True, keep=None,
+                   progress=None, timings=None):
+    """Shard the sliding windows across a pool of embedding processes.
+
+    Shards are contiguous runs of whole batches, so every span, and therefore
+    every embedding, is the same as in a single-process run. Each worker reads
+    only its own part of the audio: from the shared page cache for memory-mapped
+    WAVs, or from the parent's decoded waveform inherited on fork. Workers are
+    not forked while other threads are running.
+
+    Args:
+        audio_file: Path to the audio file, reopened by spawned workers
+        read_blocks: Reader from open_audio, inherited by forked workers
+        model: Embedding model
+        compute_features: Feature extractor
+        device: torch.device (CPU)
+        window_samples: Window length in samples
+        hop_samples: Hop between window starts in samples
+        sample_rate: Sample rate of the audio
+        total_windows: Number of sliding windows in the audio
+        workers: Number of processes
+        threads: Torch threads per process (default: CPU count / workers)
+        batch_size: Number of windows per forward pass
+        feature_cache: Share filterbank frames between overlapping windows
+        keep: Optional boolean array over all windows, as for embed_window_spans
+        progress: Optional progress callback, called as shards complete
+        timings: Optional stage timings dict; the workers' "features" and
+            "embedding" stages are added to it, summed across processes
+
+    Returns:
+        (embeddings, timestamps) as from embed_window_spans
+    """
+    import multiprocessing
+    import threading
+    import numpy as np
+    from concurrent.futures import ProcessPoolExecutor, as_completed
+
+    threads = threads or max(1, (os.cpu_count() or 1) // workers)
+    # Several shards per worker so progress advances and stragglers even out
+    batches = -(-total_windows // batch_size)
+    shard_batches = max(1, -(-batches // (workers * 4)))
+    bounds = [
+        (first, min(first + shard_batches * batch_size, total_windows))
+        for first in range(0, total_windows, shard_batches * batch_size)
+    ]
+
+    # Fork shares the waveform and model with the workers; elsewhere (macOS
+    # defaults to spawn) they reopen the audio and receive the model pickled.
+    # Forking while another thread runs (e.g. --batch's prefetcher decoding
+    # audio) can copy a lock it holds into the children, so use forkserver then
+    methods = multiprocessing.get_all_start_methods()
+    forking = (
+        "fork" in methods and sys.platform != "darwin" and threading.active_count() == 1
+    )
+    if forking:
+        context = multiprocessing.get_context("fork")
+    else:
+        context = multiprocessing.get_context("forkserver" if "forkserver" in methods else "spawn")
+    _shard_state.clear()
+    if forking:
+        _shard_state.update(read_blocks=read_blocks, model=(model, compute_features))
+
+    results = [None] * len(bounds)
+    try:
+        with ProcessPoolExecutor(
+            max_workers=workers, mp_context=context, initializer=_init_shard_worker,
+            initargs=(audio_file, None if forking else (model, compute_features), threads)
+        ) as pool:
+            futures = {
+                pool.submit(_embed_shard, first, end, device, window_samples, hop_samples,
+                            sample_rate, batch_size, feature_cache, keep): index
+                for index, (first, end) in enumerate(bounds)
+            }
+            done = 0
+            for future in as_completed(futures):
+                index = futures[future]
+                results[index] = future.result()
+                done += bounds[index][1] - bounds[index][0]
+                if progress:
+                    progress("extract", done, total_windows, done * hop_samples / sample_rate)
+    finally:
+        _shard_state.clear()
+
+    if timings is not None:
+        for _, _, shard_timings in results:
+            merge_timings(timings, shard_timings)
+    results = [(embeddings, timestamps) for embeddings, timestamps, _ in results if len(embeddings)]
+    if not results:
+        return np.empty((0, 0), dtype=np.float32), np.empty((0, 2), dtype=np.float64)
+    return (np.concatenate([embeddings for embeddings, _ in results]),
+            np.concatenate([timestamps for _, timestamps in results]))
+
+
+def segment_windows(segments, total_samples, window_samples, hop_samples, sample_rate):
+    """Place fixed-length embedding windows inside transcript segments.
+
+    Segments longer than a window get sliding windows from their start, plus
+    one ending exactly at their end; shorter segments get a single window
+    centred on them. Windows are clipped to the audio.
+
+    Args:
+        segments: List of (start, end) seconds
+        total_samples: Length of the audio in samples
+        window_samples: Window length in samples
+        hop_samples: Hop between windows inside a segment
+        sample_rate: Sample rate of the audio
+
+    Returns:
+        (starts, owners): window start samples, sorted, and the index of the
+        segment each window belongs to
+    """
+    import numpy as np
+
+    if total_samples < window_samples:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+
+    last_start = total_samples - window_samples
+    starts, owners = [], []
+    for index, (start, end) in enumerate(segments):
+        first = min(max(0, int(round(start * sample_rate))), total_samples)
+        stop = min(max(first, int(round(end * sample_rate))), total_samples)
+        if stop - first <= window_samples:
+            positions = [((first + stop) // 2) - window_samples // 2]
+        else:
+            positions = list(range(first, stop - window_samples + 1, hop_samples))
+            if positions[-1] + window_samples < stop:
+                positions.append(stop - window_samples)
+        starts.extend(min(max(0, p), last_start) for p in positions)
+        owners.extend([index] * len(positions))
+
+    starts = np.asarray(starts, dtype=np.int64)
+    owners = np.asarray(owners, dtype=np.int64)
+    order = np.argsort(starts, kind="stable")
+    return starts[order], owners[order]
+
+
+def iter_windows_at(blocks, starts, window_samples, batch_size):
+    """Gather windows at sorted start samples from a stream of sample blocks.
+
+    Only the samples from the current window onwards are buffered, so memory
+    stays bounded for arbitrarily long streams.
+
+    Args:
+        blocks: Iterable of 1-D sample tensors, in order
+        starts: Sorted window start samples
+        window_samples: Window length in samples
+        batch_size: Maximum windows per batch
+
+    Yields:
+        [count, window_samples] tensors of consecutive windows in starts order
+    """
+    import torch
+
+    blocks = iter(blocks)
+    buffer = torch.empty(0)
+    buffer_start = 0
+    batch = []
+
+    for start in starts:
+        start = int(start)
+        while buffer_start + buffer.shape[0] < start + window_samples:
+            block = next(blocks, None)
+            if block is None:
+                break
+            buffer = torch.cat([buffer, block])
+        # Drop samples no later window can need
+        if start > buffer_start:
+            buffer = buffer[start - buffer_start:]
+            buffer_start = start
+        window = buffer[:window_samples]
+        if window.shape[0] < window_samples:
+            window = torch.nn.functional.pad(window, (0, window_samples - window.shape[0]))
+        batch.append(window)
+        if len(batch) == batch_size:
+            yield torch.stack(batch)
+            batch = []
+
+    if batch:
+        yield torch.stack(batch)
+
+
+def embed_windows_at(model, compute_features, blocks, starts, device, window_samples,
+                     batch_size=DEFAULT_BATCH_SIZE, progress=None, timings=None, sample_rate=16000):
+    """Embed fixed-length windows at arbitrary sorted start samples.
+
+    Args:
+        model: Embedding model mapping [B, frames, n_mels] to [B, 1, D]
+        compute_features: Feature extractor mapping [B, T] audio to [B, frames, n_mels]
+        blocks: Iterable of 1-D sample tensors, in order
+        starts: Sorted window start samples
+        device: torch.device to run inference on
+        window_samples: Window length in samples
+        batch_size: Number of windows per forward pass
+        progress: Optional Progress, called with "extract" after each batch
+        timings: Optional stage timings dict; records "features" and "embedding"
+        sample_rate: Sample rate of the audio, for the progress audio position
+
+    Returns:
+        [len(starts), D] numpy array of embeddings
+    """
+    import torch
+    import numpy as np
+
+    batches = []
+    done = 0
+    for batch in iter_windows_at(blocks, starts, window_samples, max(1, int(batch_size))):
+        with torch.no_grad():
+            with stage(timings, "features"):
+                feats = compute_features(batch.to(device))
+            with stage(timings, "embedding"):
+                embedding = model(feats)
+                batches.append(embedding.reshape(batch.shape[0], -1).cpu().numpy())
+
+        done += batch.shape[0]
+        if progress:
+            progress("extract", done, len(starts), (starts[done - 1] + window_samples) / sample_rate)
+
+    if not batches:
+        return np.empty((0, 0), dtype=np.float32)
+    return np.concatenate(batches)
+
+
+def label_segments(segments, owners, labels):
+    """Give each transcript segment the majority speaker of its windows.
+
+    Args:
+        segments: List of (start, end) seconds
+        owners: Segment index of each window
+        labels: Speaker label of each window
+
+    Returns:
+        One {"start", "end", "speaker"} dict per segment, in input order
+    """
+    import numpy as np
+
+    labels = np.asarray(labels, dtype=np.int64)
+    votes = np.zeros((len(segments), int(labels.max()) + 1), dtype=np.int64)
+    np.add.at(votes, (owners, labels), 1)
+    speakers = votes.argmax(axis=1)
+
+    return [
+        {"start": round(float(start), 3), "end": round(float(end), 3),
+         "speaker": f"SPEAKER_{speaker:02d}"}
+        for (start, end), speaker in zip(segments, speakers.tolist())
+    ]
+
+
+def align_turns(turns, segments):
+    """Label transcript segments with the speaker turn they overlap most.
+
+    Used to give pyannote output the same one-per-segment shape as
+    speechbrain's --segments mode. Segments overlapping no turn take the
+    speaker of the turn with the nearest midpoint.
+
+    Args:
+        turns: List of {"start", "end", "speaker"} dicts
+        segments: List of (start, end) seconds
+
+    Returns:
+        One {"start", "end", "speaker"} dict per segment, in input order
+    """
+    import numpy as np
+
+    if not turns:
+        return []
+
+    names = sorted({turn["speaker"] for turn in turns})
+    turn_start = np.array([turn["start"] for turn in turns])
+    turn_end = np.array([turn["end"] for turn in turns])
+    turn_speaker = np.array([names.index(turn["speaker"]) for turn in turns])
+    bounds = np.asarray(segments, dtype=np.float64).reshape(-1, 2)
+
+    aligned = []
+    # Chunked so the segments x turns overlap matrix stays small
+    for chunk in np.array_split(bounds, max(1, len(bounds) // 1024 + 1)):
+        overlap = np.clip(
+            np.minimum(chunk[:, 1:2], turn_end) - np.maximum(chunk[:, 0:1], turn_start), 0, None
+        )
+        per_speaker = np.zeros((len(chunk), len(names)))
+        np.add.at(per_speaker.T, turn_speaker, overlap.T)
+        nearest = np.abs(
+            (chunk[:, 0:1] + chunk[:, 1:2]) / 2 - (turn_start + turn_end) / 2
+        ).argmin(axis=1)
+        best = np.where(per_speaker.max(axis=1) > 0, per_speaker.argmax(axis=1),
+                        turn_speaker[nearest])
+        aligned.extend(best.tolist())
+
+    return [
+        {"start": round(float(start), 3), "end": round(float(end), 3), "speaker": names[speaker]}
+        for (start, end), speaker in zip(segments, aligned)
+    ]
+
+
+def load_segments(source):
+    """Read transcript segments as (start, end) seconds from JSON.
+
+    Accepts a list of {"start", "end"} objects or [start, end] pairs, or an
+    object with such a list under "segments" (whisper's JSON output).
+
+    Args:
+        source: Path to a JSON file, "-" for stdin, or already-decoded JSON
+
+    Raises:
+        ValueError: If the input is not a segment list
+    """
+    if isinstance(source, str):
+        if source == "-":
+            data = json.load(sys.stdin)
+        else:
+            with open(source) as f:
+                data = json.load(f)
+    else:
+        data = source
+
+    if isinstance(data, dict):
+        data = data.get("segments")
+    if not isinstance(data, list):
+        raise ValueError("Segments must be a JSON list of {\"start\", \"end\"} objects")
+
+    segments = []
+    for item in data:
+        try:
+            if isinstance(item, dict):
+                segments.append((float(item["start"]), float(item["end"])))
+            else:
+                start, end = item
+                segments.append((float(start), float(end)))
+        except (KeyError, TypeError, ValueError):
+            raise ValueError(f"Invalid segment: {item!r}")
+    return segments
+
+
+def cosine_affinity(embeddings, dtype="float64"):
+    """Cosine similarity matrix of embeddings, built once as a single n x n buffer.
+
+    Args:
+        embeddings: [N, D] array
+        dtype: "float64", or "float32" to halve the matrix's memory
+    """
+    import numpy as np
+
+    embeddings = np.asarray(embeddings, dtype=dtype)
+    norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+    normalized = embeddings / np.where(norms == 0, 1, norms).astype(dtype)
+    return normalized @ normalized.T
+
+
+def spectral_labels(affinity, n_clusters):
+    """Normalised spectral clustering that works on the affinity buffer in place.
+
+    Follows sklearn's SpectralClustering (normalised Laplacian embedding,
+    then k-means), but scales the matrix to D^-1/2 A D^-1/2 in place and takes
+    the top eigenvectors with Lanczos (eigsh), so no second n x n matrix is
+    allocated. The affinity is restored before any error is raised, so callers
+    can reuse it.
+    """
+    import numpy as np
+    from scipy.sparse.linalg import eigsh
+    from sklearn.cluster import KMeans
+
+    degree = affinity.sum(axis=1)
+    if np.any(degree <= 0):
+        raise ValueError("Affinity has rows with non-positive degree")
+    scale = (1.0 / np.sqrt(degree)).astype(affinity.dtype)
+
+    affinity *= scale[:, None]
+    affinity *= scale[None, :]
+    try:
+        v0 = np.random.default_rng(42).uniform(-1, 1, affinity.shape[0]).astype(affinity.dtype)
+        _, vectors = eigsh(affinity, k=n_clusters, which='LA', v0=v0)
+    finally:
+        affinity /= scale[:, None]
+        affinity /= scale[None, :]
+
+    embedding = vectors * scale[:, None]
+    # Deterministic sign per eigenvector, as sklearn does
+    signs = np.sign(embedding[np.abs(embedding).argmax(axis=0), range(n_clusters)])
+    embedding *= np.where(signs == 0, 1, signs)
+
+    return KMeans(n_clusters=n_clusters, n_init=10, random_state=42).fit_predict(embedding)
+
+
+def cluster_dense(embeddings, num_speakers, affinity_dtype="float64"):
+    """Cluster embeddings with spectral clustering on the full cosine affinity.
+
+    One affinity matrix is computed and shared: spectral clustering scales
+    it in place, and the agglomerative fallback turns the same buffer into
+    cosine distances in place. Cost still grows quadratically with window
+    count.
+    """
+    import numpy as np
+    from sklearn.cluster import AgglomerativeClustering
+
+    if num_speakers == 1:
+        return np.zeros(len(embeddings), dtype=int)
+
+    affinity = cosine_affinity(embeddings, affinity_dtype)
+    try:
+        return spectral_labels(affinity, num_speakers)
+    except Exception:
+        # Fallback to agglomerative clustering on cosine distance (1 - similarity)
+        np.subtract(1, affinity, out=affinity)
+        np.fill_diagonal(affinity, 0)
+        np.maximum(affinity, 0, out=affinity)
+        clustering = AgglomerativeClustering(
+            n_clusters=num_speakers,
+            metric='precomputed',
+            linkage='average'
+        )
+        return clustering.fit_predict(affinity)
+
+
+def precluster(embeddings, num_centroids=TWO_STAGE_CENTROIDS):
+    """Compress embeddings into at most num_centroids k-means centroids.
+
+    Embeddings are L2-normalised first so Euclidean k-means groups by cosine
+    direction, matching the cosine affinity used downstream.
+
+    Returns:
+        (centroids, assignments): [k, D] centroids and each window's centroid index
+    """
+    import numpy as np
+    from sklearn.cluster import MiniBatchKMeans
+
+    norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+    normalized = embeddings / np.maximum(norms, 1e-12)
+
+    kmeans = MiniBatchKMeans(
+        n_clusters=min(num_centroids, len(embeddings)),
+        batch_size=2048,
+        n_init=3,
+        random_state=42
+    )
+    assignments = kmeans.fit_predict(normalized)
+    return kmeans.cluster_centers_, assignments
+
+
+def cluster_embeddings(embeddings, num_speakers=None, method="auto", max_speakers=8,
+                       affinity_dtype="float64", timings=None):
+    """Assign a speaker label to every embedding.
+
+    Methods:
+        dense     - Spectral clustering on the full n x n affinity (quadratic
+                    memory); speaker-count estimation needs no n x n matrix
+        two-stage - Pre-cluster into TWO_STAGE_CENTROIDS k-means centroids, then
+                    estimate and cluster the centroids densely; windows inherit
+                    their centroid's label
+        auto      - two-stage from TWO_STAGE_MIN_WINDOWS windows, else dense
+
+    Args:
+        embeddings: [N, D] array
+        num_speakers: Number of speakers, or None to estimate
+        method: "auto", "dense" or "two-stage"
+        max_speakers: Upper bound when estimating the speaker count
+        affinity_dtype: "float64" or "float32" for the dense affinity matrix
+        timings: Optional stage timings dict; records "estimate_speakers"
+    """
+    if method == "auto":
+        method = "two-stage" if len(embeddings) >= TWO_STAGE_MIN_WINDOWS else "dense"
+
+    points = embeddings
+    assignments = None
+    if method == "two-stage" and len(embeddings) > TWO_STAGE_CENTROIDS:
+        points, assignments = precluster(embeddings, TWO_STAGE_CENTROIDS)
+
+    # Estimate number of speakers if not provided
+    if num_speakers is None:
+        # Use eigenvalue analysis to estimate number of speakers
+        # Default to 2 if estimation fails
+        with stage(timings, "estimate_speakers"):
+            num_speakers = estimate_num_speakers(points, max_speakers=max_speakers)
+
+    print("  Clustering speakers...", file=sys.stderr, flush=True)
+    labels = cluster_dense(points, num_speakers, affinity_dtype)
+
+    if assignments is not None:
+        labels = labels[assignments]
+    return labels
+
+
+def top_similarity_eigenvalues(embeddings, k):
+    """Largest k eigenvalues of the cosine similarity matrix, in descending order.
+
+    The similarity matrix is S = X X^T for the L2-normalised [N, D]
+    embeddings X, so its non-zero eigenvalues are those of the D x D Gram
+    matrix X^T X. That is exact and costs O(N D^2) instead of building an
+    N x N matrix and decomposing it in O(N^3). Eigenvalues beyond rank D are
+    zero.
+    """
+    import numpy as np
+
+    embeddings = np.asarray(embeddings, dtype=np.float64)
+    norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+    normalized = embeddings / np.where(norms == 0, 1.0, norms)
+
+    if normalized.shape[0] > normalized.shape[1]:
+        gram = normalized.T @ normalized
+    else:
+        gram = normalized @ normalized.T
+    eigenvalues = np.linalg.eigvalsh(gram)[::-1][:k]
+
+    if len(eigenvalues) < k:
+        eigenvalues = np.concatenate([eigenvalues, np.zeros(k - len(eigenvalues))])
+    return eigenvalues
+
+
+def estimate_num_speakers(embeddings, max_speakers=8):
+    """Estimate number of speakers using eigenvalue analysis."""
+    import numpy as np
+
+    if len(embeddings) < 2:
+        return 1
+
+    try:
+        # Only the top max_speakers eigenvalues are used
+        max_speakers = min(max_speakers, len(embeddings) - 1)
+        eigenvalues = top_similarity_eigenvalues(embeddings, max_speakers)
+
+        # Find elbow point (biggest ratio between consecutive eigenvalues)
+        previous, current = eigenvalues[:-1], eigenvalues[1:]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            gaps = np.where(current > 0, previous / current, np.inf)
+
+        if len(gaps):
+            num_speakers = int(np.argmax(gaps)) + 1
+            num_speakers = max(2, min(num_speakers, max_speakers))
+        else:
+            num_speakers = 2
+    except Exception:
+        num_speakers = 2
+
+    return num_speakers
+
+
+def merge_runs(timestamps, labels):
+    """Collapse consecutive windows with the same label into runs, vectorised.
+
+    Args:
+        timestamps: [N, 2] array of (start, end) seconds per window
+        labels: N integer speaker labels
+
+    Returns:
+        (starts, ends, speakers) arrays with one entry per run
+    """
+    import numpy as np
+
+    labels = np.asarray(labels)
+    times = np.asarray(timestamps, dtype=np.float64).reshape(-1, 2)
+
+    # A run starts at window 0 and wherever the label changes
+    change = np.flatnonzero(labels[1:] != labels[:-1]) + 1
+    first = np.concatenate(([0], change))
+    last = np.concatenate((change, [len(labels)])) - 1
+
+    return times[first, 0], times[last, 1], labels[first]
+
+
+def resegment_frames(timestamps, labels, frame_sec=RESEGMENT_FRAME_SEC):
+    """Re-derive speaker turns on a fine frame grid from overlapping window labels.
+
+    Each window votes for its label on every frame it covers, weighted by a
+    triangle peaking at the window centre, and each frame takes the label
+    with the most votes. Where two windows disagree the boundary lands where
+    their weights cross instead of on a window edge, and frames no window
+    covers are left out.
+
+    Args:
+        timestamps: [N, 2] array of (start, end) seconds per window
+        labels: N integer speaker labels
+        frame_sec: Frame length in seconds
+
+    Returns:
+        (timestamps, labels) of per-speaker runs on the frame grid, suitable
+        for merge_segments
+    """
+    import numpy as np
+
+    labels = np.asarray(labels, dtype=np.int64)
+    times = np.asarray(timestamps, dtype=np.float64).reshape(-1, 2)
+    if len(labels) == 0:
+        return times, labels
+
+    first = np.rint(times[:, 0] / frame_sec).astype(np.int64)
+    half = np.maximum(1, np.rint((times[:, 1] - times[:, 0]) / frame_sec).astype(np.int64) // 2)
+    num_frames = int((first + 2 * half).max())
+
+    # A triangle 1, 2, .., half, half, .., 2, 1 is four impulses in its second
+    # difference, so all windows are drawn at once by scattering impulses and
+    # integrating twice
+    votes = np.zeros((int(labels.max()) + 1, num_frames + 2), dtype=np.int32)
+    np.add.at(votes, (labels, first), 1)
+    np.add.at(votes, (labels, first + half), -1)
+    np.add.at(votes, (labels, first + half + 1), -1)
+    np.add.at(votes, (labels, first + 2 * half + 1), 1)
+    np.cumsum(votes, axis=1, out=votes)
+    np.cumsum(votes, axis=1, out=votes)
+
+    frame_labels = votes[:, :num_frames].argmax(axis=0)
+    frame_labels[votes[:, :num_frames].max(axis=0) == 0] = -1
+    del votes
+
+    change = np.flatnonzero(frame_labels[1:] != frame_labels[:-1]) + 1
+    run_first = np.concatenate(([0], change))
+    run_end = np.concatenate((change, [num_frames]))
+    speakers = frame_labels[run_first]
+    voiced = speakers >= 0
+
+    run_times = np.column_stack((run_first[voiced], run_end[voiced])) * frame_sec
+    return run_times, speakers[voiced]
+
+
+def merge_segments(timestamps, labels):
+    """Merge adjacent segments with the same speaker label."""
+    if len(timestamps) == 0:
+        return []
+
+    starts, ends, speakers = merge_runs(timestamps, labels)
+    return [
+        {"start": round(start, 3), "end": round(end, 3), "speaker": f"SPEAKER_{speaker:02d}"}
+        for start, end, speaker in zip(starts.tolist(), ends.tolist(), speakers.tolist())
+    ]
+
+
+def diarize_file(audio_file, backend="auto", device_name="auto", token=None, num_speakers=None,
+                 batch_size=DEFAULT_BATCH_SIZE, feature_cache=True, models=None,
+                 embedding_cache=None, clustering="auto", affinity_dtype="float64",
+                 resegment=False, vad=True, segments=None, workers=1, threads=None, precision="fp32",
+                 compile=False, audio=None, progress=None, timings=None):
+    """Diarize one audio file, returning segments or an error dict.
+
+    Args:
+        audio_file: Path to the audio file
+        backend: "auto", "pyannote" or "speechbrain"
+        device_name: One of "auto", "cpu", "mps", "cuda"
+        token: HuggingFace token (falls back to HF_TOKEN / HUGGINGFACE_TOKEN)
+        num_speakers: Optional number of speakers (speechbrain only)
+        batch_size: Windows per embedding forward pass (speechbrain only)
+        feature_cache: Share filterbank frames between windows (speechbrain only)
+        models: Optional dict used to keep loaded models between calls,
+            keyed by (backend, device), plus (backend, device, precision)
+            for reduced-precision variants of the speechbrain model and a
+            trailing "compiled-b<batch_size>" for compiled ones
+        embedding_cache: Optional EmbeddingCache (speechbrain only)
+        clustering: "auto", "dense" or "two-stage" (speechbrain only)
+        affinity_dtype: "float64" or "float32" affinity matrix (speechbrain only)
+        resegment: Frame-level resegmentation of window labels (speechbrain only)
+        vad: Skip windows without speech before embedding (speechbrain only)
+        segments: Optional list of (start, end) seconds of transcribed speech;
+            the result then has one labelled segment per input segment
+        workers: Embedding processes on CPU (speechbrain only)
+        threads: Torch threads per embedding process with workers (speechbrain only)
+        precision: "fp32", "bf16" or "int8" embedding inference (speechbrain only)
+        compile: Run embedding batches through a CompiledModel (speechbrain
+            only, single process; ignored with workers above 1 and with int8
+            precision, which cannot be exported)
+        audio: Optional pre-opened open_audio result (speechbrain only)
+        progress: Optional Progress for stage and embedding progress (speechbrain only)
+        timings: Optional dict to record per-stage timings in (see stage)
+    """
+    if not os.path.exists(audio_file):
+        return {"error": f"File not found: {audio_file}"}
+
+    token = token or os.environ.get("HF_TOKEN") or os.environ.get("HUGGINGFACE_TOKEN")
+
+    # Determine which backend to use
+    if backend == "auto":
+        backend = "pyannote" if token else "speechbrain"
+
+    # Get the compute device
+    try:
+        device = get_device(device_name)
+    except RuntimeError as e:
+        return {"error": str(e)}
+
+    if models is None:
+        models = {}
+    key = (backend, str(device))
+
+    try:
+        if backend == "pyannote":
+            if not token:
+                return {
+                    "error": "HuggingFace token required for pyannote backend",
+                    "help": "Set HF_TOKEN env var or use --backend speechbrain"
+                }
+            if key not in models:
+                with stage(timings, "load_model"):
+                    pipeline = load_pyannote_pipeline(token, device)
+                if isinstance(pipeline, dict):
+                    return pipeline
+                models[key] = pipeline
+            with stage(timings, "diarize"):
+                turns = diarize_pyannote(audio_file, token, device, pipeline=models[key])
+            if segments is not None and isinstance(turns, list):
+                return align_turns(turns, segments)
+            return turns
+
+        # torch.export cannot trace the packed weights of int8's quantized layers
+        use_compile = compile and workers <= 1 and precision != "int8"
+
+        def load_model():
+            if key not in models:
+                models[key] = load_speechbrain_model(device)
+            variant = key
+            if precision != "fp32":
+                variant = key + (precision,)
+                if variant not in models:
+                    model, compute_features = models[key]
+                    models[variant] = (apply_precision(model, precision, device), compute_features)
+            if use_compile:
+                batch = max(1, int(batch_size))
+                compiled = variant + (f"compiled-b{batch}",)
+                if compiled not in models:
+                    model, compute_features = models[variant]
+                    models[compiled] = (CompiledModel(model, batch), compute_features)
+                variant = compiled
+            return models[variant]
+
+        return diarize_speechbrain(
+            audio_file, device, num_speakers,
+            batch_size=batch_size, feature_cache=feature_cache,
+            load_model=load_model, embedding_cache=embedding_cache,
+            clustering=clustering, affinity_dtype=affinity_dtype, resegment=resegment,
+            vad=vad, segments=segments, workers=workers, threads=threads, precision=precision,
+            compile=use_compile,
+            model_id=speechbrain_checkpoint_id() if embedding_cache is not None else None,
+            audio=audio, progress=progress, timings=timings
+        )
+    except Exception as e:
+        return {"error": str(e)}
+
+
+class OnlineClusterer:
+    """Incremental speaker clustering of a stream of embeddings.
+
+    Each speaker is a running-mean centroid of unit embeddings plus its last
+    STREAM_CLUSTER_MEMORY embeddings. A window joins its most similar speaker,
+    or starts a new one when none is close enough. Speakers whose centroids
+    converge are merged, and a speaker whose recent windows fall into two
+    distinct groups is split. Memory is bounded by max_speakers.
+    """
+
+    def __init__(self, max_speakers=8, new_speaker=STREAM_NEW_SPEAKER_COSINE,
+                 merge=STREAM_MERGE_COSINE, split=STREAM_SPLIT_COSINE,
+                 max_count=STREAM_CENTROID_MAX_COUNT, memory=STREAM_CLUSTER_MEMORY):
+        self.max_speakers = max_speakers
+        self.new_speaker = new_speaker
+        self.merge_cosine = merge
+        self.split_cosine = split
+        self.max_count = max_count
+        self.memory = memory
+        self.centroids = {}
+        self.counts = {}
+        self.recent = {}
+        self.next_id = 0
+
+    def assign(self, embedding):
+        """Add one embedding and return (speaker id, events).
+
+        Events are ("merge", absorbed, into) and ("split", speaker, new)
+        tuples for changes made by this update. A merged-away id is never
+        returned again.
+        """
+        import numpy as np
+
+        x = np.asarray(embedding, dtype=np.float64).ravel()
+        x = x / max(np.linalg.norm(x), 1e-12)
+
+        speaker, similarity = self._nearest(x)
+        if speaker is None or (similarity < self.new_speaker and len(self.centroids) < self.max_speakers):
+            speaker = self._add(x)
+        self._update(speaker, x)
+
+        events = self._merge(speaker)
+        if events:
+            speaker = events[-1][2]
+        elif self.counts[speaker] % 16 == 0:
+            # Splitting needs a two-means pass, so only check every 16 windows
+            events = self._split(speaker)
+            if events and self._similarity(self.centroids[events[0][2]], x) > \
+                    self._similarity(self.centroids[speaker], x):
+                speaker = events[0][2]
+        return speaker, events
+
+    @staticmethod
+    def _similarity(centroid, x):
+        import numpy as np
+
+        return float(centroid @ x) / max(float(np.linalg.norm(centroid)), 1e-12)
+
+    def _nearest(self, x, exclude=None):
+        best, best_similarity = None, -1.0
+        for speaker, centroid in self.centroids.items():
+            similarity = self._similarity(centroid, x)
+            if speaker != exclude and similarity > best_similarity:
+                best, best_similarity = speaker, similarity
+        return best, best_similarity
+
+    def _add(self, centroid, count=0, recent=()):
+        import collections
+
+        speaker = self.next_id
+        self.next_id += 1
+        self.centroids[speaker] = centroid.copy()
+        self.counts[speaker] = count
+        self.recent[speaker] = collections.deque(recent, maxlen=self.memory)
+        return speaker
+
+    def _update(self, speaker, x):
+        self.counts[speaker] += 1
+        self.centroids[speaker] += (x - self.centroids[speaker]) / min(self.counts[speaker], self.max_count)
+        self.recent[speaker].append(x)
+
+    def _remove(self, speaker):
+        del self.centroids[speaker], self.counts[speaker], self.recent[speaker]
+
+    def _merge(self, speaker):
+        """Fold speaker into its nearest neighbour, or it into speaker, when they converge."""
+        import numpy as np
+
+        other, _ = self._nearest(self.centroids[speaker], exclude=speaker)
+        if other is None:
+            return []
+        a, b = self.centroids[speaker], self.centroids[other]
+        if float(a @ b) / max(float(np.linalg.norm(a) * np.linalg.norm(b)), 1e-12) < self.merge_cosine:
+            return []
+
+        # The speaker with more history keeps its id
+        into, absorbed = (other, speaker) if self.counts[other] >= self.counts[speaker] else (speaker, other)
+        total = self.counts[into] + self.counts[absorbed]
+        weight = min(total, self.max_count)
+        self.centroids[into] = (
+            self.centroids[into] * self.counts[into] + self.centroids[absorbed] * self.counts[absorbed]
+        ) / total
+        self.counts[into] = weight
+        self.recent[into].extend(self.recent[absorbed])
+        self._remove(absorbed)
+        return [("merge", absorbed, into)]
+
+    def _split(self, speaker):
+        """Split speaker in two when its recent windows form two distant groups."""
+        import collections
+        import numpy as np
+
+        if len(self.recent[speaker]) < self.memory or len(self.centroids) >= self.max_speakers:
+            return []
+        points = np.stack(self.recent[speaker])
+
+        # Two-means seeded with the point furthest from the centroid and the one furthest from it
+        first = points[np.argmin(points @ self.centroids[speaker])]
+        second = points[np.argmin(points @ first)]
+        centers = np.stack((first, second))
+        for _ in range(10):
+            side = np.argmax(points @ centers.T, axis=1)
+            if side.min() == side.max():
+                return []
+            centers = np.stack([points[side == k].mean(axis=0) for k in (0, 1)])
+
+        sizes = np.bincount(side, minlength=2)
+        norms = np.linalg.norm(centers, axis=1)
+        if sizes.min() < self.memory // 4 or centers[0] @ centers[1] / norms.prod() >= self.split_cosine:
+            return []
+
+        # The group holding the latest window keeps the id
+        keep = side[-1]
+        share = sizes[1 - keep] / len(points)
+        moved = int(round(self.counts[speaker] * share))
+        new = self._add(centers[1 - keep], moved, points[side != keep])
+        self.centroids[speaker] = centers[keep].copy()
+        self.counts[speaker] -= moved
+        self.recent[speaker] = collections.deque(points[side == keep], maxlen=self.memory)
+        return [("split", speaker, new)]
+
+
+def diarize_stream(stream, device, load_model=None, max_speakers=8, vad=True, out=None,
+                   sample_rate=16000):
+    """Diarize 16kHz mono s16le PCM as it arrives, writing speaker turns as JSON lines.
+
+    Windows of 1.5s every 0.75s are embedded as soon as their last sample
+    arrives, labelled by an OnlineClusterer, and each window's central 0.75s
+    is attributed to its speaker. Output lines are either turns,
+    {"start", "end", "speaker"}, or clustering events, {"event": "merge",
+    "speaker", "into"} (earlier turns of speaker belong to into) and
+    {"event": "split", "speaker", "new"}. A turn still in progress is written
+    out every STREAM_EMIT_SEC, so consecutive lines may continue the same
+    speaker. Only the current window, the VAD history and the clusterer are
+    kept, so memory does not grow with the length of the stream.
+
+    Args:
+        stream: Binary file object (e.g. sys.stdin.buffer) of PCM samples
+        device: torch.device to run inference on
+        load_model: Callable returning (model, compute_features); defaults to
+            load_speechbrain_model
+        max_speakers: Most speakers tracked at once
+        vad: Skip windows without speech
+        out: Text stream for the JSON lines (default: stdout)
+        sample_rate: Sample rate of the PCM
+
+    Returns:
+        Number of turn lines written
+    """
+    import numpy as np
+    import torch
+
+    out = out or sys.stdout
+    window_samples = int(1.5 * sample_rate)
+    hop_samples = int(0.75 * sample_rate)
+    margin = (window_samples - hop_samples) / 2 / sample_rate
+    model, compute_features = (load_model or (lambda: load_speechbrain_model(device)))()
+    clusterer = OnlineClusterer(max_speakers=max_speakers)
+    detector = StreamingVad() if vad else None
+    # read1 returns whatever is available instead of blocking for a full read
+    read = stream.read1 if hasattr(stream, "read1") else stream.read
+
+    def write(record):
+        write_json_line(record, out)
+
+    def name(speaker):
+        return f"SPEAKER_{speaker:02d}"
+
+    # buffer holds samples from buffer_start; speech holds VAD flags from frame
+    # buffer_start // VAD_FRAME_SAMPLES (hops are whole frames)
+    buffer = np.empty(0, dtype=np.float32)
+    speech = np.empty(0, dtype=bool)
+    buffer_start = 0
+    leftover = b""
+    turn = None  # [start, end, speaker] not yet written
+    written = 0
+
+    def close_turn():
+        nonlocal turn, written
+        if turn is not None and turn[1] > turn[0]:
+            write({"start": round(turn[0], 3), "end": round(turn[1], 3), "speaker": name(turn[2])})
+            written += 1
+        turn = None
+
+    print("  Streaming diarization: reading 16kHz s16le PCM", file=sys.stderr, flush=True)
+    while True:
+        data = read(2 * STREAM_READ_SAMPLES)
+        if not data:
+            break
+        data = leftover + data
+        leftover = data[len(data) - len(data) % 2:]
+        samples = np.frombuffer(data[:len(data) - len(leftover)], dtype="<i2")
+        samples = np.multiply(samples, np.float32(1.0 / 32768), dtype=np.float32)
+        buffer = np.concatenate((buffer, samples))
+        if detector is not None:
+            speech = np.concatenate((speech, detector.update(samples)))
+
+        # Every window whose last sample has arrived, in one batch
+        count = max(0, (len(buffer) - window_samples) // hop_samples + 1)
+        if count == 0:
+            continue
+        windows = frame_windows(torch.from_numpy(buffer), window_samples, hop_samples)[:count]
+        keep = np.ones(count, dtype=bool)
+        if detector is not None:
+            frames = window_samples // VAD_FRAME_SAMPLES
+            step = hop_samples // VAD_FRAME_SAMPLES
+            keep = np.array([
+                speech[i * step:i * step + frames].sum() >= VAD_MIN_SPEECH * frames for i in range(count)
+            ])
+
+        embeddings = None
+        if keep.any():
+            with torch.no_grad():
+                feats = compute_features(windows[torch.from_numpy(keep)].to(device))
+                embeddings = iter(model(feats).reshape(int(keep.sum()), -1).cpu().numpy())
+
+        for index in range(count):
+            start = (buffer_start + index * hop_samples) / sample_rate + margin
+            end = start + hop_samples / sample_rate
+            if not keep[index]:
+                close_turn()
+                continue
+            speaker, events = clusterer.assign(next(embeddings))
+            for kind, old, new in events:
+                if kind == "merge":
+                    write({"event": "merge", "speaker": name(old), "into": name(new)})
+                    if turn is not None and turn[2] == old:
+                        turn[2] = new
+                else:
+                    write({"event": "split", "speaker": name(old), "new": name(new)})
+            if turn is not None and (turn[2] != speaker or turn[1] < start - 1e-6):
+                close_turn()
+            if turn is None:
+                turn = [start, end, speaker]
+            turn[1] = end
+            if turn[1] - turn[0] >= STREAM_EMIT_SEC:
+                close_turn()
+                turn = [end, end, speaker]
+
+        consumed = count * hop_samples
+        buffer = buffer[consumed:]
+        speech = speech[consumed // VAD_FRAME_SAMPLES:]
+        buffer_start += consumed
+
+    close_turn()
+    return written
+
+
+class DiarizationWorker:
+    """Request handler for --serve that keeps models loaded between files.
+
+    Requests are JSON objects. {"command": "diarize", "audio_file": ...} takes
+    the same options as diarize_file; "ping" and "shutdown" manage the worker.
+    """
+
+    def __init__(self, embedding_cache=None):
+        self.models = {}
+        self.requests = 0
+        self.embedding_cache = embedding_cache
+
+    def handle(self, request):
+        """Handle one decoded request and return a JSON-serialisable response."""
+        if not isinstance(request, dict):
+            return {"error": "Request must be a JSON object"}
+
+        command = request.get("command", "diarize")
+        if command == "ping":
+            return {
+                "status": "ok",
+                "pid": os.getpid(),
+                "requests": self.requests,
+                "models": sorted(":".join(key) for key in self.models),
+            }
+        if command == "shutdown":
+            return {"status": "shutting down"}
+        if command != "diarize":
+            return {"error": f"Unknown command: {command}"}
+
+        if not request.get("timings"):
+            return self.diarize(request)
+
+        timings = {}
+        result = self.diarize(request, timings=timings)
+        if isinstance(result, dict):
+            return result
+        return {"segments": result, "timings": round_timings(timings)}
+
+    def diarize(self, request, audio=None, timings=None, progress=None):
+        """Run one diarize request with the worker's loaded models.
+
+        Args:
+            request: Request dict with audio_file and diarize_file options
+            audio: Optional pre-opened open_audio result for audio_file
+            timings: Optional dict to record per-stage timings in (see stage)
+            progress: Optional Progress for the request (see diarize_file)
+        """
+        audio_file = request.get("audio_file")
+        if not audio_file:
+            return {"error": "Missing audio_file"}
+
+        segments = request.get("segments")
+        if segments is not None:
+            try:
+                segments = load_segments(segments)
+            except ValueError as e:
+                return {"error": str(e)}
+
+        self.requests += 1
+        return diarize_file(
+            audio_file,
+            backend=request.get("backend", "auto"),
+            device_name=request.get("device", "auto"),
+            token=request.get("token"),
+            num_speakers=request.get("num_speakers"),
+            batch_size=request.get("batch_size", DEFAULT_BATCH_SIZE),
+            feature_cache=request.get("feature_cache", True),
+            models=self.models,
+            embedding_cache=self.embedding_cache if request.get("embedding_cache", True) else None,
+            clustering=request.get("clustering", "auto"),
+            affinity_dtype=request.get("affinity_dtype", "float64"),
+            resegment=request.get("resegment", False),
+            vad=request.get("vad", True),
+            segments=segments,
+            workers=request.get("workers", 1),
+            threads=request.get("threads"),
+            precision=request.get("precision", "fp32"),
+            compile=request.get("compile", False),
+            audio=audio,
+            progress=progress,
+            timings=timings,
+        )
+
+
+def socket_in_use(socket_path):
+    """Whether a worker is already accepting connections on socket_path."""
+    import socket
+
+    if not os.path.exists(socket_path):
+        return False
+    probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        probe.connect(socket_path)
+        return True
+    except OSError:
+        return False
+    finally:
+        probe.close()
+
+
+def serve(socket_path=DEFAULT_SOCKET_PATH, idle_timeout=DEFAULT_IDLE_TIMEOUT, worker=None):
+    """Run a diarization worker on a Unix socket until shutdown or idle timeout.
+
+    Each connection may send any number of newline-delimited JSON requests and
+    receives one JSON line per request. Requests are handled one at a time so
+    a single copy of each model is shared.
+
+    Args:
+        socket_path: Filesystem path of the Unix socket to listen on
+        idle_timeout: Seconds without a connection before exiting (0 = never)
+        worker: DiarizationWorker to use (a new one if None)
+    """
+    import signal
+    import socketserver
+    import threading
+
+    worker = worker or DiarizationWorker()
+
+    class Handler(socketserver.StreamRequestHandler):
+        def handle(self):
+            for line in self.rfile:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    request = json.loads(line)
+                except ValueError:
+                    request = None
+                    response = {"error": "Invalid JSON request"}
+                else:
+                    response = worker.handle(request)
+                self.wfile.write((json.dumps(response) + "\n").encode())
+                self.wfile.flush()
+                if isinstance(request, dict) and request.get("command") == "shutdown":
+                    self.server.stopping = True
+                    return
+
+    class Server(socketserver.UnixStreamServer):
+        stopping = False
+
+        def handle_timeout(self):
+            print("  Diarization worker idle, exiting", file=sys.stderr, flush=True)
+            self.stopping = True
+
+    if socket_in_use(socket_path):
+        raise RuntimeError(f"A diarization worker is already listening on {socket_path}")
+    os.makedirs(os.path.dirname(socket_path) or ".", mode=0o700, exist_ok=True)
+    if os.path.exists(socket_path):
+        os.unlink(socket_path)  # stale socket from a worker that did not exit cleanly
+
+    # Let SIGTERM unwind through the finally block so the socket is removed
+    if threading.current_thread() is threading.main_thread():
+        signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+
+    server = Server(socket_path, Handler)
+    try:
+        os.chmod(socket_path, 0o600)
+        server.timeout = idle_timeout or None
+        print(f"  Diarization worker listening on {socket_path}", file=sys.stderr, flush=True)
+        while not server.stopping:
+            server.handle_request()
+    finally:
+        server.server_close()
+        if os.path.exists(socket_path):
+            os.unlink(socket_path)
+
+
+def read_manifest(manifest):
+    """Read a --batch manifest: one JSON request or JSON string path per line.
+
+    Blank lines and lines starting with # are skipped. A line that is not
+    valid JSON becomes {"error": ...} so the batch reports it and moves on.
+
+    Args:
+        manifest: Path to a JSONL file, or "-" for stdin
+    """
+    f = sys.stdin if manifest == "-" else open(manifest)
+    entries = []
+    try:
+        for number, line in enumerate(f, 1):
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                entries.append({"error": f"Invalid JSON on manifest line {number}"})
+                continue
+            if isinstance(entry, str):
+                entry = {"audio_file": entry}
+            if not isinstance(entry, dict):
+                entry = {"error": f"Manifest line {number} must be an object or a path"}
+            entries.append(entry)
+    finally:
+        if f is not sys.stdin:
+            f.close()
+    return entries
+
+
+def prefetch_audio(audio_file):
+    """Read audio_file into the page cache and open it, for the next batch entry.
+
+    Runs in a background thread while the current file is embedded: plain
+    reads release the GIL, and files that need decoding are decoded here.
+
+    Returns:
+        open_audio result, or None if the file cannot be opened (the
+        diarization call then reports the error)
+    """
+    try:
+        with open(audio_file, "rb") as f:
+            while f.read(1 << 22):
+                pass
+        return open_audio(audio_file)
+    except Exception:
+        return None
+
+
+def run_batch(entries, worker, defaults, out=None, progress_out=None):
+    """Diarize every manifest entry with one set of loaded models.
+
+    The next file is read and opened in a background thread while the current
+    one is diarized. One JSON line is written per entry, in manifest order,
+    followed by a {"summary": ...} line.
+
+    Args:
+        entries: Request dicts from read_manifest; "output" writes that entry's
+            segments to a file instead of including them in its line
+        worker: DiarizationWorker holding the models and embedding cache
+        defaults: Request options from the command line, overridden per entry
+        out: Stream for result lines (default: stdout)
+        progress_out: Optional stream for progress records (see Progress),
+            tagged with audio_file, file and files, plus one
+            {"event": "file", "file", "files", "seconds", "eta_sec"} record
+            per finished entry with the estimated time left for the batch
+
+    Returns:
+        The summary dict
+    """
+    from concurrent.futures import ThreadPoolExecutor
+
+    out = out or sys.stdout
+    totals = {}
+    failed = 0
+    batch_start = time.perf_counter()
+
+    def prefetch(index):
+        path = entries[index].get("audio_file") if index < len(entries) else None
+        return prefetcher.submit(prefetch_audio, path) if path else None
+
+    with ThreadPoolExecutor(max_workers=1) as prefetcher:
+        pending = prefetch(0)
+        for index, entry in enumerate(entries):
+            print(f"  [{index + 1}/{len(entries)}] {entry.get('audio_file', '?')}", file=sys.stderr, flush=True)
+            timings = {}
+            with stage(timings, "io_wait"):
+                audio = pending.result() if pending is not None else None
+            pending = prefetch(index + 1)
+
+            file_start = time.perf_counter()
+            progress = Progress(records=progress_out, fields={
+                "audio_file": entry.get("audio_file"), "file": index + 1, "files": len(entries),
+            })
+            if "error" in entry:
+                result = entry
+            else:
+                result = worker.diarize(dict(defaults, **entry), audio=audio, timings=timings, progress=progress)
+            seconds = time.perf_counter() - file_start
+            del audio
+
+            line = {"audio_file": entry.get("audio_file")}
+            if isinstance(result, dict):
+                failed += 1
+                line.update(result)
+            elif entry.get("output"):
+                try:
+                    with open(entry["output"], "w") as f:
+                        json.dump(result, f)
+                    line["output"] = entry["output"]
+                except OSError as e:
+                    failed += 1
+                    line["error"] = f"Could not write {entry['output']}: {e}"
+            else:
+                line["segments"] = result
+            line["seconds"] = round(seconds, 3)
+            line["timings"] = round_timings(timings)
+            out.write(json.dumps(line) + "\n")
+            out.flush()
+
+            merge_timings(totals, timings)
+            if progress_out is not None:
+                remaining = len(entries) - index - 1
+                write_json_line({
+                    "event": "file",
+                    "file": index + 1,
+                    "files": len(entries),
+                    "seconds": round(seconds, 3),
+                    "eta_sec": round((time.perf_counter() - batch_start) / (index + 1) * remaining, 1),
+                }, progress_out)
+
+    wall = time.perf_counter() - batch_start
+    summary = {
+        "files": len(entries),
+        "failed": failed,
+        "wall_sec": round(wall, 3),
+        "files_per_hour": round(len(entries) * 3600 / wall, 1) if wall > 0 else None,
+        "stages_sec": {name: round(entry["wall_sec"], 3) for name, entry in sorted(totals.items())},
+        "stages": round_timings(totals),
+    }
+    out.write(json.dumps({"summary": summary}) + "\n")
+    out.flush()
+
+    stages = ", ".join(f"{name} {entry['wall_sec']:.1f}s" for name, entry in sorted(totals.items()))
+    print(f"  Batch: {len(entries)} files ({failed} failed) in {wall:.1f}s, "
+          f"{summary['files_per_hour']} files/hour; {stages}", file=sys.stderr, flush=True)
+    return summary
+
+
+def write_json_line(record, out=None):
+    """Write one JSON record on its own line and flush, so readers see it at once."""
+    out = out or sys.stdout
+    out.write(json.dumps(record) + "\n")
+    out.flush()
+
+
+def write_jsonl_result(result, timings=None, wall=None, out=None):
+    """Write a diarize_file result as --format jsonl records.
+
+    Segments go out one per line ({"start", "end", "speaker"}), then
+    {"event": "stats", "wall_sec", "timings"} and {"event": "done",
+    "segments": count}. An error dict is written as a single {"error"} line.
+    """
+    if isinstance(result, dict):
+        write_json_line(result, out)
+        return
+    for segment in result:
+        write_json_line(segment, out)
+    write_json_line({
+        "event": "stats",
+        "wall_sec": None if wall is None else round(wall, 4),
+        "timings": round_timings(timings or {}),
+    }, out)
+    write_json_line({"event": "done", "segments": len(result)}, out)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Speaker diarization with automatic backend selection"
+    )
+    parser.add_argument("audio_file", nargs="?", help="Path to audio file")
+    parser.add_argument(
+        "--backend",
+        choices=["auto", "pyannote", "speechbrain"],
+        default="auto",
+        help="Diarization backend (default: auto)"
+    )
+    parser.add_argument(
+        "--device",
+        choices=["auto", "cpu", "mps", "cuda"],
+        default="auto",
+        help="Compute device: auto, cpu, mps (Apple Silicon), cuda (default: auto)"
+    )
+    parser.add_argument(
+        "--token",
+        help="HuggingFace token for pyannote (or set HF_TOKEN env var)"
+    )
+    parser.add_argument(
+        "--num-speakers",
+        type=int,
+        help="Number of speakers (optional, auto-detected if not specified)"
+    )
+    parser.add_argument(
+        "--batch-size",
+        type=int,
+        default=DEFAULT_BATCH_SIZE,
+        help=f"Windows per embedding forward pass, speechbrain only (default: {DEFAULT_BATCH_SIZE})"
+    )
+    parser.add_argument(
+        "--no-feature-cache",
+        action="store_true",
+        help="Recompute filterbank features for every window, speechbrain only"
+    )
+    parser.add_argument(
+        "--threads",
+        type=int,
+        help="Torch intra-op threads (default: torch's choice; with --workers, CPU count / workers "
+             "per worker)"
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=1,
+        help="Embedding processes on CPU, each taking a share of the windows, speechbrain only "
+             "(default: 1)"
+    )
+    parser.add_argument(
+        "--clustering",
+        choices=["auto", "dense", "two-stage"],
+        default="auto",
+        help=f"Speaker clustering: dense n x n affinity, or k-means pre-clustering then dense "
+             f"on centroids; auto uses two-stage from {TWO_STAGE_MIN_WINDOWS} windows (default: auto)"
+    )
+    parser.add_argument(
+        "--affinity-dtype",
+        choices=["float64", "float32"],
+        default="float64",
+        help="Precision of the clustering affinity matrix; float32 halves its memory (default: float64)"
+    )
+    parser.add_argument(
+        "--precision",
+        choices=PRECISIONS,
+        default="fp32",
+        help="ECAPA-TDNN inference precision: bf16 autocast, or int8 dynamic quantization "
+             "(CPU), speechbrain only (default: fp32)"
+    )
+    parser.add_argument(
+        "--compile",
+        action="store_true",
+        help="Compile ECAPA-TDNN ahead of time for the --batch-size shape, cached under "
+             "~/.cache/transcribe-summarize/compiled/ (first run compiles; falls back to "
+             "eager on failure), speechbrain only, ignored with --workers above 1 or "
+             "--precision int8"
+    )
+    parser.add_argument(
+        "--resegment",
+        action="store_true",
+        help="Vote overlapping window labels onto a 10ms frame grid so speaker boundaries "
+             "fall between windows instead of on 0.75s window edges, speechbrain only"
+    )
+    parser.add_argument(
+        "--no-vad",
+        action="store_true",
+        help="Embed every window, including silence, noise and tones, speechbrain only"
+    )
+    parser.add_argument(
+        "--segments",
+        metavar="FILE",
+        help="Transcript segments JSON ({\"start\", \"end\"} list, or - for stdin): embed only "
+             "these and return one labelled segment per input segment"
+    )
+    parser.add_argument(
+        "--no-embedding-cache",
+        action="store_true",
+        help="Do not read or write cached embeddings, speechbrain only"
+    )
+    parser.add_argument(
+        "--cache-dir",
+        default=DEFAULT_CACHE_DIR,
+        help=f"Embedding cache directory (default: {DEFAULT_CACHE_DIR})"
+    )
+    parser.add_argument(
+        "--cache-max-mb",
+        type=float,
+        default=DEFAULT_CACHE_MAX_MB,
+        help=f"Embedding cache size limit in MB, least recently used evicted first (default: {DEFAULT_CACHE_MAX_MB})"
+    )
+    parser.add_argument(
+        "--format",
+        choices=["json", "jsonl"],
+        default="json",
+        help="json: one segment array at the end; jsonl: one JSON record per line as it is "
+             "produced, with progress, stats and done records (default: json)"
+    )
+    parser.add_argument(
+        "--progress-fd",
+        type=int,
+        metavar="N",
+        help="Write progress records as JSON lines to file descriptor N (e.g. 3), keeping "
+             "stdout for results; with --format jsonl they otherwise go to stdout"
+    )
+    parser.add_argument(
+        "--profile",
+        action="store_true",
+        help="Print wall time, CPU time and peak RSS per pipeline stage to stderr"
+    )
+    parser.add_argument(
+        "--timings-json",
+        metavar="PATH",
+        help="Write per-stage wall time, CPU time and peak RSS as JSON to PATH"
+    )
+    parser.add_argument(
+        "--batch",
+        metavar="MANIFEST",
+        help="Diarize every file in a JSONL manifest (one {\"audio_file\": ...} request or path "
+             "per line, - for stdin) with one model load; writes one JSON line per file and a summary"
+    )
+    parser.add_argument(
+        "--stream",
+        metavar="SOURCE",
+        help="Diarize 16kHz mono s16le PCM from SOURCE (- for stdin) as it arrives, writing "
+             "speaker turns as JSON lines; speechbrain only, --num-speakers caps the speakers"
+    )
+    parser.add_argument(
+        "--serve",
+        action="store_true",
+        help="Run as a long-lived worker on a Unix socket, keeping models loaded"
+    )
+    parser.add_argument(
+        "--socket",
+        default=DEFAULT_SOCKET_PATH,
+        help=f"Worker socket path for --serve (default: {DEFAULT_SOCKET_PATH})"
+    )
+    parser.add_argument(
+        "--idle-timeout",
+        type=float,
+        default=DEFAULT_IDLE_TIMEOUT,
+        help=f"Seconds an idle --serve worker waits before exiting, 0 for never (default: {DEFAULT_IDLE_TIMEOUT})"
+    )
+    args = parser.parse_args()
+
+    if args.threads:
+        import torch
+        torch.set_num_threads(args.threads)
+
+    embedding_cache = None
+    if not args.no_embedding_cache:
+        embedding_cache = EmbeddingCache(args.cache_dir, int(args.cache_max_mb * 1024 * 1024))
+
+    if args.serve:
+        try:
+            serve(args.socket, args.idle_timeout, DiarizationWorker(embedding_cache))
+        except RuntimeError as e:
+            print(json.dumps({"error": str(e)}))
+            sys.exit(1)
+        return
+
+    if args.stream:
+        if args.backend == "pyannote":
+            print(json.dumps({"error": "--stream requires the speechbrain backend"}))
+            sys.exit(1)
+        try:
+            device = get_device(args.device)
+        except RuntimeError as e:
+            print(json.dumps({"error": str(e)}))
+            sys.exit(1)
+
+        def load_stream_model():
+            model, compute_features = load_speechbrain_model(device)
+            return apply_precision(model, args.precision, device), compute_features
+
+        try:
+            source = sys.stdin.buffer if args.stream == "-" else open(args.stream, "rb")
+        except OSError as e:
+            print(json.dumps({"error": f"Could not read stream: {e}"}))
+            sys.exit(1)
+        try:
+            with source:
+                diarize_stream(source, device, load_stream_model,
+                               max_speakers=args.num_speakers or 8, vad=not args.no_vad)
+        except KeyboardInterrupt:
+            pass
+        except Exception as e:
+            print(json.dumps({"error": str(e)}))
+            sys.exit(1)
+        return
+
+    progress_out = None
+    if args.progress_fd is not None:
+        try:
+            progress_out = os.fdopen(args.progress_fd, "w", buffering=1)
+        except OSError as e:
+            print(json.dumps({"error": f"Could not open progress fd {args.progress_fd}: {e}"}))
+            sys.exit(1)
+
+    if args.batch:
+        try:
+            entries = read_manifest(args.batch)
+        except OSError as e:
+            print(json.dumps({"error": f"Could not read manifest: {e}"}))
+            sys.exit(1)
+        summary = run_batch(entries, DiarizationWorker(embedding_cache), {
+            "backend": args.backend,
+            "device": args.device,
+            "token": args.token,
+            "num_speakers": args.num_speakers,
+            "batch_size": args.batch_size,
+            "feature_cache": not args.no_feature_cache,
+            "clustering": args.clustering,
+            "affinity_dtype": args.affinity_dtype,
+            "resegment": args.resegment,
+            "vad": not args.no_vad,
+            "workers": max(1, args.workers),
+            "threads": args.threads,
+            "precision": args.precision,
+            "compile": args.compile,
+        }, progress_out=progress_out)
+        if summary["failed"]:
+            sys.exit(1)
+        return
+
+    if not args.audio_file:
+        parser.error("audio_file is required unless --serve or --batch is given")
+
+    transcript_segments = None
+    if args.segments:
+        try:
+            transcript_segments = load_segments(args.segments)
+        except (OSError, ValueError) as e:
+            print(json.dumps({"error": f"Could not read segments: {e}"}))
+            sys.exit(1)
+
+    jsonl = args.format == "jsonl"
+    if progress_out is None and jsonl:
+        progress_out = sys.stdout
+    progress = Progress(records=progress_out, console=progress_out is not sys.stdout)
+
+    timings = {} if args.profile or args.timings_json or jsonl else None
+    start = time.perf_counter()
+    segments = diarize_file(
+        args.audio_file,
+        backend=args.backend,
+        device_name=args.device,
+        token=args.token,
+        num_speakers=args.num_speakers,
+        batch_size=args.batch_size,
+        feature_cache=not args.no_feature_cache,
+        embedding_cache=embedding_cache,
+        clustering=args.clustering,
+        affinity_dtype=args.affinity_dtype,
+        resegment=args.resegment,
+        vad=not args.no_vad,
+        segments=transcript_segments,
+        workers=max(1, args.workers),
+        threads=args.threads,
+        precision=args.precision,
+        compile=args.compile,
+        progress=progress,
+        timings=timings,
+    )
+    wall = time.perf_counter() - start
+
+    if args.profile:
+        print(format_timings(timings), file=sys.stderr, flush=True)
+        print(f"  Total: {wall:.3f}s wall", file=sys.stderr, flush=True)
+    if args.timings_json:
+        try:
+            with open(args.timings_json, "w") as f:
+                json.dump({
+                    "audio_file": args.audio_file,
+                    "wall_sec": round(wall, 4),
+                    "timings": round_timings(timings),
+                }, f, indent=2)
+        except OSError as e:
+            print(f"  Could not write timings: {e}", file=sys.stderr, flush=True)
+
+    if jsonl:
+        write_jsonl_result(segments, timings, wall)
+    else:
+        print(json.dumps(segments))
+
+    # Check for error dict
+    if isinstance(segments, dict) and "error" in segments:
         sys.exit(1)
 
 
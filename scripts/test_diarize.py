@@ -1,6 +1,6 @@
 #!/usr/bin/env python3
 # ABOUTME: Unit tests for the diarize.py script.
-# ABOUTME: Tests device detection and argument parsing.
+# ABOUTME: Tests device detection, streaming embedding extraction and the --serve worker.
 
 """
 Unit tests for speaker diarization script.
@@ -111,6 +111,1686 @@ class TestGetDevice(unittest.TestCase):
         self.assertIn("CUDA requested but not available", str(context.exception))
 
 
+class TestLazyImports(unittest.TestCase):
+    """Startup paths should not import the heavy audio/ML stack."""
+
+    HEAVY = ("torch", "torchaudio", "huggingface_hub", "speechbrain", "pyannote")
+
+    def run_importtime(self, *argv):
+        import os
+        import subprocess
+        script_dir = os.path.dirname(os.path.abspath(__file__))
+        env = dict(os.environ, PYTHONPATH=script_dir)
+        proc = subprocess.run(
+            [sys.executable, "-X", "importtime", *argv],
+            capture_output=True, text=True, env=env, cwd=script_dir
+        )
+        imported = set()
+        for line in proc.stderr.splitlines():
+            if line.startswith("import time:") and "|" in line:
+                imported.add(line.rsplit("|", 1)[1].strip().split(".")[0])
+        return proc, imported
+
+    def test_module_import_is_light(self):
+        """Importing diarize should not import torch or apply library patches."""
+        _, imported = self.run_importtime("-c", "import diarize")
+        self.assertEqual(imported & set(self.HEAVY), set())
+
+    def test_help_is_light(self):
+        """--help should return without importing torch."""
+        proc, imported = self.run_importtime("diarize.py", "--help")
+        self.assertEqual(proc.returncode, 0)
+        self.assertEqual(imported & set(self.HEAVY), set())
+
+    def test_missing_file_is_light(self):
+        """A missing input file should be reported before torch is imported."""
+        proc, imported = self.run_importtime("diarize.py", "/nonexistent/audio.wav")
+        self.assertEqual(proc.returncode, 1)
+        self.assertIn("File not found", proc.stdout)
+        self.assertEqual(imported & set(self.HEAVY), set())
+
+    def test_huggingface_patch_is_idempotent(self):
+        """Patching twice should not stack wrappers."""
+        import huggingface_hub
+        from diarize import patch_huggingface_hub
+
+        patch_huggingface_hub()
+        first = huggingface_hub.hf_hub_download
+        patch_huggingface_hub()
+        self.assertIs(huggingface_hub.hf_hub_download, first)
+
+
+class TestEmbeddingCache(unittest.TestCase):
+    """Tests for the on-disk embedding cache."""
+
+    def setUp(self):
+        import tempfile
+        import torch
+        from diarize import EmbeddingCache
+
+        self.cache_dir = tempfile.mkdtemp()
+        self.cache = EmbeddingCache(self.cache_dir, max_bytes=10 * 1024 * 1024)
+        self.waveform = torch.linspace(-1, 1, 48000)
+        self.params = {"model": "m", "window_samples": 24000, "hop_samples": 12000}
+
+    def test_round_trip(self):
+        """Stored embeddings and timestamps should load back unchanged."""
+        import numpy as np
+
+        key = self.cache.key(self.waveform, self.params)
+        embeddings = np.arange(12, dtype=np.float32).reshape(3, 4)
+        timestamps = np.array([(0.0, 1.5), (0.75, 2.25), (1.5, 3.0)])
+
+        self.assertIsNone(self.cache.load(key))
+        self.cache.store(key, embeddings, timestamps)
+        loaded, loaded_timestamps = self.cache.load(key)
+
+        np.testing.assert_array_equal(loaded, embeddings)
+        np.testing.assert_array_equal(loaded_timestamps, timestamps)
+
+    def test_key_depends_on_audio_and_parameters(self):
+        """Different samples or parameters should produce different keys."""
+        base = self.cache.key(self.waveform, self.params)
+
+        self.assertEqual(base, self.cache.key(self.waveform.clone(), dict(self.params)))
+        self.assertNotEqual(base, self.cache.key(self.waveform * 0.5, self.params))
+        self.assertNotEqual(base, self.cache.key(self.waveform, dict(self.params, hop_samples=6000)))
+        self.assertNotEqual(base, self.cache.key(self.waveform, dict(self.params, batch_size=4)))
+
+    def test_batch_size_keys_feature_cached_embeddings(self):
+        """With the feature cache, another --batch-size should miss; without it, hit."""
+        import os
+        import soundfile
+        from diarize import diarize_speechbrain
+
+        path = os.path.join(self.cache_dir, "speech.wav")
+        soundfile.write(path, speech_like(30), 16000, subtype="PCM_16")
+        load_model = MagicMock(return_value=small_ecapa())
+
+        def run(batch_size, feature_cache):
+            diarize_speechbrain(path, "cpu", num_speakers=2, batch_size=batch_size, vad=False,
+                                feature_cache=feature_cache, load_model=load_model,
+                                embedding_cache=self.cache, model_id="small")
+
+        run(32, True)
+        run(4, True)
+        run(4, True)
+        self.assertEqual(load_model.call_count, 2)
+        run(32, False)
+        run(4, False)
+        self.assertEqual(load_model.call_count, 3)
+
+    def test_model_identity_keys_embeddings(self):
+        """Other weights or --compile should miss; a loader's weights are hashed by default."""
+        import os
+        import soundfile
+        import torch
+        from diarize import diarize_speechbrain
+
+        path = os.path.join(self.cache_dir, "speech.wav")
+        soundfile.write(path, speech_like(30), 16000, subtype="PCM_16")
+        load_model = MagicMock(return_value=small_ecapa())
+
+        def run(**kwargs):
+            before = load_model.call_count
+            diarize_speechbrain(path, "cpu", num_speakers=2, vad=False, load_model=load_model,
+                                embedding_cache=self.cache, **kwargs)
+            return load_model.call_count > before
+
+        self.assertTrue(run(model_id="a"))
+        self.assertFalse(run(model_id="a"))
+        self.assertTrue(run(model_id="b"))
+        self.assertTrue(run(model_id="a", compile=True))
+
+        def entries():
+            return len([name for name in os.listdir(self.cache_dir) if name.endswith(".npz")])
+
+        # Without model_id the loaded weights are hashed, so retrained weights miss
+        run()
+        self.assertEqual(entries(), 4)
+        run()
+        self.assertEqual(entries(), 4)
+        model, compute_features = small_ecapa()
+        with torch.no_grad():
+            next(model.parameters()).add_(1.0)
+        load_model.return_value = (model, compute_features)
+        run()
+        self.assertEqual(entries(), 5)
+
+    def test_evicts_least_recently_used(self):
+        """Entries beyond max_bytes should be evicted oldest-access first."""
+        import os
+        import time
+        import numpy as np
+
+        embeddings = np.zeros((256, 192), dtype=np.float32)  # ~200KB per entry
+        self.cache.max_bytes = 450 * 1024
+        self.cache.store("a", embeddings, [(0.0, 1.5)] * 256)
+        self.cache.store("b", embeddings, [(0.0, 1.5)] * 256)
+        past = time.time() - 60
+        os.utime(self.cache.path("a"), (past, past))
+        os.utime(self.cache.path("b"), (past + 1, past + 1))
+
+        # Reading "a" makes "b" the least recently used entry
+        self.assertIsNotNone(self.cache.load("a"))
+        self.cache.store("c", embeddings, [(0.0, 1.5)] * 256)
+
+        self.assertIsNotNone(self.cache.load("a"))
+        self.assertIsNone(self.cache.load("b"))
+        self.assertIsNotNone(self.cache.load("c"))
+
+
+class TestModelRegistry(unittest.TestCase):
+    """Tests for local-first model resolution and mmap checkpoint loading."""
+
+    def test_local_first_prefers_cache(self):
+        """A cached load should run once offline; a miss should retry online."""
+        from huggingface_hub import constants
+        from diarize import local_first
+
+        modes = []
+
+        def cached():
+            modes.append(constants.HF_HUB_OFFLINE)
+            return "path"
+
+        def missing():
+            modes.append(constants.HF_HUB_OFFLINE)
+            if constants.HF_HUB_OFFLINE:
+                raise OSError("not in cache")
+            return "downloaded"
+
+        online = constants.HF_HUB_OFFLINE
+        self.assertEqual(local_first(cached, "model"), "path")
+        self.assertEqual(modes, [True])
+        modes.clear()
+        self.assertEqual(local_first(missing, "model"), "downloaded")
+        self.assertEqual(modes, [True, online])
+        self.assertEqual(constants.HF_HUB_OFFLINE, online)
+
+    def test_checkpoint_converted_once(self):
+        """The pickled checkpoint should be unpickled only on first use."""
+        import os
+        import tempfile
+        import torch
+        from diarize import ModelRegistry
+
+        directory = tempfile.mkdtemp()
+        checkpoint = os.path.join(directory, "embedding_model.ckpt")
+        model, _ = small_ecapa()
+        torch.save(model.state_dict(), checkpoint)
+        registry = ModelRegistry(os.path.join(directory, "models"))
+
+        with patch("torch.load", wraps=torch.load) as mock_load:
+            first = registry.state_dict(checkpoint)
+            second = registry.state_dict(checkpoint)
+
+        pickled = [c for c in mock_load.call_args_list if c.kwargs.get("weights_only") is False]
+        self.assertEqual(len(pickled), 1)
+        self.assertTrue(all(c.kwargs.get("mmap") for c in mock_load.call_args_list if c not in pickled))
+        self.assertTrue(os.path.exists(registry.converted_path(checkpoint)))
+        for name, tensor in model.state_dict().items():
+            torch.testing.assert_close(second[name], tensor)
+            torch.testing.assert_close(first[name], tensor)
+
+    def test_model_built_from_mapped_weights(self):
+        """load_speechbrain_model should adopt the checkpoint weights without meta tensors."""
+        import os
+        import tempfile
+        import torch
+        import diarize
+
+        directory = tempfile.mkdtemp()
+        checkpoint = os.path.join(directory, "embedding_model.ckpt")
+        reference = full_ecapa()
+        torch.save(reference.state_dict(), checkpoint)
+        registry = diarize.ModelRegistry(os.path.join(directory, "models"))
+
+        with patch.object(registry, "checkpoint", return_value=checkpoint):
+            model, _ = diarize.load_speechbrain_model(torch.device("cpu"), registry)
+
+        tensors = list(model.parameters()) + list(model.buffers())
+        self.assertFalse(any(t.is_meta for t in tensors))
+        feats = torch.randn(2, 150, 80)
+        with torch.no_grad():
+            torch.testing.assert_close(model(feats), reference(feats))
+
+
+class TestStreamingAudio(unittest.TestCase):
+    """Tests for block-wise audio reading and window spans."""
+
+    def setUp(self):
+        import tempfile
+        self.tmp_dir = tempfile.mkdtemp()
+
+    def write_wav(self, name, samples, channels=1):
+        import os
+        import numpy as np
+        import soundfile
+
+        path = os.path.join(self.tmp_dir, name)
+        data = np.repeat(samples[:, None], channels, axis=1) if channels > 1 else samples
+        soundfile.write(path, data, 16000, subtype="PCM_16")
+        return path
+
+    def test_spans_match_in_memory_windows(self):
+        """Windows rebuilt from small blocks should match a single-buffer view."""
+        import torch
+        from diarize import frame_windows, iter_window_spans
+
+        waveform = torch.arange(100, dtype=torch.float32)
+        expected = frame_windows(waveform, 10, 5)
+        blocks = waveform.split(7)
+
+        windows = []
+        for first, count, span in iter_window_spans(blocks, 10, 5, batch_size=3):
+            self.assertEqual(first, len(windows))
+            windows.extend(frame_windows(span, 10, 5)[:count])
+
+        self.assertEqual(len(windows), expected.shape[0])
+        torch.testing.assert_close(torch.stack(windows), expected)
+
+    def test_stream_reads_mono_blocks(self):
+        """16kHz WAV should stream in blocks and downmix stereo to mono."""
+        import numpy as np
+        import torch
+        from diarize import open_audio
+
+        samples = (np.sin(np.arange(40000) / 50.0) * 0.5).astype(np.float32)
+        path = self.write_wav("stereo.wav", samples, channels=2)
+
+        read_blocks, total_samples = open_audio(path, block_samples=16000)
+        blocks = list(read_blocks())
+
+        self.assertEqual(total_samples, 40000)
+        self.assertEqual([b.shape[0] for b in blocks], [16000, 16000, 8000])
+        torch.testing.assert_close(torch.cat(blocks), torch.from_numpy(samples), atol=1e-4, rtol=0)
+        # The stream can be read again (cache hashing, then embedding)
+        self.assertEqual(sum(b.shape[0] for b in read_blocks()), 40000)
+
+    def test_canonical_wav_is_memory_mapped(self):
+        """16kHz mono s16 WAV should map to the exact int16 samples."""
+        import numpy as np
+        import soundfile
+        from diarize import map_pcm16_wav
+
+        samples = (np.sin(np.arange(20000) / 30.0) * 0.5).astype(np.float32)
+        path = self.write_wav("mono.wav", samples)
+
+        mapped = map_pcm16_wav(path)
+        expected, _ = soundfile.read(path, dtype="int16")
+
+        self.assertEqual(len(mapped), 20000)
+        np.testing.assert_array_equal(mapped.samples, expected)
+
+    def test_non_canonical_wav_is_not_mapped(self):
+        """Stereo, other rates and float WAVs should fall back to decoding."""
+        import os
+        import numpy as np
+        import soundfile
+        from diarize import map_pcm16_wav
+
+        samples = np.zeros(16000, dtype=np.float32)
+        stereo = self.write_wav("stereo.wav", samples, channels=2)
+        float_path = os.path.join(self.tmp_dir, "float.wav")
+        soundfile.write(float_path, samples, 16000, subtype="FLOAT")
+        rate_path = os.path.join(self.tmp_dir, "44k.wav")
+        soundfile.write(rate_path, samples, 44100, subtype="PCM_16")
+
+        self.assertIsNone(map_pcm16_wav(stereo))
+        self.assertIsNone(map_pcm16_wav(float_path))
+        self.assertIsNone(map_pcm16_wav(rate_path))
+        self.assertIsNone(map_pcm16_wav(__file__))
+
+    def test_mapped_stream_needs_no_decoder(self):
+        """The mapped path should match soundfile without importing a decoder."""
+        import numpy as np
+        import soundfile
+        import torch
+        from diarize import open_audio
+
+        samples = (np.sin(np.arange(40000) / 50.0) * 0.5).astype(np.float32)
+        path = self.write_wav("mono.wav", samples)
+        expected, _ = soundfile.read(path, dtype="float32")
+
+        with patch.dict(sys.modules, {"soundfile": None, "torchaudio": None}):
+            read_blocks, total_samples = open_audio(path, block_samples=16000)
+            streamed = torch.cat(list(read_blocks()))
+
+        self.assertEqual(total_samples, 40000)
+        torch.testing.assert_close(streamed, torch.from_numpy(expected), atol=0, rtol=0)
+
+    def test_four_hour_wav_under_rss_ceiling(self):
+        """Diarizing a 4-hour WAV should not hold the recording in memory."""
+        import json
+        import os
+        import subprocess
+        import numpy as np
+        import soundfile
+
+        hours = 4
+        path = os.path.join(self.tmp_dir, "long.wav")
+        rng = np.random.default_rng(0)
+        minute = (rng.standard_normal(16000 * 60) * 0.1).astype(np.float32)
+        with soundfile.SoundFile(path, "w", 16000, 1, subtype="PCM_16") as f:
+            for _ in range(hours * 60):
+                f.write(minute)
+
+        # Decoded as float32 the recording would need ~880MB
+        ceiling_mb = 256
+        child = """
+import json, resource, sys, torch
+from diarize import diarize_speechbrain
+from test_diarize import small_ecapa
+
+def rss_mb():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024 if sys.platform == "darwin" else 1024)
+
+model = small_ecapa()
+baseline = rss_mb()
+# White noise is not speech, so embed every window
+segments = diarize_speechbrain(sys.argv[1], torch.device("cpu"), num_speakers=1,
+                               load_model=lambda: model, vad=False)
+print(json.dumps({"growth_mb": rss_mb() - baseline, "end": segments[-1]["end"]}))
+"""
+        script_dir = os.path.dirname(os.path.abspath(__file__))
+        proc = subprocess.run(
+            [sys.executable, "-c", child, path],
+            capture_output=True, text=True, cwd=script_dir,
+            env=dict(os.environ, PYTHONPATH=script_dir)
+        )
+        os.unlink(path)
+        self.assertEqual(proc.returncode, 0, proc.stderr[-2000:])
+
+        result = json.loads(proc.stdout.strip().splitlines()[-1])
+        self.assertAlmostEqual(result["end"], hours * 3600, delta=1.0)
+        self.assertLess(result["growth_mb"], ceiling_mb)
+
+
+def separated_embeddings(n, speakers, dim=32, seed=0):
+    """Well-separated synthetic speaker embeddings with ground-truth labels."""
+    import numpy as np
+
+    rng = np.random.default_rng(seed)
+    centers = np.eye(dim)[:speakers] * 5.0
+    labels = np.arange(n) % speakers
+    return centers[labels] + rng.standard_normal((n, dim)) * 0.3, labels
+
+
+class TestEstimateNumSpeakers(unittest.TestCase):
+    """Tests for eigengap speaker-count estimation."""
+
+    def test_top_eigenvalues_match_full_spectrum(self):
+        """Gram-matrix eigenvalues should equal the top of the n x n spectrum."""
+        import numpy as np
+        from sklearn.metrics.pairwise import cosine_similarity
+        from diarize import top_similarity_eigenvalues
+
+        embeddings, _ = separated_embeddings(300, 3)
+        full = np.sort(np.linalg.eigvalsh(cosine_similarity(embeddings)))[::-1][:8]
+
+        np.testing.assert_allclose(top_similarity_eigenvalues(embeddings, 8), full, atol=1e-8)
+
+    def test_estimates_separated_speakers(self):
+        """The eigengap should find the number of well-separated speakers."""
+        from diarize import estimate_num_speakers
+
+        for speakers in (2, 3, 5):
+            embeddings, _ = separated_embeddings(400, speakers, seed=speakers)
+            self.assertEqual(estimate_num_speakers(embeddings), speakers)
+
+    def test_small_inputs(self):
+        """Fewer than two windows means one speaker; two or three means two."""
+        import numpy as np
+        from diarize import estimate_num_speakers
+
+        self.assertEqual(estimate_num_speakers(np.ones((1, 4))), 1)
+        self.assertEqual(estimate_num_speakers(np.eye(4)[:2]), 2)
+        self.assertEqual(estimate_num_speakers(np.eye(4)[:3]), 2)
+
+
+class TestClustering(unittest.TestCase):
+    """Tests for the dense and two-stage clustering engines."""
+
+    def test_two_stage_matches_ground_truth(self):
+        """Pre-clustering into centroids should recover well-separated speakers."""
+        from sklearn.metrics import adjusted_rand_score
+        from diarize import cluster_embeddings
+
+        embeddings, truth = separated_embeddings(900, 3)
+        labels = cluster_embeddings(embeddings, num_speakers=3, method="two-stage")
+
+        self.assertEqual(len(labels), 900)
+        self.assertEqual(adjusted_rand_score(truth, labels), 1.0)
+
+    def test_two_stage_agrees_with_dense(self):
+        """Both engines should produce the same partition on clean data."""
+        from sklearn.metrics import adjusted_rand_score
+        from diarize import cluster_embeddings
+
+        embeddings, _ = separated_embeddings(600, 4)
+        dense = cluster_embeddings(embeddings, num_speakers=4, method="dense")
+        two_stage = cluster_embeddings(embeddings, num_speakers=4, method="two-stage")
+
+        self.assertEqual(adjusted_rand_score(dense, two_stage), 1.0)
+
+    def test_shared_affinity_matches_sklearn_spectral(self):
+        """In-place spectral clustering should match sklearn's cosine spectral clustering."""
+        from sklearn.cluster import SpectralClustering
+        from sklearn.metrics import adjusted_rand_score
+        from diarize import cluster_dense
+
+        embeddings, _ = separated_embeddings(500, 3, seed=7)
+        reference = SpectralClustering(
+            n_clusters=3, affinity='cosine', random_state=42
+        ).fit_predict(embeddings)
+
+        for dtype in ("float64", "float32"):
+            labels = cluster_dense(embeddings, 3, affinity_dtype=dtype)
+            self.assertEqual(adjusted_rand_score(reference, labels), 1.0, dtype)
+
+    def test_spectral_failure_restores_affinity_for_fallback(self):
+        """A failed spectral pass should leave the shared affinity intact."""
+        import numpy as np
+        from diarize import cosine_affinity, spectral_labels
+
+        embeddings, _ = separated_embeddings(5, 2)
+        affinity = cosine_affinity(embeddings)
+        original = affinity.copy()
+
+        with patch("scipy.sparse.linalg.eigsh", side_effect=RuntimeError("no convergence")):
+            with self.assertRaises(RuntimeError):
+                spectral_labels(affinity, n_clusters=2)
+        np.testing.assert_allclose(affinity, original, atol=1e-12)
+
+    def test_agglomerative_fallback(self):
+        """If spectral clustering fails, AHC on the same buffer should still cluster."""
+        import diarize
+        from sklearn.metrics import adjusted_rand_score
+
+        embeddings, truth = separated_embeddings(120, 3)
+        with patch.object(diarize, "spectral_labels", side_effect=ValueError("no convergence")):
+            labels = diarize.cluster_dense(embeddings, 3)
+
+        self.assertEqual(adjusted_rand_score(truth, labels), 1.0)
+
+    def test_auto_uses_dense_below_threshold(self):
+        """Short recordings should not be pre-clustered."""
+        import diarize
+
+        embeddings, _ = separated_embeddings(100, 2)
+        with patch.object(diarize, "precluster") as mock_precluster:
+            diarize.cluster_embeddings(embeddings, num_speakers=2, method="auto")
+        mock_precluster.assert_not_called()
+
+    def test_auto_uses_two_stage_above_threshold(self):
+        """Long recordings should be pre-clustered."""
+        import diarize
+
+        embeddings, _ = separated_embeddings(400, 2)
+        with patch.object(diarize, "TWO_STAGE_MIN_WINDOWS", 200), \
+                patch.object(diarize, "TWO_STAGE_CENTROIDS", 50):
+            with patch.object(diarize, "precluster", wraps=diarize.precluster) as mock_precluster:
+                labels = diarize.cluster_embeddings(embeddings, num_speakers=2, method="auto")
+        mock_precluster.assert_called_once()
+        self.assertEqual(len(set(labels)), 2)
+
+
+class TestMergeSegments(unittest.TestCase):
+    """Test run-length merging of window labels into speaker segments."""
+
+    def reference(self, timestamps, labels):
+        """The original loop, for comparing output."""
+        segments = []
+        current = [timestamps[0][0], timestamps[0][1], labels[0]]
+        for (start, end), label in zip(timestamps[1:], labels[1:]):
+            if label == current[2]:
+                current[1] = end
+            else:
+                segments.append(current)
+                current = [start, end, label]
+        segments.append(current)
+        return [
+            {"start": round(s, 3), "end": round(e, 3), "speaker": f"SPEAKER_{l:02d}"}
+            for s, e, l in segments
+        ]
+
+    def test_matches_loop_json(self):
+        """Vectorised merging should serialise identically to the original loop."""
+        import json
+        import numpy as np
+        from diarize import merge_segments
+
+        rng = np.random.default_rng(3)
+        labels = np.repeat(rng.integers(0, 3, size=200), rng.integers(1, 6, size=200))
+        starts = np.arange(len(labels)) * 12000
+        timestamps = np.column_stack((starts, starts + 24000)) / 16000
+        expected = self.reference([tuple(row) for row in timestamps.tolist()],
+                                  labels.tolist())
+
+        self.assertEqual(json.dumps(merge_segments(timestamps, labels)), json.dumps(expected))
+
+    def test_single_run_and_empty(self):
+        """One label becomes one segment; no windows become no segments."""
+        import numpy as np
+        from diarize import merge_segments
+
+        timestamps = np.array([(0.0, 1.5), (0.75, 2.25)])
+        self.assertEqual(merge_segments(timestamps, np.array([1, 1])),
+                         [{"start": 0.0, "end": 2.25, "speaker": "SPEAKER_01"}])
+        self.assertEqual(merge_segments(np.empty((0, 2)), np.array([], dtype=int)), [])
+
+
+class TestResegmentFrames(unittest.TestCase):
+    """Test frame-level resegmentation of overlapping window labels."""
+
+    def windows(self, n):
+        import numpy as np
+
+        starts = np.arange(n) * 12000
+        return np.column_stack((starts, starts + 24000)) / 16000
+
+    def test_boundary_moves_inside_overlap(self):
+        """A speaker change should fall mid-overlap on the 10ms grid."""
+        import numpy as np
+        from diarize import merge_segments, resegment_frames
+
+        labels = np.array([0, 0, 0, 1, 1, 1, 0, 0])
+        segments = merge_segments(*resegment_frames(self.windows(8), labels))
+
+        self.assertEqual([s["speaker"] for s in segments],
+                         ["SPEAKER_00", "SPEAKER_01", "SPEAKER_00"])
+        # Windows 2 and 3 overlap on [2.25, 3.0]; the turn changes near 2.625
+        self.assertAlmostEqual(segments[0]["end"], 2.625, delta=0.01)
+        self.assertEqual(segments[0]["end"], segments[1]["start"])
+        self.assertEqual((segments[0]["start"], segments[-1]["end"]), (0.0, 6.75))
+
+    def test_majority_wins_with_dense_overlap(self):
+        """With several windows per frame, an outlier label should be outvoted."""
+        import numpy as np
+        from diarize import resegment_frames
+
+        starts = np.arange(20) * 4000
+        timestamps = np.column_stack((starts, starts + 24000)) / 16000
+        labels = np.zeros(20, dtype=int)
+        labels[10] = 1
+
+        _, run_labels = resegment_frames(timestamps, labels)
+        self.assertEqual(run_labels.tolist(), [0])
+
+    def test_empty(self):
+        """No windows should produce no runs."""
+        import numpy as np
+        from diarize import resegment_frames
+
+        timestamps, labels = resegment_frames(np.empty((0, 2)), np.array([], dtype=int))
+        self.assertEqual(len(timestamps), 0)
+        self.assertEqual(len(labels), 0)
+
+
+class TestDiarizationWorker(unittest.TestCase):
+    """Tests for the long-lived --serve worker."""
+
+    def test_ping_reports_status(self):
+        """Ping should answer without loading any model."""
+        from diarize import DiarizationWorker
+
+        response = DiarizationWorker().handle({"command": "ping"})
+        self.assertEqual(response["status"], "ok")
+        self.assertEqual(response["requests"], 0)
+        self.assertEqual(response["models"], [])
+
+    def test_missing_file_returns_error(self):
+        """Diarize requests for missing files should return an error dict."""
+        from diarize import DiarizationWorker
+
+        response = DiarizationWorker().handle({"audio_file": "/nonexistent/audio.wav"})
+        self.assertIn("File not found", response["error"])
+
+    def test_unknown_command_returns_error(self):
+        """Unknown commands should be rejected, not diarized."""
+        from diarize import DiarizationWorker
+
+        response = DiarizationWorker().handle({"command": "reload"})
+        self.assertIn("Unknown command", response["error"])
+
+    def test_serve_answers_over_socket_and_shuts_down(self):
+        """The socket server should answer JSON lines and remove its socket on shutdown."""
+        import json
+        import os
+        import socket
+        import tempfile
+        import threading
+        from diarize import serve
+
+        socket_path = os.path.join(tempfile.mkdtemp(), "diarize.sock")
+        thread = threading.Thread(target=serve, args=(socket_path, 10))
+        thread.start()
+        for _ in range(100):
+            if os.path.exists(socket_path):
+                break
+            threading.Event().wait(0.05)
+
+        client = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        client.connect(socket_path)
+        stream = client.makefile("rw")
+        stream.write('{"command": "ping"}\nnot json\n{"command": "shutdown"}\n')
+        stream.flush()
+        responses = [json.loads(stream.readline()) for _ in range(3)]
+        client.close()
+        thread.join(timeout=5)
+
+        self.assertEqual(responses[0]["status"], "ok")
+        self.assertIn("Invalid JSON", responses[1]["error"])
+        self.assertEqual(responses[2]["status"], "shutting down")
+        self.assertFalse(thread.is_alive())
+        self.assertFalse(os.path.exists(socket_path))
+
+
+def small_ecapa():
+    """Build a small randomly initialised ECAPA-TDNN and Fbank front end."""
+    import torch
+    from speechbrain.lobes.models.ECAPA_TDNN import ECAPA_TDNN
+    from speechbrain.lobes.features import Fbank
+
+    torch.manual_seed(0)
+    model = ECAPA_TDNN(
+        input_size=80,
+        channels=[32, 32, 32, 32, 96],
+        kernel_sizes=[5, 3, 3, 3, 1],
+        dilations=[1, 2, 3, 4, 1],
+        attention_channels=16,
+        lin_neurons=24
+    )
+    model.eval()
+    return model, Fbank(n_mels=80)
+
+
+def full_ecapa():
+    """Build a randomly initialised ECAPA-TDNN with the production checkpoint's shapes."""
+    import torch
+    from speechbrain.lobes.models.ECAPA_TDNN import ECAPA_TDNN
+
+    torch.manual_seed(0)
+    model = ECAPA_TDNN(
+        input_size=80,
+        channels=[1024, 1024, 1024, 1024, 3072],
+        kernel_sizes=[5, 3, 3, 3, 1],
+        dilations=[1, 2, 3, 4, 1],
+        attention_channels=128,
+        lin_neurons=192
+    )
+    model.eval()
+    return model
+
+
+def speech_like(seconds, seed=0):
+    """Amplitude-modulated harmonic signal with speech-like energy and spectrum."""
+    import numpy as np
+
+    rng = np.random.default_rng(seed)
+    t = np.arange(int(seconds * 16000)) / 16000
+    phase = 2 * np.pi * np.cumsum(140 * (1 + 0.1 * np.sin(2 * np.pi * 0.7 * t))) / 16000
+    voiced = sum(np.sin(k * phase) / k for k in range(1, 25))
+    envelope = 0.5 * (1 + np.sin(2 * np.pi * 4 * t)) ** 2
+    return ((0.1 * voiced + 0.02 * rng.standard_normal(len(t))) * envelope).astype(np.float32)
+
+
+class TestVoiceActivity(unittest.TestCase):
+    """Tests for the energy/spectral VAD pre-pass."""
+
+    def detect(self, parts):
+        import numpy as np
+        from diarize import detect_speech_frames
+
+        rng = np.random.default_rng(1)
+        audio = np.concatenate(parts)
+        audio = audio + (0.002 * rng.standard_normal(len(audio))).astype(np.float32)
+        # Uneven blocks exercise the frame remainder carried between blocks
+        return detect_speech_frames([audio[i:i + 7777] for i in range(0, len(audio), 7777)])
+
+    def test_silence_and_tones_are_not_speech(self):
+        """Speech frames should pass; silence and a dial tone should not."""
+        import numpy as np
+
+        t = np.arange(5 * 16000) / 16000
+        tone = (0.1 * np.sin(2 * np.pi * 440 * t) + 0.1 * np.sin(2 * np.pi * 480 * t)).astype(np.float32)
+        speech = self.detect([speech_like(10), np.zeros(5 * 16000, dtype=np.float32), tone])
+
+        speech_end = 10 * 16000 // 480
+        self.assertGreater(speech[:speech_end].mean(), 0.5)
+        self.assertEqual(speech[speech_end + 1:].sum(), 0)
+
+    def test_windows_need_minimum_speech(self):
+        """A window is kept when enough of its frames are speech."""
+        import numpy as np
+        from diarize import speech_windows
+
+        # 1 frame = 10 samples, windows of 10 frames every 5 frames
+        speech = np.zeros(40, dtype=bool)
+        speech[12] = True
+        keep = speech_windows(speech, 7, 100, 50, frame_samples=10, min_speech=0.1)
+        self.assertEqual(keep.tolist(), [False, True, True, False, False, False, False])
+
+    def test_skipped_windows_are_not_embedded(self):
+        """Only kept windows should be embedded, with their own timestamps."""
+        import numpy as np
+        import torch
+        from diarize import embed_window_spans, iter_window_spans
+
+        model, features = small_ecapa()
+        waveform = torch.randn(96000, generator=torch.Generator().manual_seed(1)) * 0.1
+        keep = np.array([True, False, False, True, True, False, False])
+
+        def embed(keep, feature_cache):
+            spans = iter_window_spans([waveform], 24000, 12000, 4)
+            return embed_window_spans(model, features, spans, torch.device("cpu"),
+                                      24000, 12000, 16000, 7, feature_cache=feature_cache, keep=keep)
+
+        for feature_cache in (False, True):
+            full, _ = embed(None, feature_cache)
+            kept, timestamps = embed(keep, feature_cache)
+            self.assertEqual(timestamps[:, 0].tolist(), [0.0, 2.25, 3.0])
+            np.testing.assert_allclose(kept, full[keep], rtol=1e-4, atol=1e-5)
+
+    def test_silent_file_skips_model_load(self):
+        """A recording with no speech should return no segments without loading a model."""
+        import os
+        import tempfile
+        import numpy as np
+        import soundfile
+        from diarize import diarize_speechbrain
+
+        path = os.path.join(tempfile.mkdtemp(), "silence.wav")
+        soundfile.write(path, np.zeros(16000 * 5, dtype=np.float32), 16000, subtype="PCM_16")
+        load_model = MagicMock()
+
+        self.assertEqual(diarize_speechbrain(path, "cpu", load_model=load_model), [])
+        load_model.assert_not_called()
+
+
+class TestTranscriptSegments(unittest.TestCase):
+    """Tests for embedding windows placed on transcript segments."""
+
+    def test_windows_cover_long_and_short_segments(self):
+        """Long segments get sliding windows ending at the segment end; short ones one centred window."""
+        from diarize import segment_windows
+
+        starts, owners = segment_windows(
+            [(4.0, 4.5), (1.0, 4.2)], 16000 * 20, 24000, 12000, 16000
+        )
+
+        self.assertEqual((starts / 16000).tolist(), [1.0, 1.75, 2.5, 2.7, 3.5])
+        self.assertEqual(owners.tolist(), [1, 1, 1, 1, 0])
+
+    def test_windows_are_clipped_to_audio(self):
+        """Windows near either end of the audio should stay inside it."""
+        from diarize import segment_windows
+
+        starts, _ = segment_windows([(0.0, 0.4), (9.8, 12.0)], 16000 * 10, 24000, 12000, 16000)
+        self.assertEqual(starts.tolist(), [0, 16000 * 10 - 24000])
+
+    def test_gathered_windows_match_slices(self):
+        """Windows gathered from a block stream should equal direct slices."""
+        import torch
+        from diarize import iter_windows_at
+
+        waveform = torch.arange(1000, dtype=torch.float32)
+        starts = [0, 5, 5, 300, 640, 900]
+        batches = list(iter_windows_at(waveform.split(64), starts, 100, batch_size=4))
+
+        self.assertEqual([b.shape[0] for b in batches], [4, 2])
+        expected = torch.stack([waveform[s:s + 100] for s in starts])
+        torch.testing.assert_close(torch.cat(batches), expected)
+
+    def test_majority_label_per_segment(self):
+        """Each segment should take the most common label among its windows."""
+        from diarize import label_segments
+
+        segments = label_segments([(0.0, 3.0), (3.0, 4.0)], [0, 0, 0, 1], [2, 1, 2, 1])
+        self.assertEqual(segments, [
+            {"start": 0.0, "end": 3.0, "speaker": "SPEAKER_02"},
+            {"start": 3.0, "end": 4.0, "speaker": "SPEAKER_01"},
+        ])
+
+    def test_align_turns_by_overlap(self):
+        """pyannote turns should map onto segments by overlap, else nearest turn."""
+        from diarize import align_turns
+
+        turns = [{"start": 0.0, "end": 2.0, "speaker": "A"}, {"start": 2.0, "end": 5.0, "speaker": "B"}]
+        aligned = align_turns(turns, [(0.0, 1.0), (1.5, 4.0), (6.0, 7.0)])
+        self.assertEqual([s["speaker"] for s in aligned], ["A", "B", "B"])
+
+    def test_load_segments_formats(self):
+        """Objects, pairs and whisper's {"segments": [...]} should all parse."""
+        from diarize import load_segments
+
+        expected = [(0.0, 1.5), (1.5, 3.0)]
+        self.assertEqual(load_segments([{"start": 0, "end": 1.5, "text": "hi"}, {"start": 1.5, "end": 3}]), expected)
+        self.assertEqual(load_segments([[0, 1.5], [1.5, 3]]), expected)
+        self.assertEqual(load_segments({"segments": [[0, 1.5], [1.5, 3]]}), expected)
+        with self.assertRaises(ValueError):
+            load_segments([{"start": 0}])
+
+    def test_one_result_per_segment(self):
+        """diarize_speechbrain should return segments aligned with the input."""
+        import os
+        import tempfile
+        import soundfile
+        from diarize import diarize_speechbrain
+
+        path = os.path.join(tempfile.mkdtemp(), "speech.wav")
+        soundfile.write(path, speech_like(8), 16000, subtype="PCM_16")
+        model = small_ecapa()
+        transcript = [(0.2, 2.9), (3.1, 3.6), (4.0, 7.8)]
+
+        segments = diarize_speechbrain(path, "cpu", num_speakers=2, load_model=lambda: model,
+                                       segments=transcript)
+
+        self.assertEqual([(s["start"], s["end"]) for s in segments], transcript)
+        self.assertTrue(all(s["speaker"].startswith("SPEAKER_") for s in segments))
+
+
+class TestParallelEmbedding(unittest.TestCase):
+    """Tests for --workers sharding of the embedding stage."""
+
+    def test_workers_match_single_process(self):
+        """Sharded embedding should reproduce the single-process result exactly."""
+        import os
+        import tempfile
+        import numpy as np
+        import soundfile
+        import torch
+        from diarize import (count_windows, embed_parallel, embed_window_spans,
+                             iter_window_spans, open_audio)
+
+        path = os.path.join(tempfile.mkdtemp(), "speech.wav")
+        soundfile.write(path, speech_like(20), 16000, subtype="PCM_16")
+        model, features = small_ecapa()
+        read_blocks, total_samples = open_audio(path)
+        total = count_windows(total_samples, 24000, 12000)
+        keep = np.ones(total, dtype=bool)
+        keep[5:9] = False
+
+        for feature_cache in (True, False):
+            spans = iter_window_spans(read_blocks(), 24000, 12000, 4)
+            expected, expected_ts = embed_window_spans(
+                model, features, spans, torch.device("cpu"), 24000, 12000, 16000, total,
+                feature_cache=feature_cache, keep=keep
+            )
+            sharded, sharded_ts = embed_parallel(
+                path, read_blocks, model, features, torch.device("cpu"), 24000, 12000, 16000,
+                total, workers=2, threads=1, batch_size=4, feature_cache=feature_cache, keep=keep
+            )
+            np.testing.assert_array_equal(sharded, expected)
+            np.testing.assert_array_equal(sharded_ts, expected_ts)
+
+    def test_threads_reach_shard_workers(self):
+        """--threads should set the torch threads of every shard worker."""
+        import os
+        import tempfile
+        import concurrent.futures
+        import soundfile
+        import diarize
+
+        path = os.path.join(tempfile.mkdtemp(), "speech.wav")
+        soundfile.write(path, speech_like(20), 16000, subtype="PCM_16")
+        pool = MagicMock(wraps=concurrent.futures.ProcessPoolExecutor)
+
+        with patch.object(diarize, "load_speechbrain_model", return_value=small_ecapa()), \
+                patch("concurrent.futures.ProcessPoolExecutor", pool):
+            result = diarize.diarize_file(
+                path, backend="speechbrain", device_name="cpu", num_speakers=2, batch_size=4,
+                workers=2, threads=3, vad=False
+            )
+
+        self.assertIsInstance(result, list)
+        self.assertEqual(pool.call_args.kwargs["initializer"], diarize._init_shard_worker)
+        self.assertEqual(pool.call_args.kwargs["initargs"][2], 3)
+
+    def test_batch_workers_do_not_fork(self):
+        """--batch --workers 2 should not fork beside the prefetch thread, and match one process."""
+        import io
+        import json
+        import os
+        import tempfile
+        import multiprocessing
+        import soundfile
+        import diarize
+
+        path = os.path.join(tempfile.mkdtemp(), "speech.wav")
+        soundfile.write(path, speech_like(20), 16000, subtype="PCM_16")
+        entries = [{"audio_file": path}, {"audio_file": path}]
+        defaults = {"backend": "speechbrain", "device": "cpu", "num_speakers": 2, "batch_size": 4,
+                    "vad": False, "embedding_cache": False}
+        get_context = MagicMock(wraps=multiprocessing.get_context)
+
+        with patch.object(diarize, "load_speechbrain_model", return_value=small_ecapa()):
+            expected = diarize.diarize_file(
+                path, backend="speechbrain", device_name="cpu", num_speakers=2, batch_size=4,
+                vad=False
+            )
+            out = io.StringIO()
+            with patch("multiprocessing.get_context", get_context):
+                summary = diarize.run_batch(entries, diarize.DiarizationWorker(),
+                                            dict(defaults, workers=2), out)
+
+        self.assertEqual(summary["failed"], 0)
+        methods = {call.args[0] for call in get_context.call_args_list}
+        self.assertTrue(methods)
+        self.assertNotIn("fork", methods)
+        lines = [json.loads(line) for line in out.getvalue().splitlines()[:2]]
+        self.assertEqual([line["segments"] for line in lines], [expected, expected])
+
+    def test_read_blocks_range(self):
+        """Readers should serve any sample range, as shard workers need."""
+        import os
+        import tempfile
+        import numpy as np
+        import soundfile
+        import torch
+        from diarize import open_audio
+
+        path = os.path.join(tempfile.mkdtemp(), "ramp.wav")
+        samples = (np.sin(np.arange(50000) / 40.0) * 0.5).astype(np.float32)
+        soundfile.write(path, samples, 16000, subtype="PCM_16")
+        # Canonical WAV is memory-mapped; without that path soundfile streams it
+        read_mapped, _ = open_audio(path, block_samples=7000)
+        with patch("diarize.map_pcm16_wav", return_value=None):
+            read_streamed, _ = open_audio(path, block_samples=7000)
+
+        full = torch.cat(list(read_mapped()))
+        for read_blocks in (read_mapped, read_streamed):
+            torch.testing.assert_close(torch.cat(list(read_blocks(12345, 40000))), full[12345:40000])
+            torch.testing.assert_close(torch.cat(list(read_blocks(45000))), full[45000:])
+
+
+class TestBatchMode(unittest.TestCase):
+    """Tests for --batch manifest processing."""
+
+    def test_manifest_lines(self):
+        """Paths, objects, comments and bad lines should all be handled."""
+        import os
+        import tempfile
+        from diarize import read_manifest
+
+        path = os.path.join(tempfile.mkdtemp(), "manifest.jsonl")
+        with open(path, "w") as f:
+            f.write('"/a.wav"\n# comment\n\n{"audio_file": "/b.wav", "num_speakers": 2}\nnot json\n[1]\n')
+
+        entries = read_manifest(path)
+        self.assertEqual(entries[:2], [{"audio_file": "/a.wav"}, {"audio_file": "/b.wav", "num_speakers": 2}])
+        self.assertIn("line 5", entries[2]["error"])
+        self.assertIn("line 6", entries[3]["error"])
+
+    def test_batch_loads_model_once(self):
+        """Every entry gets one result line in order, then a summary line."""
+        import io
+        import json
+        import os
+        import tempfile
+        import soundfile
+        import diarize
+
+        tmp_dir = tempfile.mkdtemp()
+        paths = []
+        for index in range(2):
+            path = os.path.join(tmp_dir, f"speech{index}.wav")
+            soundfile.write(path, speech_like(6, seed=index), 16000, subtype="PCM_16")
+            paths.append(path)
+        output = os.path.join(tmp_dir, "out.json")
+        entries = [
+            {"audio_file": paths[0]},
+            {"audio_file": os.path.join(tmp_dir, "missing.wav")},
+            {"audio_file": paths[1], "output": output},
+        ]
+        model = small_ecapa()
+
+        out = io.StringIO()
+        with patch.object(diarize, "load_speechbrain_model", return_value=model) as mock_load:
+            summary = diarize.run_batch(entries, diarize.DiarizationWorker(), {
+                "backend": "speechbrain", "device": "cpu", "num_speakers": 2,
+            }, out=out)
+
+        lines = [json.loads(line) for line in out.getvalue().splitlines()]
+        mock_load.assert_called_once()
+        self.assertEqual([line.get("audio_file") for line in lines[:3]], [e["audio_file"] for e in entries])
+        self.assertTrue(lines[0]["segments"])
+        self.assertIn("embedding", lines[0]["timings"])
+        self.assertIn("not found", lines[1]["error"])
+        self.assertEqual(lines[2]["output"], output)
+        with open(output) as f:
+            self.assertTrue(json.load(f))
+        self.assertEqual(lines[3], {"summary": summary})
+        self.assertEqual((summary["files"], summary["failed"]), (3, 1))
+        self.assertGreater(summary["files_per_hour"], 0)
+
+
+class TestProfiling(unittest.TestCase):
+    """Tests for per-stage timing instrumentation."""
+
+    def test_stage_accumulates_and_nests(self):
+        """Stages should sum repeated entries and record nested stages separately."""
+        import time
+        from diarize import stage, merge_timings
+
+        timings = {}
+        for _ in range(2):
+            with stage(timings, "outer"):
+                with stage(timings, "inner"):
+                    time.sleep(0.01)
+        with stage(None, "ignored"):
+            pass
+
+        self.assertEqual(list(timings), ["inner", "outer"])
+        self.assertGreaterEqual(timings["inner"]["wall_sec"], 0.02)
+        self.assertGreaterEqual(timings["outer"]["wall_sec"], timings["inner"]["wall_sec"])
+        self.assertGreater(timings["outer"]["peak_rss_mb"], 0)
+
+        merged = merge_timings({"inner": dict(timings["inner"])}, timings)
+        self.assertAlmostEqual(merged["inner"]["wall_sec"], 2 * timings["inner"]["wall_sec"])
+        self.assertIn("outer", merged)
+
+    def test_worker_returns_timings_on_request(self):
+        """A request with "timings": true should get segments and per-stage timings."""
+        import os
+        import tempfile
+        import soundfile
+        import diarize
+
+        path = os.path.join(tempfile.mkdtemp(), "speech.wav")
+        soundfile.write(path, speech_like(6), 16000, subtype="PCM_16")
+        request = {"audio_file": path, "backend": "speechbrain", "device": "cpu",
+                   "num_speakers": 2, "embedding_cache": False}
+
+        with patch.object(diarize, "load_speechbrain_model", return_value=small_ecapa()):
+            worker = diarize.DiarizationWorker()
+            plain = worker.handle(request)
+            timed = worker.handle(dict(request, timings=True))
+
+        self.assertIsInstance(plain, list)
+        self.assertEqual(timed["segments"], plain)
+        for name in ("open", "vad", "extract", "features", "embedding", "cluster", "merge"):
+            self.assertEqual(set(timed["timings"][name]), {"wall_sec", "cpu_sec", "peak_rss_mb"})
+
+
+class TestJsonLinesOutput(unittest.TestCase):
+    """Tests for --format jsonl output."""
+
+    def test_result_records(self):
+        """Segments come one per line, then stats and a done record."""
+        import io
+        import json
+        from diarize import write_jsonl_result
+
+        out = io.StringIO()
+        segments = [{"start": 0.0, "end": 1.5, "speaker": "SPEAKER_00"},
+                    {"start": 1.5, "end": 3.0, "speaker": "SPEAKER_01"}]
+        timings = {"merge": {"wall_sec": 0.001, "cpu_sec": 0.001, "peak_rss_mb": 100.0}}
+        write_jsonl_result(segments, timings, 2.5, out)
+
+        records = [json.loads(line) for line in out.getvalue().splitlines()]
+        self.assertEqual(records[:2], segments)
+        self.assertEqual(records[2]["event"], "stats")
+        self.assertEqual(records[2]["wall_sec"], 2.5)
+        self.assertIn("merge", records[2]["timings"])
+        self.assertEqual(records[3], {"event": "done", "segments": 2})
+
+    def test_error_is_single_line(self):
+        """An error result should be written as one error record."""
+        import io
+        import json
+        from diarize import write_jsonl_result
+
+        out = io.StringIO()
+        write_jsonl_result({"error": "File not found: x.wav"}, out=out)
+        self.assertEqual([json.loads(line) for line in out.getvalue().splitlines()],
+                         [{"error": "File not found: x.wav"}])
+
+    def test_progress_reaches_total(self):
+        """Embedding should report progress per batch, ending at done == total."""
+        import torch
+        from diarize import embed_window_spans, iter_window_spans
+
+        model, compute_features = small_ecapa()
+        waveform = torch.from_numpy(speech_like(30))
+        calls = []
+        spans = iter_window_spans([waveform], 24000, 12000, 8)
+        embed_window_spans(model, compute_features, spans, "cpu", 24000, 12000, 16000, 39,
+                           progress=lambda *args: calls.append(args))
+
+        self.assertEqual([done for _, done, _, _ in calls], [8, 16, 24, 32, 39])
+        self.assertEqual(calls[-1], ("extract", 39, 39, 30.0))
+
+
+class TestProgress(unittest.TestCase):
+    """Tests for throttled, machine-readable progress reporting."""
+
+    def records(self, out):
+        import json
+        return [json.loads(line) for line in out.getvalue().splitlines()]
+
+    def test_updates_throttled_but_stage_end_kept(self):
+        """Updates inside the interval should be dropped except the one completing the stage."""
+        import io
+        from diarize import Progress
+
+        out = io.StringIO()
+        progress = Progress(records=out, console=False, interval=60, fields={"file": 1})
+        progress("vad")
+        for done in range(1, 101):
+            progress("extract", done, 100, done * 1.5)
+
+        records = self.records(out)
+        self.assertEqual([r["event"] for r in records], ["stage", "stage", "progress", "progress"])
+        self.assertEqual([r["stage"] for r in records[:2]], ["vad", "extract"])
+        first, last = records[2:]
+        self.assertEqual(first["done"], 1)
+        self.assertEqual((last["done"], last["total"], last["percent"]), (100, 100, 100.0))
+        self.assertEqual(last["audio_sec"], 150.0)
+        self.assertEqual(last["eta_sec"], 0.0)
+        self.assertGreater(last["audio_sec_per_sec"], 0)
+        self.assertTrue(all(r["file"] == 1 for r in records))
+
+    def test_console_summary_when_redirected(self):
+        """Without a terminal, stderr should get one summary line per finished stage."""
+        import io
+        from diarize import Progress
+
+        err = io.StringIO()
+        progress = Progress(interval=0)
+        with patch("sys.stderr", err):
+            for done in range(1, 5):
+                progress("extract", done, 4, done * 0.75)
+
+        self.assertEqual(err.getvalue().count("\n"), 1)
+        self.assertIn("Extracting embeddings: 4 windows", err.getvalue())
+        self.assertIn("x realtime", err.getvalue())
+
+    def test_batch_progress_records(self):
+        """run_batch should tag progress with the entry and report a batch ETA per file."""
+        import io
+        import os
+        import tempfile
+        import soundfile
+        import diarize
+
+        path = os.path.join(tempfile.mkdtemp(), "speech.wav")
+        soundfile.write(path, speech_like(6), 16000, subtype="PCM_16")
+        entries = [{"audio_file": path}, {"audio_file": path}]
+        defaults = {"backend": "speechbrain", "device": "cpu", "num_speakers": 2, "embedding_cache": False}
+
+        out, progress_out = io.StringIO(), io.StringIO()
+        with patch.object(diarize, "load_speechbrain_model", return_value=small_ecapa()):
+            summary = diarize.run_batch(entries, diarize.DiarizationWorker(), defaults, out, progress_out)
+
+        self.assertEqual(summary["failed"], 0)
+        records = self.records(progress_out)
+        files = [r for r in records if r["event"] == "file"]
+        self.assertEqual([(r["file"], r["files"]) for r in files], [(1, 2), (2, 2)])
+        self.assertEqual(files[-1]["eta_sec"], 0.0)
+        updates = [r for r in records if r["event"] == "progress"]
+        self.assertEqual({r["file"] for r in updates}, {1, 2})
+        self.assertTrue(all(r["audio_file"] == path for r in updates))
+
+
+class TestPrecision(unittest.TestCase):
+    """Tests for --precision reduced-precision ECAPA inference."""
+
+    def embed(self, model, compute_features):
+        import torch
+
+        audio = torch.from_numpy(speech_like(4)).reshape(4, -1)
+        with torch.no_grad():
+            return model(compute_features(audio)).squeeze(1)
+
+    def test_reduced_precision_tracks_fp32(self):
+        """bf16 and int8 embeddings should stay close to fp32 and leave fp32 untouched."""
+        import torch
+        from diarize import PointwiseInt8, apply_precision
+
+        model, compute_features = small_ecapa()
+        reference = self.embed(model, compute_features)
+        self.assertIs(apply_precision(model, "fp32", "cpu"), model)
+
+        for precision in ("bf16", "int8"):
+            variant = apply_precision(model, precision, "cpu")
+            embeddings = self.embed(variant, compute_features)
+            self.assertEqual(embeddings.dtype, torch.float32)
+            cosine = torch.nn.functional.cosine_similarity(embeddings, reference)
+            self.assertGreater(cosine.min().item(), 0.99, precision)
+
+        quantized = apply_precision(model, "int8", "cpu")
+        self.assertTrue(any(isinstance(m, PointwiseInt8) for m in quantized.modules()))
+        torch.testing.assert_close(self.embed(model, compute_features), reference)
+
+    def test_variants_are_modules(self):
+        """Precision variants should be nn.Modules whose state_dict holds every weight."""
+        import pickle
+        import torch
+        from diarize import Bf16Autocast, PointwiseInt8, apply_precision
+
+        model, _ = small_ecapa()
+        pointwise = [name for name, m in model.named_modules()
+                     if isinstance(m, torch.nn.Conv1d) and m.kernel_size == (1,)]
+
+        bf16 = apply_precision(model, "bf16", "cpu")
+        self.assertIsInstance(bf16, Bf16Autocast)
+        self.assertEqual(set(bf16.state_dict()), {f"model.{name}" for name in model.state_dict()})
+
+        quantized = apply_precision(model, "int8", "cpu")
+        self.assertEqual({name for name, m in quantized.named_modules() if isinstance(m, PointwiseInt8)},
+                         set(pointwise))
+        packed = [name for name in quantized.state_dict() if name.endswith("_packed_params._packed_params")]
+        self.assertEqual(len(packed), len(pointwise))
+        quantized.train()
+        self.assertTrue(all(m.training for m in quantized.modules()))
+        self.assertIs(pickle.loads(pickle.dumps(Bf16Autocast)), Bf16Autocast)
+
+    def test_invalid_precision_rejected(self):
+        """Unknown precisions and int8 off CPU should raise ValueError."""
+        from diarize import apply_precision
+
+        model, _ = small_ecapa()
+        with self.assertRaises(ValueError):
+            apply_precision(model, "fp8", "cpu")
+        with self.assertRaises(ValueError):
+            apply_precision(model, "int8", "mps")
+
+    def test_worker_keeps_precision_variants(self):
+        """The worker should quantize once and keep the fp32 model alongside."""
+        import os
+        import tempfile
+        import soundfile
+        import diarize
+
+        path = os.path.join(tempfile.mkdtemp(), "speech.wav")
+        soundfile.write(path, speech_like(6), 16000, subtype="PCM_16")
+        request = {"audio_file": path, "backend": "speechbrain", "device": "cpu",
+                   "num_speakers": 2, "embedding_cache": False, "precision": "int8"}
+
+        worker = diarize.DiarizationWorker()
+        with patch.object(diarize, "load_speechbrain_model", return_value=small_ecapa()) as mock_load:
+            self.assertIsInstance(worker.handle(request), list)
+            self.assertIsInstance(worker.handle(request), list)
+            bad = worker.handle(dict(request, precision="fp8"))
+
+        mock_load.assert_called_once()
+        self.assertIn("Unknown precision", bad["error"])
+        self.assertEqual(worker.handle({"command": "ping"})["models"],
+                         ["speechbrain:cpu", "speechbrain:cpu:int8"])
+
+
+class TestCompile(unittest.TestCase):
+    """Tests for --compile ahead-of-time compiled embedding batches."""
+
+    def test_compiled_package_cached_and_matches_eager(self):
+        """A compiled model should match eager, pad partial batches and reload from disk."""
+        import os
+        import tempfile
+        import torch
+        from diarize import CompiledModel
+
+        model, _ = small_ecapa()
+        compile_dir = tempfile.mkdtemp()
+        feats = torch.randn(4, 151, 80)
+
+        compiled = CompiledModel(model, 4, compile_dir)
+        with torch.no_grad():
+            torch.testing.assert_close(compiled(feats), model(feats))
+            torch.testing.assert_close(compiled(feats[:3]), model(feats[:3]))
+            torch.testing.assert_close(compiled(feats[:1]), model(feats[:1]))
+        self.assertIsNotNone(compiled.compiled)
+        self.assertEqual([name.endswith(".pt2") for name in os.listdir(compile_dir)], [True])
+
+        with patch("torch._inductor.aoti_compile_and_package") as mock_compile:
+            reloaded = CompiledModel(model, 4, compile_dir)
+            with torch.no_grad():
+                torch.testing.assert_close(reloaded(feats), model(feats))
+        mock_compile.assert_not_called()
+        self.assertIsNotNone(reloaded.compiled)
+
+    def test_falls_back_to_eager(self):
+        """A model that cannot be exported should keep running eagerly."""
+        import tempfile
+        import torch
+        from diarize import CompiledModel
+
+        model, _ = small_ecapa()
+        compile_dir = tempfile.mkdtemp()
+        feats = torch.randn(2, 151, 80)
+
+        compiled = CompiledModel(model, 2, compile_dir)
+        with patch("torch.export.export", side_effect=RuntimeError("unsupported op")):
+            with torch.no_grad():
+                torch.testing.assert_close(compiled(feats), model(feats))
+        self.assertTrue(compiled.failed)
+        self.assertIsNone(compiled.compiled)
+
+    def test_worker_keeps_compiled_variant(self):
+        """The worker should wrap the model once per batch size, and not with --workers."""
+        import os
+        import tempfile
+        import soundfile
+        import diarize
+
+        path = os.path.join(tempfile.mkdtemp(), "speech.wav")
+        soundfile.write(path, speech_like(6), 16000, subtype="PCM_16")
+        request = {"audio_file": path, "backend": "speechbrain", "device": "cpu",
+                   "num_speakers": 2, "embedding_cache": False, "compile": True}
+
+        worker = diarize.DiarizationWorker()
+        with patch.object(diarize, "load_speechbrain_model", return_value=small_ecapa()):
+            # Fewer windows than one batch, so nothing is actually compiled
+            self.assertIsInstance(worker.handle(request), list)
+            self.assertIsInstance(worker.handle(dict(request, workers=2)), list)
+
+        self.assertEqual(worker.handle({"command": "ping"})["models"],
+                         ["speechbrain:cpu", "speechbrain:cpu:compiled-b32"])
+        self.assertIsInstance(worker.models[("speechbrain", "cpu", "compiled-b32")][0], diarize.CompiledModel)
+
+    def test_compile_with_reduced_precision(self):
+        """bf16 should be wrapped for compiling, int8 left eager; packages differ by precision."""
+        import os
+        import tempfile
+        import torch
+        import soundfile
+        import diarize
+
+        model, _ = small_ecapa()
+        feats = torch.zeros(4, 151, 80)
+        paths = {diarize.CompiledModel(diarize.apply_precision(model, precision, "cpu"), 4).package_path(feats)
+                 for precision in diarize.PRECISIONS}
+        self.assertEqual(len(paths), len(diarize.PRECISIONS))
+        # Quantized weights are part of the hash
+        other, _ = small_ecapa()
+        pointwise = next(m for m in other.modules() if isinstance(m, torch.nn.Conv1d) and m.kernel_size == (1,))
+        with torch.no_grad():
+            pointwise.weight.mul_(2.0)
+        self.assertNotEqual(diarize.model_hash(diarize.apply_precision(model, "int8", "cpu")),
+                            diarize.model_hash(diarize.apply_precision(other, "int8", "cpu")))
+
+        path = os.path.join(tempfile.mkdtemp(), "speech.wav")
+        soundfile.write(path, speech_like(6), 16000, subtype="PCM_16")
+        request = {"audio_file": path, "backend": "speechbrain", "device": "cpu",
+                   "num_speakers": 2, "embedding_cache": False, "compile": True}
+        worker = diarize.DiarizationWorker()
+        with patch.object(diarize, "load_speechbrain_model", return_value=small_ecapa()):
+            self.assertIsInstance(worker.handle(dict(request, precision="bf16")), list)
+            self.assertIsInstance(worker.handle(dict(request, precision="int8")), list)
+
+        self.assertEqual(worker.handle({"command": "ping"})["models"],
+                         ["speechbrain:cpu", "speechbrain:cpu:bf16", "speechbrain:cpu:bf16:compiled-b32",
+                          "speechbrain:cpu:int8"])
+        compiled = worker.models[("speechbrain", "cpu", "bf16", "compiled-b32")][0]
+        self.assertIsInstance(compiled.model, diarize.Bf16Autocast)
+
+    def test_package_keyed_by_weights_and_shape(self):
+        """Different weights or batch shapes should compile to different packages."""
+        import torch
+        from diarize import CompiledModel
+
+        model, _ = small_ecapa()
+        other, _ = small_ecapa()
+        with torch.no_grad():
+            next(other.parameters()).add_(1.0)
+        feats = torch.zeros(4, 151, 80)
+
+        path = CompiledModel(model, 4).package_path(feats)
+        self.assertEqual(CompiledModel(model, 4).package_path(feats), path)
+        self.assertNotEqual(CompiledModel(other, 4).package_path(feats), path)
+        self.assertNotEqual(CompiledModel(model, 2).package_path(feats[:2]), path)
+
+
+class TestStreaming(unittest.TestCase):
+    """Tests for --stream online diarization."""
+
+    def test_cli_errors_are_json(self):
+        """Open failures should read as stream errors, and model failures as themselves."""
+        import io
+        import json
+        import os
+        import tempfile
+        import diarize
+
+        path = os.path.join(tempfile.mkdtemp(), "audio.pcm")
+        with open(path, "wb") as f:
+            f.write((speech_like(2) * 32767).astype("<i2").tobytes())
+
+        def run(source, **patches):
+            out = io.StringIO()
+            with patch("sys.argv", ["diarize.py", "--stream", source, "--device", "cpu"]), \
+                    patch("sys.stdout", out), patch("sys.stderr", io.StringIO()), \
+                    patch.object(diarize, "load_speechbrain_model", **patches):
+                with self.assertRaises(SystemExit) as raised:
+                    diarize.main()
+            self.assertEqual(raised.exception.code, 1)
+            return json.loads(out.getvalue().splitlines()[-1])
+
+        missing = run(path + ".missing", return_value=small_ecapa())
+        self.assertTrue(missing["error"].startswith("Could not read stream"))
+        failed = run(path, side_effect=RuntimeError("model unavailable offline"))
+        self.assertEqual(failed, {"error": "model unavailable offline"})
+
+    def test_online_clusterer_separates_speakers(self):
+        """Alternating well-separated speakers should get consistent ids."""
+        from sklearn.metrics import adjusted_rand_score
+        from diarize import OnlineClusterer
+
+        embeddings, truth = separated_embeddings(600, 3, seed=1)
+        clusterer = OnlineClusterer()
+        labels = [clusterer.assign(e)[0] for e in embeddings]
+
+        self.assertEqual(len(clusterer.centroids), 3)
+        self.assertAlmostEqual(adjusted_rand_score(truth, labels), 1.0)
+
+    def test_online_clusterer_merges_converging_speakers(self):
+        """Speakers started too eagerly should merge back, and merged ids never reappear."""
+        from diarize import OnlineClusterer
+
+        embeddings, _ = separated_embeddings(400, 1, seed=2)
+        clusterer = OnlineClusterer(new_speaker=0.999, merge=0.8)
+        absorbed, returned = set(), set()
+        for embedding in embeddings:
+            speaker, events = clusterer.assign(embedding)
+            returned.add(speaker)
+            absorbed.update(old for kind, old, _ in events if kind == "merge")
+            self.assertNotIn(speaker, absorbed)
+
+        self.assertEqual(len(clusterer.centroids), 1)
+        self.assertTrue(absorbed)
+
+    def test_online_clusterer_splits_mixed_speaker(self):
+        """A speaker holding two distinct voices should split in two."""
+        from sklearn.metrics import adjusted_rand_score
+        from diarize import OnlineClusterer
+
+        embeddings, truth = separated_embeddings(600, 2, seed=3)
+        # Never start a speaker directly, so both voices land in the first one
+        clusterer = OnlineClusterer(new_speaker=-1.0)
+        labels, events = [], []
+        for embedding in embeddings:
+            speaker, new_events = clusterer.assign(embedding)
+            labels.append(speaker)
+            events.extend(new_events)
+
+        self.assertEqual([kind for kind, _, _ in events], ["split"])
+        self.assertAlmostEqual(adjusted_rand_score(truth[300:], labels[300:]), 1.0)
+
+    def stream(self, audio, repeats=1, records=None):
+        """Run diarize_stream over audio played repeats times.
+
+        Returns the lag of each turn line behind the input read so far, in
+        seconds; turn and event records are appended to records if given.
+        """
+        import json
+        import diarize
+
+        class Source:
+            # Replays one buffer, so the input itself takes constant memory
+            def __init__(self, data, total):
+                self.data = data
+                self.total = total
+                self.position = 0
+
+            def read1(self, size):
+                size = min(size, self.total - self.position)
+                offset = self.position % len(self.data)
+                chunk = self.data[offset:offset + size]
+                self.position += len(chunk)
+                return chunk
+
+        data = (audio * 32767).astype("<i2").tobytes()
+        source = Source(data, len(data) * repeats)
+        lags = []
+
+        class Output:
+            def write(self, line):
+                record = json.loads(line)
+                if "end" in record:
+                    lags.append(source.position / 32000 - record["end"])
+                if records is not None:
+                    records.append(record)
+
+            def flush(self):
+                pass
+
+        model = small_ecapa()
+        diarize.diarize_stream(source, "cpu", lambda: model, out=Output())
+        return lags
+
+    def test_stream_turns_trail_audio_by_under_two_seconds(self):
+        """Turns should be ordered, skip silence, and be written within 2s of the audio."""
+        import numpy as np
+
+        silence = np.zeros(5 * 16000, dtype=np.float32)
+        audio = np.concatenate((silence, speech_like(20), silence, speech_like(20, seed=1)))
+        records = []
+        lags = self.stream(audio, records=records)
+
+        turns = [r for r in records if "end" in r]
+        self.assertTrue(turns)
+        self.assertLess(max(lags), 2.0)
+        for before, after in zip(turns, turns[1:]):
+            self.assertLessEqual(before["end"], after["start"] + 1e-6)
+        self.assertFalse([t for t in turns if 26.0 <= t["start"] and t["end"] <= 29.0])
+
+    def test_stream_memory_is_constant(self):
+        """Peak traced memory should not grow with the length of the stream."""
+        import tracemalloc
+
+        audio = speech_like(20)
+        # Warm up first so one-off import and allocator costs are not counted
+        self.stream(audio)
+        peaks = []
+        for repeats in (3, 12):
+            tracemalloc.start()
+            lags = self.stream(audio, repeats)
+            peaks.append(tracemalloc.get_traced_memory()[1])
+            tracemalloc.stop()
+            self.assertGreater(len(lags), repeats * 10)
+
+        self.assertLess(peaks[1], peaks[0] * 1.2)
+
+
+class TestFrameWindows(unittest.TestCase):
+    """Tests for the strided sliding-window view."""
+
+    def test_windows_are_views_over_waveform(self):
+        """Every window should share storage with the waveform."""
+        import torch
+        from diarize import frame_windows
+
+        waveform = torch.arange(10, dtype=torch.float32)
+        windows = frame_windows(waveform, 4, 2)
+
+        self.assertEqual(tuple(windows.shape), (4, 4))
+        self.assertEqual(windows.data_ptr(), waveform.data_ptr())
+        self.assertEqual(windows[1].tolist(), [2.0, 3.0, 4.0, 5.0])
+        self.assertEqual(windows[-1].tolist(), [6.0, 7.0, 8.0, 9.0])
+
+    def test_short_waveform_has_no_windows(self):
+        """A waveform shorter than one window should yield zero windows."""
+        import torch
+        from diarize import frame_windows
+
+        windows = frame_windows(torch.zeros(3), 4, 2)
+        self.assertEqual(tuple(windows.shape), (0, 4))
+
+
+class TestExtractEmbeddings(unittest.TestCase):
+    """Tests for batched sliding-window embedding extraction."""
+
+    def setUp(self):
+        import torch
+        self.model, self.features = small_ecapa()
+        self.device = torch.device("cpu")
+        generator = torch.Generator().manual_seed(1)
+        # 6 seconds of 16kHz audio -> 7 windows of 1.5s with 0.75s hop
+        self.waveform = torch.randn(96000, generator=generator) * 0.1
+
+    def extract(self, waveform, batch_size, feature_cache=False):
+        from diarize import count_windows, embed_window_spans, iter_window_spans
+        spans = iter_window_spans([waveform], 24000, 12000, batch_size)
+        return embed_window_spans(
+            self.model, self.features, spans, self.device, 24000, 12000, 16000,
+            count_windows(waveform.shape[0], 24000, 12000), feature_cache=feature_cache
+        )
+
+    def test_batched_matches_per_window(self):
+        """Batched extraction should match one-window-per-pass extraction."""
+        import numpy as np
+
+        single, single_ts = self.extract(self.waveform, batch_size=1)
+        batched, batched_ts = self.extract(self.waveform, batch_size=4)
+
+        self.assertEqual(single.shape, (7, 24))
+        np.testing.assert_array_equal(single_ts, batched_ts)
+        np.testing.assert_allclose(batched, single, rtol=1e-4, atol=1e-5)
+
+    def test_feature_cache_matches_per_window(self):
+        """Cached filterbank features should give near-identical embeddings."""
+        import numpy as np
+
+        reference, _ = self.extract(self.waveform, batch_size=4, feature_cache=False)
+        cached, _ = self.extract(self.waveform, batch_size=4, feature_cache=True)
+
+        cosine = (reference * cached).sum(axis=1) / (
+            np.linalg.norm(reference, axis=1) * np.linalg.norm(cached, axis=1)
+        )
+        self.assertGreater(cosine.min(), 0.999)
+
+    def test_cached_features_match_interior_frames(self):
+        """Only frames touching a window edge may differ from per-window Fbank."""
+        import torch
+        from diarize import cached_window_features, frame_windows
+
+        windows = frame_windows(self.waveform, 24000, 12000)
+        reference = self.features(windows[2:5])
+        cached = cached_window_features(
+            self.features, self.waveform, 2, 3, 24000, 12000, self.device
+        )
+
+        self.assertEqual(cached.shape, reference.shape)
+        torch.testing.assert_close(cached[:, 3:-3], reference[:, 3:-3], rtol=1e-4, atol=1e-3)
+
+    def test_timestamps_follow_hop(self):
+        """Window timestamps should advance by the hop and span the window."""
+        _, timestamps = self.extract(self.waveform, batch_size=32)
+
+        self.assertEqual(tuple(timestamps[0]), (0.0, 1.5))
+        self.assertEqual(tuple(timestamps[1]), (0.75, 2.25))
+        self.assertEqual(tuple(timestamps[-1]), (4.5, 6.0))
+
+    def test_audio_shorter_than_window_returns_empty(self):
+        """Audio shorter than one window should produce no embeddings."""
+        embeddings, timestamps = self.extract(self.waveform[:1000], batch_size=8)
+
+        self.assertEqual(len(embeddings), 0)
+        self.assertEqual(timestamps.shape, (0, 2))
+
+
 if __name__ == '__main__':
     # Add scripts directory to path so we can import diarize
     import os